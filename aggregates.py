@@ -0,0 +1,55 @@
+# Server-side totals (SUM / GROUP BY) for the Dashboard and Client Invoice,
+# and the distinct billing weeks for Weekly Bill's week picker.
+#
+# The queries themselves live in the database as RPC functions — see
+# sql/aggregates.sql for Supabase and local_backend.py for the SQLite copy
+# used offline — so a page receives one row per site (or per site and
+# category) however wide its date range is. These wrappers only build the
+# call and shape the reply into a typed DataFrame. Like helpers.py, nothing
+# here may touch Streamlit; pass in the client.
+import pandas as pd
+
+LABOUR_TOTALS_COLUMNS = ["site", "entries", "count_mason", "count_helper", "count_ladies", "total_cost"]
+MATERIAL_TOTALS_COLUMNS = ["site", "category", "amount"]
+
+
+def _params(start, end, site):
+    return {"p_start": str(start), "p_end": str(end), "p_site": site}
+
+
+def totals_frame(data, columns):
+    """RPC rows → DataFrame with `columns`; numeric columns come back as
+    floats (PostgREST sends Postgres numerics as JSON numbers or strings)."""
+    df = pd.DataFrame(data or [], columns=columns)
+    for col in columns:
+        if col not in ("site", "category"):
+            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype("int64" if col == "entries" else "float64")
+    return df
+
+
+def labour_totals(client, start, end, site=None):
+    """Entries between start and end (inclusive), optionally for one site:
+    one row per site with the entry count, shift totals and total_cost."""
+    res = client.rpc("labour_totals", _params(start, end, site)).execute()
+    return totals_frame(res.data, LABOUR_TOTALS_COLUMNS)
+
+
+def material_totals(client, start, end, site=None):
+    """Material spend between start and end (inclusive), optionally for one
+    site: one row per (site, category) with the summed amount."""
+    res = client.rpc("material_totals", _params(start, end, site)).execute()
+    return totals_frame(res.data, MATERIAL_TOTALS_COLUMNS)
+
+
+def entry_weeks(client, sites=None):
+    """Saturdays (as datetime64) starting each billing week that has entries,
+    optionally only at `sites`: one row per week, not per entry."""
+    res = client.rpc("entry_weeks", {"p_sites": None if sites is None else list(sites)}).execute()
+    return pd.to_datetime(pd.Series([r["week_start"] for r in res.data or []], dtype=object)).to_numpy()
+
+
+def is_missing_function(exc):
+    """True when the RPC failed because sql/aggregates.sql hasn't been run
+    (PostgREST answers PGRST202 for an unknown function)."""
+    text = str(exc)
+    return "PGRST202" in text or "Could not find the function" in text
@@ -1,13 +1,34 @@
 import streamlit as st
 import pandas as pd
 import json
+import os
 import uuid
 import time
 from datetime import datetime, date, timedelta
 from supabase import create_client
-from fpdf import FPDF
 import extra_streamlit_components as stx
 import io
+import hashlib
+import threading
+from collections import OrderedDict
+import aggregates
+import bulk_import
+import day_sheet
+import exports
+import images
+import jobs
+import labour_report
+import local_backend
+import perf
+import write_queue
+from billing_calendar import week_keys, week_options, week_start
+from helpers import (
+    generate_pdf_bytes, generate_material_pdf_bytes,
+    generate_client_invoice_bytes, _safe_get_rates, _build_week_rows,
+    _prepare_search_columns, _search_mask,
+    ENTRY_CORE_COLUMNS, ENTRY_DETAIL_COLUMNS, compact_entries, with_entry_details,
+    PENDING_UPLOAD_PREFIX, is_pending_upload, evidence_badge, evidence_path, thumbnail_path,
+)
 
 # --- 1. CONFIGURATION & SECRETS ---
 st.set_page_config(
@@ -29,14 +50,25 @@ except Exception:
     ADMIN_DELETE_CODE = "9512"
     ADMIN_LOGIN_PASS = "admin123"
 
+# Upload image profiles (images.py). Optional [images] section in secrets.toml
+# overrides single fields, e.g. photo_max_side = 1280 or receipt_format = "WEBP".
+try:
+    IMAGE_PROFILES = images.profiles(dict(st.secrets["images"]) if "images" in st.secrets else None)
+except Exception:
+    IMAGE_PROFILES = images.profiles()
+
 # --- 2. CONNECT TO SUPABASE ---
 try:
     @st.cache_resource(ttl=3600)
     def init_connection():
+        # Offline / load-test mode: LABOURPRO_BACKEND=local or [backend] kind="local"
+        if local_backend.is_selected(st.secrets):
+            return local_backend.create_client(secrets=st.secrets)
         url = st.secrets["supabase"]["url"]
         key = st.secrets["supabase"]["key"]
         return create_client(url, key)
-    supabase = init_connection()
+    # Every table() call is logged per rerun while span tracing is on (see perf.py)
+    supabase = perf.TracedClient(init_connection())
 except Exception:
     st.error("⚠️ Supabase connection failed. Check secrets.toml.")
     st.stop()
@@ -256,42 +288,597 @@ def apply_custom_styling():
 apply_custom_styling()
 
 # --- 5. HELPER FUNCTIONS & PDF ENGINES ---
-def fetch_data(table):
-    all_data = []
+def _iter_pages(table, columns, filters=(), order=None, progress=None):
+    """Yield `table` one page (list of rows, up to 1000) at a time. `filters`
+    are (method, column, value) tuples applied to each page's query, e.g.
+    ("gte", "date", "2025-05-17") or ("in_", "site", [...]). Pass `order` (a
+    unique column) when the pages must not shift between requests, and
+    `progress(done, total)` to also ask for the total row count."""
     page_size = 1000
     current_start = 0
+    total = None
     while True:
+        query = supabase.table(table).select(columns, count="exact" if progress and total is None else None)
+        for method, column, value in filters:
+            query = getattr(query, method)(column, value)
+        if order:
+            query = query.order(order)
+        response = query.range(current_start, current_start + page_size - 1).execute()
+        data_chunk = response.data
+        if progress:
+            total = total if total is not None else (response.count or 0)
+            progress(current_start + len(data_chunk), total or 1, f"{current_start + len(data_chunk):,} of {total:,} rows")
+        if data_chunk:
+            yield data_chunk
+        if len(data_chunk) < page_size:
+            return
+        current_start += page_size
+
+def _fetch_pages(table, columns, rows, filters=()):
+    """Append every row of `table` to `rows` (see _iter_pages). Raises on the
+    first failed page; `rows` keeps whatever arrived before it."""
+    pages = 0
+    with perf.span(f"fetch_data:{table}") as sp:
         try:
-            response = supabase.table(table).select("*").range(current_start, current_start + page_size - 1).execute()
-            data_chunk = response.data
-            all_data.extend(data_chunk)
-            if len(data_chunk) < page_size:
-                break
-            current_start += page_size
-        except Exception as e:
-            st.error(f"Error fetching data: {e}")
-            break
+            for data_chunk in _iter_pages(table, columns, filters):
+                rows.extend(data_chunk)
+                pages += 1
+        finally:
+            sp.set(pages=pages, rows=len(rows))
+
+def fetch_data(table, columns="*", filters=()):
+    all_data = []
+    try:
+        _fetch_pages(table, columns, all_data, filters)
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
     return pd.DataFrame(all_data)
 
-def get_billing_start_date(entry_date):
-    days_since_saturday = (entry_date.weekday() + 2) % 7
-    return entry_date - timedelta(days=days_since_saturday)
+# ── shared entries frame ──────────────────────────────────────────────────────
+# Entries are by far the biggest table and most pages read all of it. Instead
+# of every rerun of every session pulling it down and re-parsing it, one
+# compact copy (see helpers.compact_entries) is cached for the whole server
+# and handed out as-is. Pages must treat it as read-only. Writes made from
+# this app call invalidate_entries(); anything written elsewhere (backup
+# restore script, Supabase dashboard) shows up once the TTL runs out.
+ENTRIES_CACHE_TTL = 60
+
+@st.cache_resource(ttl=ENTRIES_CACHE_TTL, show_spinner=False)
+def _load_entries():
+    rows = []
+    _fetch_pages("entries", ",".join(ENTRY_CORE_COLUMNS), rows)
+    return compact_entries(rows)
+
+def fetch_entry_details(filters=()):
+    """id / work_description / photo_url of the entries matching `filters`,
+    uncached. Makes no st.* calls, so download builders can use it."""
+    rows = []
+    _fetch_pages("entries", ",".join(["id"] + ENTRY_DETAIL_COLUMNS), rows, filters)
+    return pd.DataFrame(rows, columns=["id"] + ENTRY_DETAIL_COLUMNS)
+
+@st.cache_resource(ttl=ENTRIES_CACHE_TTL, show_spinner=False)
+def _load_entry_details():
+    return fetch_entry_details()
+
+def load_entries():
+    """The shared, read-only entries frame (no description/photo columns)."""
+    # Failed fetches raise inside the cached loader so a half-loaded table is
+    # never cached; the page just gets an empty frame for this rerun.
+    try:
+        return _load_entries()
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return compact_entries([])
+
+def add_entry_details(df_entries):
+    """Attach work_description / photo_url to a slice of load_entries(),
+    fetching those columns only when a page actually shows them."""
+    try:
+        return with_entry_details(df_entries, _load_entry_details())
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return with_entry_details(df_entries, pd.DataFrame(columns=["id"] + ENTRY_DETAIL_COLUMNS))
+
+# ── assigned-site scoping ─────────────────────────────────────────────────────
+# Field users only ever see their own sites, so every read they make carries
+# an in_ filter on those sites rather than pulling all sites and dropping the
+# rest client-side. None means "no restriction" throughout.
+def parse_assigned_sites(assigned_raw):
+    """users.assigned_site ("Site A, Site B" / "All" / "None/All") → None for
+    all sites, otherwise a tuple of names (hashable, so it can key a cache)."""
+    assigned_list = [s.strip() for s in (assigned_raw or "").split(",")]
+    if "None/All" in assigned_list or "All" in assigned_list:
+        return None
+    return tuple(assigned_list)
+
+def assigned_sites():
+    """Sites the logged-in user may see (None for admins)."""
+    if st.session_state.get("role") == "admin":
+        return None
+    return parse_assigned_sites(st.session_state.get("assigned_site"))
+
+def site_filter(sites, column="site"):
+    """fetch_data / _fetch_pages filters limiting `column` to `sites`."""
+    return () if sites is None else (("in_", column, list(sites)),)
+
+# Weekly Bill only ever shows one week, so it doesn't read the shared frame:
+# the week list comes from the database's entry_weeks function (one row per
+# week), then just the chosen week's rows (descriptions and photos included,
+# for the CSV) are fetched.
+@st.cache_resource(ttl=ENTRIES_CACHE_TTL, show_spinner=False)
+def _load_entry_weeks(sites):
+    return week_options(week_keys(aggregates.entry_weeks(supabase, sites)))
+
+@st.cache_resource(ttl=ENTRIES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _load_week_entries(week, sites):
+    start = week_start(week)
+    rows = []
+    _fetch_pages("entries", ",".join(ENTRY_CORE_COLUMNS + ENTRY_DETAIL_COLUMNS), rows,
+                 (("gte", "date", str(start)), ("lte", "date", str(start + timedelta(days=6))))
+                 + site_filter(sites))
+    return compact_entries(rows)
+
+def load_entry_weeks(sites=None):
+    """{label: week key}, newest first, for weeks that have entries at `sites`."""
+    try:
+        return _load_entry_weeks(sites)
+    except Exception as e:
+        if aggregates.is_missing_function(e):
+            st.error("⚠️ Database Setup Required: the 'entry_weeks' function is missing. Run sql/aggregates.sql in the Supabase SQL editor.")
+        else:
+            st.error(f"Error fetching data: {e}")
+        return {}
 
-def upload_evidence(file_obj):
-    """Uploads photos/receipts to Supabase storage and returns the URL."""
+def load_week_entries(week, sites=None):
+    """Read-only compact frame of one billing week's entries at `sites`."""
+    try:
+        return _load_week_entries(week, sites)
+    except Exception as e:
+        st.error(f"Error fetching data: {e}")
+        return compact_entries([])
+
+def load_totals(query, columns, *args):
+    """Run one of the aggregates.* server-side totals with the app's client.
+    On failure explains why (usually: sql/aggregates.sql not installed yet)
+    and returns no rows, so the page still renders with zeros."""
+    with perf.span(f"totals:{query.__name__}"):
+        try:
+            return query(supabase, *args)
+        except Exception as e:
+            if aggregates.is_missing_function(e):
+                st.error(f"⚠️ Database Setup Required: the '{query.__name__}' function is missing. Run sql/aggregates.sql in the Supabase SQL editor.")
+            else:
+                st.error(f"Error fetching data: {e}")
+            return aggregates.totals_frame([], columns)
+
+def invalidate_entries():
+    _load_entries.clear()
+    _load_entry_details.clear()
+    _load_entry_weeks.clear()
+    _load_week_entries.clear()
+    data_changed()
+
+# ── on-demand download artifacts ──────────────────────────────────────────────
+# st.download_button accepts a zero-argument callable as `data` and only runs
+# it when the button is clicked, on a server thread rather than the script
+# thread. lazy_artifact() wraps a builder that way and keeps its result per
+# (name, data version), so a second click, or a second admin asking for the
+# same backup, doesn't build it again. Builders run outside the script run:
+# they must not call st.* (use _fetch_pages, not fetch_data).
+ARTIFACT_CACHE_BYTES = 64 * 1024 * 1024
+
+@st.cache_resource
+def _artifact_store():
+    return {"lock": threading.Lock(), "items": OrderedDict(), "bytes": 0, "version": 0}
+
+def data_version():
+    """Changes whenever this app writes to the database, and at least once per
+    ENTRIES_CACHE_TTL so writes made elsewhere are picked up too."""
+    return (_artifact_store()["version"], int(time.time() // ENTRIES_CACHE_TTL))
+
+def data_changed():
+    """Call after any write so artifacts built from the old data aren't reused."""
+    store = _artifact_store()
+    with store["lock"]:
+        store["version"] += 1
+
+def lazy_artifact(name, build):
+    """Zero-argument callable for st.download_button(data=...) that runs
+    build() on first click and then serves the cached bytes."""
+    store = _artifact_store()
+    key = (name, data_version())
+
+    def get():
+        with store["lock"]:
+            if key in store["items"]:
+                store["items"].move_to_end(key)
+                return store["items"][key]
+        data = build()
+        with store["lock"]:
+            # Anything bigger than the whole budget (a full backup of a large
+            # database) is served but not kept.
+            if key not in store["items"] and len(data) <= ARTIFACT_CACHE_BYTES:
+                store["items"][key] = data
+                store["bytes"] += len(data)
+                while store["bytes"] > ARTIFACT_CACHE_BYTES:
+                    _, old = store["items"].popitem(last=False)
+                    store["bytes"] -= len(old)
+        return data
+    return get
+
+def build_backup(tables):
+    """JSON backup of whole tables, read straight from the database."""
+    backup = {}
+    for table in tables:
+        rows = []
+        _fetch_pages(table, "*", rows)
+        backup[table] = rows
+    return json.dumps(backup, default=str).encode("utf-8")
+
+# Materials are read per site; the parsed frame (dates, week keys) is cached
+# per site and data version, so a View Period change or any other rerun
+# doesn't fetch and parse the site's materials again.
+@st.cache_data(ttl=ENTRIES_CACHE_TTL, max_entries=64, show_spinner=False)
+def _load_site_materials(site, version):
+    with perf.span("fetch:materials"):
+        raw = supabase.table("materials").select("*").eq("site", site).execute()
+    df_mat = pd.DataFrame(raw.data) if raw.data else pd.DataFrame()
+    weeks = {}
+    if not df_mat.empty:
+        df_mat["date_dt"] = pd.to_datetime(df_mat["date"], errors='coerce')
+        df_mat = df_mat.dropna(subset=["date_dt"])
+        if not df_mat.empty:
+            df_mat["week_key"] = week_keys(df_mat["date_dt"])
+            weeks = week_options(df_mat["week_key"])
+    return df_mat, weeks
+
+def load_site_materials(site):
+    """(materials frame with date_dt / week_key, {week label: key}) for `site`."""
     try:
-        ext = file_obj.name.split('.')[-1]
-        unique_name = f"{uuid.uuid4()}.{ext}"
-        file_bytes = file_obj.getvalue()
-        supabase.storage.from_("evidence").upload(
-            file=file_bytes,
-            path=unique_name,
-            file_options={"content-type": f"image/{ext}"}
+        return _load_site_materials(site, data_version())
+    except Exception:
+        st.error("⚠️ Error fetching materials data. Check your connection.")
+        return pd.DataFrame(), {}
+
+# ── background jobs ───────────────────────────────────────────────────────────
+# Heavy PDFs are built by the shared jobs.JobRunner instead of inline, so the
+# page stays usable while they run. A page keeps only the job id in
+# session_state[slot]; the bytes live in the runner, so they survive the
+# reruns a download click causes (this replaces the old per-page
+# "_xxx_pdf_bytes" session_state workaround). Job functions run outside the
+# script run: same rules as lazy_artifact builders, no st.* calls.
+JOB_WORKERS = 2
+
+@st.cache_resource
+def job_runner():
+    return jobs.JobRunner(max_workers=JOB_WORKERS)
+
+def start_job(slot, label, fn, file_name, mime="application/pdf"):
+    """Queue fn(progress) and remember the job in session_state[slot]."""
+    st.session_state[slot] = job_runner().submit(fn, label=label, meta={"file_name": file_name, "mime": mime})
+
+@st.fragment(run_every=1)
+def _job_progress(slot):
+    # Only this fragment reruns while the job works; once it's finished one
+    # full rerun lets job_panel() swap the bar for the download button.
+    job = job_runner().get(st.session_state.get(slot))
+    if job is None or job["status"] not in jobs.ACTIVE:
+        st.rerun()
+    text = job["message"] or ("Waiting for a free worker..." if job["status"] == "queued" else "Working...")
+    st.progress(job["progress"], text=f"⏳ {job['label']}: {text}")
+
+def job_panel(slot, download_label):
+    """Progress, error or download button for the job in session_state[slot]."""
+    job_id = st.session_state.get(slot)
+    if not job_id:
+        return
+    job = job_runner().get(job_id)
+    if job is None:
+        st.session_state.pop(slot, None)
+    elif job["status"] in jobs.ACTIVE:
+        _job_progress(slot)
+    elif job["status"] == "failed":
+        st.error(f"⚠️ {job['label']} failed: {job['error']}")
+    else:
+        st.success(f"✅ {job['label']} ready to download!")
+        st.download_button(
+            label=download_label, data=job["result"],
+            file_name=job["meta"]["file_name"], mime=job["meta"]["mime"], on_click="ignore"
         )
-        return supabase.storage.from_("evidence").get_public_url(unique_name)
+
+EVIDENCE_BUCKET = "evidence"
+EVIDENCE_FOLDER = "sha256"
+
+def upload_evidence(file_bytes, file_name, profile="photo"):
+    """Uploads a photo/receipt to Supabase storage and returns its URL.
+    `profile` ("photo" or "receipt") picks the downscale/recompress settings
+    (see images.py); if the file can't be processed the original is sent.
+    Raises on failure. Runs in upload jobs, so no st.* calls.
+
+    Objects are named by the SHA-256 of the bytes actually stored, so the same
+    receipt attached to several material lines, or re-sent after a timeout,
+    is stored once: if the object already exists its URL is reused and the
+    bytes are never sent."""
+    try:
+        with perf.span("image:prepare", bytes_in=len(file_bytes)) as sp:
+            file_bytes, ext, content_type = images.prepare(file_bytes, IMAGE_PROFILES[profile])
+            sp.set(bytes_out=len(file_bytes))
+    except Exception:
+        ext = file_name.split('.')[-1].lower()
+        content_type = "image/jpeg" if ext == "jpg" else f"image/{ext}"
+    path = f"{EVIDENCE_FOLDER}/{hashlib.sha256(file_bytes).hexdigest()}.{ext}"
+    bucket = supabase.storage.from_(EVIDENCE_BUCKET)
+    if _store_evidence(bucket, path, file_bytes, content_type):
+        # New object: make its gallery thumbnail now, while we have the bytes.
+        try:
+            thumb, thumb_ext, thumb_type = images.prepare(file_bytes, IMAGE_PROFILES["thumb"])
+            _store_evidence(bucket, thumbnail_path(path, thumb_ext), thumb, thumb_type)
+        except Exception:
+            pass    # evidence_thumbnail() makes it on first view instead
+    return bucket.get_public_url(path)
+
+def _store_evidence(bucket, path, data, content_type):
+    """Upload `data` to `path` unless an object is already there. Returns
+    True if it was uploaded, False if it already existed."""
+    folder, name = path.rsplit("/", 1)
+    with perf.span("evidence:exists"):
+        found = bucket.list(folder, {"search": name, "limit": 1})
+    if any(obj.get("name") == name for obj in found):
+        return False
+    try:
+        bucket.upload(file=data, path=path, file_options={"content-type": content_type})
+    except Exception as e:
+        # Lost a race with another upload of the same file (or our own
+        # earlier attempt that timed out after the bytes arrived): fine.
+        if "already exists" not in str(e) and "Duplicate" not in str(e):
+            raise
+        return False
+    return True
+
+# ── evidence gallery ──────────────────────────────────────────────────────────
+# Galleries show small thumbnails (thumbs/<name>.jpg, ~10 KB) for one page at a
+# time; the full image is only fetched when someone clicks through. Photos
+# uploaded before thumbnails existed get one made the first time they are
+# shown, and the result is cached so that happens once per photo.
+GALLERY_PAGE_SIZE = 12
+GALLERY_COLUMNS = 4
+
+@st.cache_resource(max_entries=5000, ttl=3600, show_spinner=False)
+def _thumbnail(url):
+    try:
+        return _make_thumbnail(url)
+    except Exception:
+        return None     # missing / not an image; cached too, so not retried every rerun
+
+def _make_thumbnail(url):
+    path = evidence_path(url, EVIDENCE_BUCKET)
+    bucket = supabase.storage.from_(EVIDENCE_BUCKET)
+    thumb_path = thumbnail_path(path, images.extension(IMAGE_PROFILES["thumb"]))
+    folder, name = thumb_path.rsplit("/", 1)
+    if not any(obj.get("name") == name for obj in bucket.list(folder, {"search": name, "limit": 1})):
+        with perf.span("evidence:thumbnail"):
+            thumb, _, thumb_type = images.prepare(bucket.download(path), IMAGE_PROFILES["thumb"])
+            _store_evidence(bucket, thumb_path, thumb, thumb_type)
+    thumb_url = bucket.get_public_url(thumb_path)
+    # The offline backend's local:// URLs can't be loaded by a browser.
+    return thumb_url if thumb_url.startswith("http") else bucket.download(thumb_path)
+
+def evidence_thumbnail(url):
+    """What st.image needs to show url's thumbnail (its public URL, so the
+    browser fetches it directly), or None if there is no usable image."""
+    if evidence_path(url, EVIDENCE_BUCKET) is None:
+        return None
+    return _thumbnail(url)
+
+def evidence_gallery(items, key):
+    """Paged thumbnail grid for [(url, caption), ...], newest first. Only the
+    current page's thumbnails are looked up; a click opens the full image."""
+    items = [(url, caption) for url, caption in items if evidence_path(url, EVIDENCE_BUCKET)]
+    if not items:
+        st.info("ℹ️ No photos in this selection yet.")
+        return
+    pages = (len(items) - 1) // GALLERY_PAGE_SIZE + 1
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=f"{key}_page")
+    st.caption(f"{len(items)} photo{'s' if len(items) > 1 else ''}. Click a thumbnail to open the full image.")
+    cols = st.columns(GALLERY_COLUMNS)
+    with perf.span("gallery"):
+        for i, (url, caption) in enumerate(items[(page - 1) * GALLERY_PAGE_SIZE:page * GALLERY_PAGE_SIZE]):
+            with cols[i % GALLERY_COLUMNS]:
+                thumb = evidence_thumbnail(url)
+                if thumb is None:
+                    st.markdown(f"🖼️ [{caption}]({url})")
+                else:
+                    st.image(thumb, caption=caption, width='stretch', link=url if url.startswith("http") else None)
+
+# ── background evidence uploads ───────────────────────────────────────────────
+# Saving an entry or a material no longer waits for its photo. The row is
+# written straight away with a "pending:<token>" marker in photo_url /
+# receipt_url, and an upload job (own small pool, so reports can't starve it)
+# uploads the file with retries and then swaps the marker for the real URL.
+# The swap only matches that exact marker, so if the row was saved again with
+# a different photo in the meantime the older upload can't overwrite it.
+UPLOAD_WORKERS = 2
+UPLOAD_ATTEMPTS = 4
+UPLOAD_BACKOFF = 2     # seconds before the first retry, doubled each time
+
+@st.cache_resource
+def upload_runner():
+    return jobs.JobRunner(max_workers=UPLOAD_WORKERS)
+
+def pending_upload_marker():
+    return f"{PENDING_UPLOAD_PREFIX}{uuid.uuid4().hex}"
+
+def _with_retries(fn, progress, what):
+    for attempt in range(1, UPLOAD_ATTEMPTS + 1):
+        try:
+            return fn()
+        except Exception:
+            if attempt == UPLOAD_ATTEMPTS:
+                raise
+            progress(attempt, UPLOAD_ATTEMPTS, f"{what} failed, retrying ({attempt}/{UPLOAD_ATTEMPTS - 1})...")
+            time.sleep(UPLOAD_BACKOFF * 2 ** (attempt - 1))
+
+def queue_evidence_upload(label, table, column, row_id, marker, file_obj, profile="photo"):
+    """Upload file_obj in the background, then replace `marker` in
+    table.column of row `row_id` with its URL. Shown by pending_uploads_panel()."""
+    file_bytes, file_name = file_obj.getvalue(), file_obj.name
+
+    def run(progress):
+        url = _with_retries(lambda: upload_evidence(file_bytes, file_name, profile), progress, "Upload")
+        _with_retries(lambda: supabase.table(table).update({column: url}).eq("id", row_id).eq(column, marker).execute(),
+                      progress, "Saving the link")
+        if table == "entries":
+            invalidate_entries()
+        else:
+            data_changed()
+        return url
+
+    uploads = st.session_state.setdefault("_uploads", {})
+    uploads[upload_runner().submit(run, label=label)] = run
+
+def pending_uploads_panel():
+    if st.session_state.get("_uploads"):
+        _uploads_status()
+
+@st.fragment(run_every=2)
+def _uploads_status():
+    uploads = st.session_state.get("_uploads", {})
+    runner = upload_runner()
+    active = 0
+    for job_id, run in list(uploads.items()):
+        job = runner.get(job_id)
+        if job is None:
+            del uploads[job_id]
+        elif job["status"] == "done":
+            del uploads[job_id]
+            st.toast(f"✅ {job['label']} uploaded.")
+        elif job["status"] == "failed":
+            st.error(f"⚠️ {job['label']} failed to upload: {job['error']}")
+            if st.button("🔁 Retry Upload", key=f"retry_{job_id}", width='stretch'):
+                del uploads[job_id]
+                uploads[runner.submit(run, label=job["label"])] = run
+                st.rerun(scope="fragment")
+        else:
+            active += 1
+            if job["message"]:
+                st.caption(f"⏳ {job['label']}: {job['message']}")
+    if active:
+        st.info(f"⏳ {active} upload{'s' if active > 1 else ''} in progress. You can keep working.")
+
+# ── offline write queue ───────────────────────────────────────────────────────
+# A field save that fails on the network is kept in write_queue (session +
+# cookie) instead of being lost, and the sidebar panel sends everything that
+# is waiting in one upsert per table: every WRITE_SYNC_SECONDS, backing off
+# while the connection stays down, or straight away on "Sync Now". Photos
+# and receipts of queued saves are uploaded once their row is written.
+WRITE_QUEUE_COOKIE = "pending_writes"
+WRITE_SYNC_SECONDS = 15
+WRITE_SYNC_MAX_WAIT = 300
+
+def write_queue_items():
+    items = st.session_state.get("_write_queue")
+    if items is None:
+        items = st.session_state["_write_queue"] = write_queue.loads(_cookie_get(WRITE_QUEUE_COOKIE),
+                                                                     st.session_state.get("phone"))
+    return items
+
+def _store_write_queue(items):
+    st.session_state["_write_queue"] = items
+    raw = write_queue.dumps(items, st.session_state.get("phone"))
+    if raw is None:
+        if _cookie_get(WRITE_QUEUE_COOKIE):
+            _cookie_delete(WRITE_QUEUE_COOKIE)
+    elif raw != _cookie_get(WRITE_QUEUE_COOKIE):
+        _cookie_set(WRITE_QUEUE_COOKIE, raw, expires_at=datetime.now() + timedelta(days=7))
+
+def queue_write(table, rows, label, upload=None):
+    """Keep rows that couldn't be saved for the next sync. `upload` is
+    (marker, file_obj, profile) when a row carries a pending evidence marker."""
+    it = write_queue.item(table, rows, label)
+    if upload:
+        st.session_state.setdefault("_queued_uploads", {})[upload[0]] = (label, *upload[1:])
+    _store_write_queue(write_queue_items() + [it])
+    st.session_state.pop("_write_sync", None)
+
+@st.cache_resource(ttl=600, show_spinner=False)
+def _has_column(table, column):
+    try:
+        supabase.table(table).select(column).limit(1).execute()
     except Exception as e:
-        st.error(f"Image upload failed: {e}")
-        return ""
+        if write_queue.is_setup_error(e):
+            return False
+        raise      # not cached: ask again next time
+    return True
+
+def has_column(table, column):
+    """Whether `table` has `column` yet (e.g. materials.client_key before
+    sql/write_queue.sql is run). False if it can't be told right now."""
+    try:
+        return _has_column(table, column)
+    except Exception:
+        return False
+
+def _upsert(table, rows, on_conflict):
+    return supabase.table(table).upsert(rows, on_conflict=on_conflict).execute().data
+
+def sync_writes():
+    """Send the whole queue. Returns (rows written, error)."""
+    items = write_queue_items()
+    with perf.span("write_queue:flush", rows=sum(len(it["rows"]) for it in items)):
+        remaining, written, error = write_queue.flush(items, _upsert)
+    queued_uploads = st.session_state.get("_queued_uploads", {})
+    for table, rows in written.items():
+        column = write_queue.EVIDENCE_COLUMNS[table]
+        for row in rows:
+            if row.get(column) in queued_uploads:
+                label, file_obj, profile = queued_uploads.pop(row[column])
+                queue_evidence_upload(label, table, column, row["id"], row[column], file_obj, profile)
+    if "entries" in written:
+        invalidate_entries()
+    if "materials" in written:
+        data_changed()
+    _store_write_queue(remaining)
+    return sum(len(rows) for rows in written.values()), error
+
+def pending_writes_panel():
+    if write_queue_items():
+        _writes_status()
+
+@st.fragment(run_every=WRITE_SYNC_SECONDS)
+def _writes_status():
+    items = write_queue_items()
+    if not items:
+        return
+    box = st.container()
+    sync_now = st.button("🔄 Sync Now", key="sync_writes", width='stretch')
+    status = st.session_state.setdefault("_write_sync", {"next": 0.0, "failures": 0, "error": None})
+    if sync_now or time.time() >= status["next"]:
+        n, error = sync_writes()
+        if n:
+            st.toast(f"✅ Synced {n} saved row{'s' if n > 1 else ''}.")
+        if error is None:
+            st.session_state.pop("_write_sync", None)
+            st.rerun()
+        status["failures"] += 1
+        status["error"] = error
+        status["next"] = time.time() + min(WRITE_SYNC_SECONDS * 2 ** (status["failures"] - 1), WRITE_SYNC_MAX_WAIT)
+        if n:
+            st.rerun()
+        items = write_queue_items()
+    with box:
+        st.warning(f"📤 {len(items)} save{'s' if len(items) > 1 else ''} waiting to sync. Keep working, they are sent automatically when the connection is back.")
+        for it in items[:5]:
+            st.caption(f"⏳ {it['label']}")
+        if len(items) > 5:
+            st.caption(f"… and {len(items) - 5} more")
+        if status["error"] is not None and write_queue.is_setup_error(status["error"]):
+            st.error("⚠️ Database Setup Required: queued saves need unique keys. Run sql/day_sheet.sql and sql/write_queue.sql in the Supabase SQL editor.")
+        elif status["error"] is not None and not isinstance(status["error"], write_queue.NETWORK_ERRORS):
+            st.error(f"⚠️ The server rejected a queued save: {status['error']}")
+        elif status["error"] is not None:
+            st.caption(f"Last try failed; next try in about {max(0, int(status['next'] - time.time()))} s.")
 
 def empty_state(icon, title, text=""):
     st.markdown(f"""
@@ -302,303 +889,31 @@ def empty_state(icon, title, text=""):
         </div>
     """, unsafe_allow_html=True)
 
-# --- PDF ENGINE FOR LABOUR BILLS ---
-class PDFBill(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, 'Labour Payment Bill', 0, 1, 'C')
-        self.ln(5)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def _pdf_safe(text):
-    """Make any string safe for FPDF's Latin-1-only core fonts.
-    Swaps common 'smart' characters (curly quotes, em/en-dashes, the ₹ sign,
-    ellipsis) for plain ASCII equivalents, then drops anything else that still
-    can't be encoded — so a stray emoji or symbol in a site/contractor name
-    can never crash PDF generation again."""
-    if text is None:
-        return ""
-    text = str(text)
-    replacements = {
-        "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
-        "\u2013": "-", "\u2014": "-", "\u2026": "...", "\u20b9": "Rs. ",
-        "\u00a0": " ",
-    }
-    for bad, good in replacements.items():
-        text = text.replace(bad, good)
-    return text.encode("latin-1", errors="replace").decode("latin-1")
-
-def generate_pdf_bytes(header_name, week_label, billing_data):
-    pdf = PDFBill()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, _pdf_safe(f"Bill For: {header_name}"), 0, 1, 'L')
-    pdf.cell(0, 10, _pdf_safe(f"Week: {week_label}"), 0, 1, 'L')
-    pdf.ln(5)
-    for item in billing_data:
-        pdf.set_fill_color(220, 220, 220)
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(0, 10, _pdf_safe(item['name']), 0, 1, 'L', fill=True)
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(30, 8, "Date", 1)
-        pdf.cell(20, 8, "Mason", 1)
-        pdf.cell(20, 8, "Helper", 1)
-        pdf.cell(20, 8, "Ladies", 1)
-        pdf.ln()
-        pdf.set_font("Arial", '', 10)
-        for row in item['rows']:
-            pdf.cell(30, 8, _pdf_safe(row['Date']), 1)
-            pdf.cell(20, 8, _pdf_safe(row['Mason']), 1)
-            pdf.cell(20, 8, _pdf_safe(row['Helper']), 1)
-            pdf.cell(20, 8, _pdf_safe(row['Ladies']), 1)
-            pdf.ln()
-        pdf.set_font("Arial", 'B', 10)
-        pdf.cell(30, 8, "Totals", 1)
-        pdf.cell(20, 8, _pdf_safe(item['totals']['m']), 1)
-        pdf.cell(20, 8, _pdf_safe(item['totals']['h']), 1)
-        pdf.cell(20, 8, _pdf_safe(item['totals']['l']), 1)
-        pdf.ln()
-        pdf.set_font("Arial", 'B', 12)
-        pdf.cell(90, 10, f"Total: Rs. {item['totals']['amt']:,.2f}", 1, 0, 'R')
-        pdf.ln(15)
-    return pdf.output(dest='S').encode('latin-1')
-
-
-
-# --- PDF ENGINE FOR MATERIALS ---
-class MaterialPDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, 'Material Log Report', 0, 1, 'C')
-        self.ln(5)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def generate_material_pdf_bytes(site_name, period_label, df_mat):
-    pdf = MaterialPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 12)
-    pdf.cell(0, 10, _pdf_safe(f"Site: {site_name}"), 0, 1, 'L')
-    pdf.cell(0, 10, _pdf_safe(f"Period: {period_label}"), 0, 1, 'L')
-    pdf.ln(5)
-    total_grand = 0
-    categories = ["Civil Material", "Steel Material", "Soil Material", "RMC"]
-    for cat in categories:
-        df_cat = df_mat[df_mat["category"] == cat]
-        if not df_cat.empty:
-            pdf.set_fill_color(220, 220, 220)
-            pdf.set_font("Arial", 'B', 12)
-            pdf.cell(0, 10, f"{cat}", 0, 1, 'L', fill=True)
-            pdf.set_font("Arial", 'B', 9)
-            pdf.cell(25, 8, "Date", 1)
-            pdf.cell(50, 8, "Vendor", 1)
-            pdf.cell(80, 8, "Material", 1)
-            pdf.cell(15, 8, "Qty", 1)
-            pdf.cell(20, 8, "Amount", 1)
-            pdf.ln()
-            pdf.set_font("Arial", '', 9)
-            cat_total = 0
-            for _, row in df_cat.iterrows():
-                pdf.cell(25, 8, _pdf_safe(row.get('date', '')), 1)
-                vendor = _pdf_safe(str(row.get('vendor', ''))[:22])
-                material = _pdf_safe(str(row.get('material_name', ''))[:40])
-                pdf.cell(50, 8, vendor, 1)
-                pdf.cell(80, 8, material, 1)
-                pdf.cell(15, 8, _pdf_safe(row.get('quantity', '')), 1)
-                amt = float(row.get('amount', 0))
-                cat_total += amt
-                pdf.cell(20, 8, f"{amt:,.0f}", 1)
-                pdf.ln()
-            pdf.set_font("Arial", 'B', 9)
-            pdf.cell(170, 8, f"Total {cat}", 1, 0, 'R')
-            pdf.cell(20, 8, f"{cat_total:,.0f}", 1, 1, 'L')
-            pdf.ln(8)
-            total_grand += cat_total
-    if total_grand > 0:
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, f"Grand Total: Rs. {total_grand:,.2f}", 0, 1, 'R')
-    return pdf.output(dest='S').encode('latin-1')
-
-# --- PDF ENGINE FOR CLIENT INVOICES ---
-class ClientInvoicePDF(FPDF):
-    def header(self):
-        self.set_font('Arial', 'B', 22)
-        self.set_text_color(44, 62, 80)
-        self.cell(0, 15, 'WEEKLY EXPENSE REPORT', 0, 1, 'C')
-        self.ln(5)
-    def footer(self):
-        self.set_y(-15)
-        self.set_font('Arial', 'I', 8)
-        self.set_text_color(150, 150, 150)
-        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
-
-def generate_client_invoice_bytes(site_name, date_range_label, labor_details, df_mats, grand_total):
-    pdf = ClientInvoicePDF()
-    pdf.add_page()
-    pdf.set_font("Arial", 'B', 12)
-    pdf.set_text_color(44, 62, 80)
-    pdf.cell(100, 8, _pdf_safe(f"Project Site: {site_name}"), 0, 0, 'L')
-    pdf.set_font("Arial", '', 11)
-    pdf.cell(90, 8, f"Date Generated: {date.today().strftime('%d %b %Y')}", 0, 1, 'R')
-    pdf.cell(100, 8, f"Billing Period: {date_range_label}", 0, 1, 'L')
-    pdf.ln(10)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_fill_color(52, 73, 94)
-    pdf.set_text_color(255, 255, 255)
-    pdf.cell(0, 10, " 1. LABOR EXPENSES", 0, 1, 'L', fill=True)
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_font("Arial", 'B', 11)
-    pdf.set_fill_color(236, 240, 241)
-    pdf.cell(50, 10, "Labor Type", 1, 0, 'C', fill=True)
-    pdf.cell(45, 10, "Total Shifts", 1, 0, 'C', fill=True)
-    pdf.cell(45, 10, "Rate (Rs)", 1, 0, 'C', fill=True)
-    pdf.cell(50, 10, "Amount (Rs)", 1, 1, 'C', fill=True)
-    pdf.set_font("Arial", '', 11)
-    if labor_details['m_count'] > 0:
-        pdf.cell(50, 10, " Masons", 1, 0, 'L')
-        pdf.cell(45, 10, f"{labor_details['m_count']}", 1, 0, 'C')
-        pdf.cell(45, 10, f"{labor_details['m_rate']:,.2f}", 1, 0, 'C')
-        pdf.cell(50, 10, f"{(labor_details['m_count'] * labor_details['m_rate']):,.2f}", 1, 1, 'R')
-    if labor_details['h_count'] > 0:
-        pdf.cell(50, 10, " Helpers", 1, 0, 'L')
-        pdf.cell(45, 10, f"{labor_details['h_count']}", 1, 0, 'C')
-        pdf.cell(45, 10, f"{labor_details['h_rate']:,.2f}", 1, 0, 'C')
-        pdf.cell(50, 10, f"{(labor_details['h_count'] * labor_details['h_rate']):,.2f}", 1, 1, 'R')
-    if labor_details['l_count'] > 0:
-        pdf.cell(50, 10, " Ladies", 1, 0, 'L')
-        pdf.cell(45, 10, f"{labor_details['l_count']}", 1, 0, 'C')
-        pdf.cell(45, 10, f"{labor_details['l_rate']:,.2f}", 1, 0, 'C')
-        pdf.cell(50, 10, f"{(labor_details['l_count'] * labor_details['l_rate']):,.2f}", 1, 1, 'R')
-    if labor_details['m_count'] == 0 and labor_details['h_count'] == 0 and labor_details['l_count'] == 0:
-        pdf.cell(190, 10, "No labor entered for this period.", 1, 1, 'C')
-    pdf.set_font("Arial", 'B', 11)
-    pdf.cell(140, 10, "Total Labor Cost:", 1, 0, 'R', fill=True)
-    pdf.cell(50, 10, f"Rs. {labor_details['total']:,.2f}", 1, 1, 'R', fill=True)
-    pdf.ln(10)
-    pdf.set_font("Arial", 'B', 14)
-    pdf.set_fill_color(52, 73, 94)
-    pdf.set_text_color(255, 255, 255)
-    pdf.cell(0, 10, " 2. MATERIAL EXPENSES", 0, 1, 'L', fill=True)
-    pdf.set_font("Arial", 'B', 11)
-    pdf.set_text_color(0, 0, 0)
-    pdf.set_fill_color(236, 240, 241)
-    pdf.cell(30, 10, "Date", 1, 0, 'C', fill=True)
-    pdf.cell(110, 10, "Material Description", 1, 0, 'C', fill=True)
-    pdf.cell(50, 10, "Amount", 1, 1, 'C', fill=True)
-    pdf.set_font("Arial", '', 11)
-    mat_total = 0
-    if not df_mats.empty:
-        for _, r in df_mats.iterrows():
-            desc = str(r.get("Description", "")).strip()
-            if not desc: continue
-            m_date = str(r.get("Date", "")).strip()
-            try: amt = float(r.get("Amount (Rs)", 0))
-            except: amt = 0.0
-            mat_total += amt
-            pdf.cell(30, 10, _pdf_safe(m_date[:12]), 1, 0, 'C')
-            pdf.cell(110, 10, _pdf_safe(f" {desc[:55]}"), 1, 0, 'L')
-            pdf.cell(50, 10, f"{amt:,.2f}", 1, 1, 'R')
-    else:
-        pdf.cell(190, 10, "No materials entered for this period.", 1, 1, 'C')
-    pdf.set_font("Arial", 'B', 11)
-    pdf.cell(140, 10, "Total Material Cost:", 1, 0, 'R', fill=True)
-    pdf.cell(50, 10, f"Rs. {mat_total:,.2f}", 1, 1, 'R', fill=True)
-    pdf.ln(15)
-    pdf.set_font("Arial", 'B', 16)
-    pdf.set_fill_color(46, 204, 113)
-    pdf.set_text_color(255, 255, 255)
-    pdf.cell(140, 15, " GRAND TOTAL DUE:", 1, 0, 'R', fill=True)
-    pdf.cell(50, 15, f"Rs. {grand_total:,.2f}", 1, 1, 'R', fill=True)
-    return pdf.output(dest='S').encode('latin-1')
-
 # --- WEEKLY BILL RENDERER ---
-def _safe_get_rates(df_contractors, contractor_name, week_start_obj):
-    """Safely fetch mason/helper/ladies rates for a contractor on a given week.
-    Returns (rm, rh, rl) as floats, defaulting to 0 on any error."""
-    try:
-        rates = df_contractors[df_contractors["name"] == contractor_name].copy()
-        if rates.empty:
-            return 0.0, 0.0, 0.0
-        # Drop rows where effective_date is NaT / None
-        rates = rates.dropna(subset=["effective_date"])
-        if rates.empty:
-            return 0.0, 0.0, 0.0
-        rates = rates.sort_values("effective_date", ascending=False)
-        # Only compare dates to dates (both must be datetime.date)
-        valid = rates[rates["effective_date"].apply(
-            lambda d: d <= week_start_obj if isinstance(d, type(week_start_obj)) else False
-        )]
-        row = valid.iloc[0] if not valid.empty else rates.iloc[0]
-        return float(row["rate_mason"]), float(row["rate_helper"]), float(row["rate_ladies"])
-    except Exception:
-        return 0.0, 0.0, 0.0
-
-
-def _build_week_rows(df_sub, full_week_dates, rm, rh, rl):
-    """Build the 7-day row list and totals for one contractor+site block."""
-    # Build entry_map: date → record. Guard against NaT in date_dt.
-    entry_map = {}
-    for _, row in df_sub.iterrows():
-        dt_val = row.get("date_dt")
-        if pd.notna(dt_val):
-            try:
-                entry_map[dt_val.date()] = row
-            except Exception:
-                pass
-
-    rows = []
-    tm, th, tl, tamt = 0.0, 0.0, 0.0, 0.0
-    for day_date in full_week_dates:
-        if day_date in entry_map:
-            r = entry_map[day_date]
-            m = float(r.get("count_mason", 0) or 0)
-            h = float(r.get("count_helper", 0) or 0)
-            l = float(r.get("count_ladies", 0) or 0)
-            daily_cost = (m * rm) + (h * rh) + (l * rl)
-            if m == 0 and h == 0 and l == 0:
-                dm, dh, dl = "Nil", "Nil", "Nil"
-            else:
-                dm = str(int(m) if m == int(m) else m)
-                dh = str(int(h) if h == int(h) else h)
-                dl = str(int(l) if l == int(l) else l)
-        else:
-            m, h, l, daily_cost = 0.0, 0.0, 0.0, 0.0
-            dm, dh, dl = "-", "-", "-"
-        rows.append({"Date": day_date.strftime("%d-%m-%Y"), "Mason": dm, "Helper": dh, "Ladies": dl})
-        tm += m; th += h; tl += l; tamt += daily_cost
-
-    return rows, tm, th, tl, tamt
-
-
-def render_weekly_bill(df_entries, df_contractors):
-    # ── guard: no data ─────────────────────────────────────────────────────────
-    if df_entries.empty:
-        empty_state("📊", "No entries yet", "Start by logging daily attendance in the Daily Entry tab.")
-        return
-
+def render_weekly_bill(df_contractors, archive=None):
+    """The Weekly Bill for live data, or, given `archive` (the entries of an
+    uploaded backup), for that backup alone."""
     is_admin = (st.session_state["role"] == "admin")
-
-    # ── filter by assigned sites for non-admin users ───────────────────────────
-    if not is_admin:
-        assigned_raw = st.session_state.get("assigned_site", "")
-        if "All" not in assigned_raw and "None/All" not in assigned_raw:
-            user_sites = [s.strip() for s in assigned_raw.split(",")]
-            df_entries = df_entries[df_entries["site"].isin(user_sites)]
-            if df_entries.empty:
-                empty_state("🏗️", "No data for your sites", "Your assigned sites have no entries in this period.")
-                return
-
-    # ── parse dates ────────────────────────────────────────────────────────────
-    df_entries = df_entries.copy()
-    df_entries["date_dt"] = pd.to_datetime(df_entries["date"], errors="coerce")
-    df_entries = df_entries.dropna(subset=["date_dt"])
-    if df_entries.empty:
-        empty_state("📅", "No valid dates found", "Check that your entries have proper dates.")
+    sites = assigned_sites()
+
+    # ── list the weeks that have entries (for this user's sites) ───────────────
+    if archive is not None:
+        if "id" not in archive.columns:
+            archive = archive.assign(id=range(len(archive)))
+        df_archive = compact_entries(archive)
+        archive_weeks = week_keys(df_archive["date_dt"])
+        weeks = week_options(archive_weeks)
+        # Stands in for `sites` in the cache and download keys, so archive
+        # bills never share an entry with live ones.
+        sites = ("archive", int(pd.util.hash_pandas_object(df_archive[ENTRY_CORE_COLUMNS], index=False).sum()))
+    else:
+        with perf.span("week_labels"):
+            weeks = load_entry_weeks(sites)
+    if not weeks:
+        if sites is None:
+            empty_state("📊", "No entries yet", "Start by logging daily attendance in the Daily Entry tab.")
+        else:
+            empty_state("🏗️", "No data for your sites", "Your assigned sites have no entries in this period.")
         return
 
     # Ensure effective_date in contractors is always datetime.date (not Timestamp/NaT)
@@ -607,161 +922,360 @@ def render_weekly_bill(df_entries, df_contractors):
         df_contractors["effective_date"], errors="coerce"
     ).dt.date
 
-    # ── build week labels ──────────────────────────────────────────────────────
-    df_entries["start_date"] = df_entries["date_dt"].dt.date.apply(get_billing_start_date)
-    df_entries["week_label"] = df_entries["start_date"].apply(
-        lambda s: f"{s.strftime('%d-%m-%Y')} to {(s + timedelta(days=6)).strftime('%d-%m-%Y')}"
-    )
-
-    unique_weeks = (
-        df_entries[["start_date", "week_label"]]
-        .drop_duplicates()
-        .sort_values("start_date", ascending=False)
-    )
-    weeks = unique_weeks["week_label"].tolist()
-
     # ── week selector ──────────────────────────────────────────────────────────
     st.markdown("#### 📅 Select a Week to View")
     sel_week = st.selectbox(
-        "Billing Week", weeks,
+        "Billing Week", list(weeks),
         help="Each week runs Saturday → Friday. Select any week to see the full bill."
     )
     if not sel_week:
         return
 
-    df_week = df_entries[df_entries["week_label"] == sel_week].copy()
-    week_start_obj = df_week.iloc[0]["start_date"]   # datetime.date
+    # ── load just that week ────────────────────────────────────────────────────
+    if archive is not None:
+        df_week = df_archive[archive_weeks == weeks[sel_week]].reset_index(drop=True)
+    else:
+        df_week = load_week_entries(weeks[sel_week], sites)
+    if df_week.empty:
+        empty_state("📅", "No entries in this week", "They may have just been deleted — pick another week.")
+        return
+    week_start_obj = week_start(weeks[sel_week])     # datetime.date (Saturday)
     full_week_dates = [week_start_obj + timedelta(days=i) for i in range(7)]
 
     if is_admin:
-        csv_data = df_week.to_csv(index=False).encode("utf-8")
         st.download_button(
-            "📊 Download Week Data (CSV)", csv_data,
-            f"Data_{sel_week}.csv", "text/csv",
+            "📊 Download Week Data (CSV)",
+            lazy_artifact(("week_csv", weeks[sel_week], sites),
+                          lambda: exports.csv_bytes(exports.frame_chunks(df_week))),
+            f"Data_{sel_week}.csv", "text/csv", on_click="ignore",
             help="Download all raw entries for this week as a CSV/Excel file."
         )
         st.divider()
 
-    # ── two view tabs (NO st.stop() inside tabs — use early return guards) ─────
-    tab_site, tab_con = st.tabs(["🏢 View by Site", "👷 View by Contractor"])
+    # ── one view at a time ─────────────────────────────────────────────────────
+    # st.tabs would run both views' bodies (rates, rows, PDF data) on every
+    # rerun; the segmented control runs only the one on screen.
+    _weekly_bill_view(df_week, df_contractors, sel_week, weeks[sel_week], sites, is_admin, full_week_dates)
+
+BILL_VIEWS = {
+    # view label: (grouped by, bill blocks per, pill label, pill key, heading icon, block icon)
+    "🏢 View by Site": ("site", "contractor", "Select a Site", "sb_site", "📍", "👷"),
+    "👷 View by Contractor": ("contractor", "site", "Select a Contractor", "sb_con", "👷", "📍"),
+}
+
+def _week_bill(df_week, df_contractors, week_key, sites, full_week_dates):
+    """Per-session state shared by both Weekly Bill views for one week: the
+    (site, contractor) row positions, found with one groupby, plus every rate
+    lookup and block built so far. Switching views or pills reuses them; a
+    write (data_version), another week or a reloaded df_week starts afresh.
+    The positions belong to this exact frame, so it is kept alongside them:
+    a TTL reload can bring back different rows under the same key."""
+    key = (week_key, sites, data_version())
+    state = st.session_state.get("_week_bill")
+    if state is None or state["key"] != key or state["frame"] is not df_week:
+        with perf.span("bill_groups"):
+            groups = df_week.groupby(["site", "contractor"], observed=True, sort=False).indices
+        state = st.session_state["_week_bill"] = {"key": key, "frame": df_week, "groups": groups,
+                                                  "rates": {}, "blocks": {}}
+    return state
+
+def _bill_block(state, df_week, df_contractors, site, contractor, full_week_dates):
+    """{rows, totals, rates} for one site + contractor of the week (cached in state)."""
+    block = state["blocks"].get((site, contractor))
+    if block is None:
+        with perf.span("bill_rows"):
+            if contractor not in state["rates"]:
+                state["rates"][contractor] = _safe_get_rates(df_contractors, contractor, full_week_dates[0])
+            rm, rh, rl = state["rates"][contractor]
+            df_sub = df_week.iloc[state["groups"][(site, contractor)]]
+            rows, tm, th, tl, tamt = _build_week_rows(df_sub, full_week_dates, rm, rh, rl)
+        block = state["blocks"][(site, contractor)] = {
+            "rows": rows, "totals": {"m": tm, "h": th, "l": tl, "amt": tamt}, "rates": {"rm": rm, "rh": rh, "rl": rl},
+        }
+    return block
 
-    # ════════════════════════════════
-    # TAB A — View by Site
-    # ════════════════════════════════
-    with tab_site:
-        all_sites = sorted(df_week["site"].dropna().unique().tolist())
-        if not all_sites:
-            empty_state("🏗️", "No sites found for this week")
-        else:
-            sel_site = st.pills(
-                "Select a Site", all_sites,
-                key=f"sb_site_{sel_week}",          # week-scoped key — avoids stale key clash
-                default=all_sites[0]
-            )
-            if sel_site:
-                st.divider()
-                st.markdown(f"### 📍 {sel_site}")
-                df_view = df_week[df_week["site"] == sel_site]
-                pdf_data = []
-
-                for con_name in df_view["contractor"].dropna().unique():
-                    df_sub = df_view[df_view["contractor"] == con_name]
-                    rm, rh, rl = _safe_get_rates(df_contractors, con_name, week_start_obj)
-                    rows, tm, th, tl, tamt = _build_week_rows(df_sub, full_week_dates, rm, rh, rl)
-                    pdf_data.append({
-                        "name": con_name, "rows": rows,
-                        "totals": {"m": tm, "h": th, "l": tl, "amt": tamt},
-                        "rates": {"rm": rm, "rh": rh, "rl": rl}
-                    })
-
-                    st.markdown(f"#### 👷 {con_name}")
-                    if rm == 0 and rh == 0 and rl == 0:
-                        st.caption("⚠️ No rates found for this contractor — amounts show as ₹0. Add rates in the Contractors tab.")
-                    if is_admin:
-                        k1, k2, k3, k4 = st.columns(4)
-                        k1.metric("💰 Amount Payable", f"₹{tamt:,.0f}")
-                        k2.metric("🧱 Mason Shifts", f"{tm:g}")
-                        k3.metric("🛠️ Helper Shifts", f"{th:g}")
-                        k4.metric("👩 Ladies Shifts", f"{tl:g}")
-                    else:
-                        k2, k3, k4 = st.columns(3)
-                        k2.metric("🧱 Mason Shifts", f"{tm:g}")
-                        k3.metric("🛠️ Helper Shifts", f"{th:g}")
-                        k4.metric("👩 Ladies Shifts", f"{tl:g}")
+COMPACT_BILL_BLOCKS = 6    # more blocks than this start in the compact summary
 
-                    with st.expander(f"📄 Day-by-Day: {con_name}"):
-                        st.caption("— = no entry submitted. Nil = holiday/no-work entry submitted.")
-                        st.dataframe(pd.DataFrame(rows), width='stretch', hide_index=True)
+def _no_rates(block):
+    r = block["rates"]
+    return r["rm"] == 0 and r["rh"] == 0 and r["rl"] == 0
 
-                if pdf_data:
-                    try:
-                        pdf_bytes = generate_pdf_bytes(sel_site, sel_week, pdf_data)
-                        st.download_button(
-                            f"⬇️ Download PDF Bill — {sel_site}", pdf_bytes,
-                            f"Bill_{sel_site}.pdf", "application/pdf",
-                            help="Formatted PDF bill for all contractors at this site."
-                        )
-                    except Exception as e:
-                        st.warning(f"⚠️ Could not generate PDF: {e}")
-
-    # ════════════════════════════════
-    # TAB B — View by Contractor
-    # ════════════════════════════════
-    with tab_con:
-        all_cons = sorted(df_week["contractor"].dropna().unique().tolist())
-        if not all_cons:
-            empty_state("👷", "No contractors found for this week")
+def _bill_block_detail(block, block_icon, is_admin):
+    """One bill block in full: heading, shift/amount metrics and the day grid."""
+    t = block["totals"]
+    st.markdown(f"#### {block_icon} {block['name']}")
+    if _no_rates(block):
+        st.caption("⚠️ No rates found for this contractor — amounts show as ₹0. Add rates in the Contractors tab.")
+    if is_admin:
+        k1, k2, k3, k4 = st.columns(4)
+        k1.metric("💰 Amount Payable", f"₹{t['amt']:,.0f}")
+    else:
+        k2, k3, k4 = st.columns(3)
+    k2.metric("🧱 Mason Shifts", f"{t['m']:g}")
+    k3.metric("🛠️ Helper Shifts", f"{t['h']:g}")
+    k4.metric("👩 Ladies Shifts", f"{t['l']:g}")
+
+    with st.expander(f"📄 Day-by-Day: {block['name']}"):
+        st.caption("— = no entry submitted. Nil = holiday/no-work entry submitted.")
+        st.dataframe(pd.DataFrame(block["rows"]), width='stretch', hide_index=True)
+
+def _bill_summary(blocks, block_col, block_icon, is_admin):
+    """Compact bill: one row per block (shifts, amount), then the day grid of
+    a single block picked from a list."""
+    summary = pd.DataFrame({
+        f"{block_icon} {block_col.title()}": [b["name"] for b in blocks],
+        "🧱 Mason": [b["totals"]["m"] for b in blocks],
+        "🛠️ Helper": [b["totals"]["h"] for b in blocks],
+        "👩 Ladies": [b["totals"]["l"] for b in blocks],
+    })
+    if is_admin:
+        summary["💰 Amount (₹)"] = [b["totals"]["amt"] for b in blocks]
+    summary["Note"] = ["⚠️ No rates — ₹0" if _no_rates(b) else "" for b in blocks]
+    if not summary["Note"].any():
+        summary = summary.drop(columns=["Note"])
+    if is_admin:
+        st.metric("💰 Total Payable", f"₹{sum(b['totals']['amt'] for b in blocks):,.0f}")
+    st.dataframe(summary, width='stretch', hide_index=True,
+                 column_config={"💰 Amount (₹)": st.column_config.NumberColumn(format="₹%.0f")})
+
+    names = [b["name"] for b in blocks]
+    pick = st.selectbox(f"📄 Day-by-Day for a {block_col.title()}", names, index=None,
+                        placeholder=f"Select a {block_col}...")
+    if pick:
+        _bill_block_detail(blocks[names.index(pick)], block_icon, is_admin)
+
+@st.fragment
+def _weekly_bill_view(df_week, df_contractors, sel_week, week_key, sites, is_admin, full_week_dates):
+    """The Weekly Bill below the week picker: view switch, pills and bill
+    blocks. A fragment, so switching view or pill reruns only this part."""
+    view = st.segmented_control("View", list(BILL_VIEWS), default=list(BILL_VIEWS)[0], required=True,
+                                key="bill_view", label_visibility="collapsed")
+    group_col, block_col, pill_label, pill_key, icon, block_icon = BILL_VIEWS[view or list(BILL_VIEWS)[0]]
+    state = _week_bill(df_week, df_contractors, week_key, sites, full_week_dates)
+
+    options = sorted({key[0 if group_col == "site" else 1] for key in state["groups"]})
+    if not options:
+        empty_state("🏗️" if group_col == "site" else "👷", f"No {group_col}s found for this week")
+        return
+    selected = st.pills(
+        pill_label, options,
+        key=f"{pill_key}_{sel_week}",          # week-scoped key — avoids stale key clash
+        default=options[0]
+    )
+    if not selected:
+        return
+    st.divider()
+    st.markdown(f"### {icon} {selected}")
+    pdf_data = []
+
+    pairs = [(s, c) for s, c in state["groups"] if (s if group_col == "site" else c) == selected]
+    for site, contractor in pairs:
+        name = contractor if block_col == "contractor" else site
+        pdf_data.append({"name": name, **_bill_block(state, df_week, df_contractors, site, contractor, full_week_dates)})
+
+    # Per-block headings, metrics and expanders come to hundreds of elements
+    # for a big site; the compact table is one element plus one drill-down.
+    compact = st.toggle("📋 Compact summary", value=len(pdf_data) > COMPACT_BILL_BLOCKS,
+                        help="One table of shifts and amounts, with the day-by-day grid for one pick at a time. Faster on phones and for large sites.")
+    with perf.span("render_widgets"):
+        if compact:
+            _bill_summary(pdf_data, block_col, block_icon, is_admin)
         else:
-            sel_con = st.pills(
-                "Select a Contractor", all_cons,
-                key=f"sb_con_{sel_week}",           # week-scoped key
-                default=all_cons[0]
-            )
-            if sel_con:
-                st.divider()
-                st.markdown(f"### 👷 {sel_con}")
-                df_view = df_week[df_week["contractor"] == sel_con]
-                pdf_data = []
-
-                for site_name in df_view["site"].dropna().unique():
-                    df_sub = df_view[df_view["site"] == site_name]
-                    rm, rh, rl = _safe_get_rates(df_contractors, sel_con, week_start_obj)
-                    rows, tm, th, tl, tamt = _build_week_rows(df_sub, full_week_dates, rm, rh, rl)
-                    pdf_data.append({
-                        "name": site_name, "rows": rows,
-                        "totals": {"m": tm, "h": th, "l": tl, "amt": tamt},
-                        "rates": {"rm": rm, "rh": rh, "rl": rl}
-                    })
-
-                    st.markdown(f"#### 📍 {site_name}")
-                    if rm == 0 and rh == 0 and rl == 0:
-                        st.caption("⚠️ No rates found — amounts show as ₹0. Add rates in the Contractors tab.")
-                    if is_admin:
-                        k1, k2, k3, k4 = st.columns(4)
-                        k1.metric("💰 Amount Payable", f"₹{tamt:,.0f}")
-                        k2.metric("🧱 Mason Shifts", f"{tm:g}")
-                        k3.metric("🛠️ Helper Shifts", f"{th:g}")
-                        k4.metric("👩 Ladies Shifts", f"{tl:g}")
-                    else:
-                        k2, k3, k4 = st.columns(3)
-                        k2.metric("🧱 Mason Shifts", f"{tm:g}")
-                        k3.metric("🛠️ Helper Shifts", f"{th:g}")
-                        k4.metric("👩 Ladies Shifts", f"{tl:g}")
+            for block in pdf_data:
+                _bill_block_detail(block, block_icon, is_admin)
 
-                    with st.expander(f"📄 Day-by-Day: {site_name}"):
-                        st.caption("— = no entry submitted. Nil = holiday/no-work entry submitted.")
-                        st.dataframe(pd.DataFrame(rows), width='stretch', hide_index=True)
+    if pdf_data:
+        st.download_button(
+            f"⬇️ Download PDF Bill — {selected}",
+            lazy_artifact(("bill_pdf", group_col, selected, week_key, sites),
+                          lambda: generate_pdf_bytes(selected, sel_week, pdf_data)),
+            f"Bill_{selected}.pdf", "application/pdf", on_click="ignore",
+            help="Formatted PDF bill for all contractors at this site." if group_col == "site"
+                 else "Formatted PDF bill for this contractor across all sites."
+        )
 
-                if pdf_data:
-                    try:
-                        pdf_bytes = generate_pdf_bytes(sel_con, sel_week, pdf_data)
-                        st.download_button(
-                            f"⬇️ Download PDF Bill — {sel_con}", pdf_bytes,
-                            f"Bill_{sel_con}.pdf", "application/pdf",
-                            help="Formatted PDF bill for this contractor across all sites."
-                        )
-                    except Exception as e:
-                        st.warning(f"⚠️ Could not generate PDF: {e}")
+# --- DAY SHEET (BULK DAILY ENTRY) ---
+def render_day_sheet(day, site, df_con):
+    """Daily Entry's Day Sheet mode: every active contractor for one site and
+    date in one grid, saved with a single upsert (see day_sheet.py)."""
+    try:
+        existing = pd.DataFrame(supabase.table("entries")
+                                .select("id, contractor, count_mason, count_helper, count_ladies, work_description")
+                                .eq("date", str(day)).eq("site", site).execute().data)
+    except Exception:
+        st.error("⚠️ Could not load this day's entries. Check your connection and try again.")
+        return
+
+    active = []
+    if not df_con.empty:
+        active_df = df_con[df_con["status"] != "Inactive"] if "status" in df_con.columns else df_con
+        active = sorted(active_df["name"].unique().tolist())
+    sheet = day_sheet.build_sheet(active, existing)
+    if sheet.empty:
+        empty_state("👷", "No contractors yet", "Ask your admin to add contractors before logging entries.")
+        return
+    rates = day_sheet.rates_on(labour_report.rate_timeline(df_con), day)
+
+    st.markdown("""<div class='step-card'><div class='step-label'>Step 2 — Fill in the Day Sheet</div></div>""", unsafe_allow_html=True)
+    st.caption(f"One row per contractor for **{site}** on **{day.strftime('%d %b %Y')}**, pre-filled with what's already saved. "
+               "Leave a row at 0 to skip it; tick Holiday for a nil entry. Use 0.5 for half-day workers.")
+    editor_key = f"day_sheet_{site}_{day}"
+    count_col = lambda label, help_text: st.column_config.NumberColumn(label, min_value=0.0, step=0.5, format="%g", help=help_text)
+    edited = st.data_editor(
+        sheet, key=editor_key, hide_index=True, width='stretch', disabled=["Contractor"], num_rows="fixed",
+        column_config={
+            "Contractor": st.column_config.TextColumn("👷 Contractor"),
+            "Masons": count_col("🧱 Masons", "Number of mason workers."),
+            "Helpers": count_col("🛠️ Helpers", "Number of helper workers."),
+            "Ladies": count_col("👩 Ladies", "Number of ladies workers."),
+            "Holiday": st.column_config.CheckboxColumn("⛔ Holiday", help="No work today: saved as a nil entry."),
+            "Work Description": st.column_config.TextColumn("📝 Work Description", width="large"),
+        },
+    )
+
+    rows, changes = day_sheet.sheet_payload(edited, sheet, day, site, rates)
+    unrated = changes.loc[~changes["has_rate"] & (changes["total_cost"] == 0) &
+                          (changes[["count_mason", "count_helper", "count_ladies"]].sum(axis=1) > 0), "contractor"]
+    if not unrated.empty:
+        st.warning(f"⚠️ No rate found on this date for: {', '.join(unrated)}. Their entries will be saved with ₹0 cost. Please check contractor rates.")
+    if rows:
+        summary = f"📋 **{len(rows)}** row{'s' if len(rows) > 1 else ''} to save"
+        if st.session_state["role"] == "admin":
+            summary += f" · 💰 ₹{changes['total_cost'].sum():,.2f}"
+        st.markdown(summary)
+    else:
+        st.caption("No changes yet. Clearing a saved row sets it to zero; delete entries from Site Logs.")
+
+    if st.button("💾 Save Day Sheet", type="primary", width='stretch', disabled=not rows):
+        try:
+            with perf.span("day_sheet:upsert", rows=len(rows)):
+                supabase.table("entries").upsert(rows, on_conflict=day_sheet.ON_CONFLICT).execute()
+        except write_queue.NETWORK_ERRORS:
+            # The upsert is keyed, so sending it again can't create duplicates.
+            queue_write("entries", rows, f"Day sheet for {site} on {day.strftime('%d-%m-%Y')}")
+            st.warning("📤 Couldn't reach the server. The day sheet is kept on this device and will be saved automatically when the connection is back (see the sidebar).")
+            time.sleep(2)
+            st.rerun()
+        except Exception as e:
+            if day_sheet.is_missing_constraint(e):
+                st.error("⚠️ Database Setup Required: entries needs a unique (date, site, contractor) key. Run sql/day_sheet.sql in the Supabase SQL editor.")
+            else:
+                st.error(f"⚠️ Could not save the day sheet: {e}")
+            return
+        invalidate_entries()
+        st.session_state.pop(editor_key, None)
+        st.success(f"✅ Day sheet saved: {len(rows)} entr{'ies' if len(rows) > 1 else 'y'} for {site}.")
+        time.sleep(1)
+        st.rerun()
+
+# --- MATERIALS LOG (PERIOD VIEW) ---
+@st.fragment
+def render_materials_log(sel_site, df_mat, weeks):
+    """Materials page below the site picker: period filter, PDF, receipt
+    gallery and the per-category forms and logs. A fragment, so changing the
+    View Period reruns only this part; saves still rerun the whole app."""
+    st.markdown("### 📅 Filter by Time Period")
+    sel_week = st.selectbox("View Period", ["All Time"] + list(weeks),
+                            help="Filter the material view and PDF report to a specific week, or view everything.")
+
+    if sel_week != "All Time" and not df_mat.empty:
+        df_mat_filtered = df_mat[df_mat["week_key"] == weeks[sel_week]].copy()
+    else:
+        df_mat_filtered = df_mat.copy()
+
+    if not df_mat_filtered.empty:
+        st.download_button(
+            label="⬇️ Download Material Report (PDF)",
+            data=lazy_artifact(("materials_pdf", sel_site, sel_week),
+                               lambda: generate_material_pdf_bytes(sel_site, sel_week, df_mat_filtered)),
+            file_name=f"Materials_{sel_site}_{sel_week.replace(' ', '_')}.pdf",
+            mime="application/pdf",
+            type="primary", on_click="ignore",
+            help="Download a formatted PDF report of all materials for this site and time period."
+        )
+    else:
+        st.info("ℹ️ No records in this period — no PDF to generate yet.")
+
+    if "receipt_url" in df_mat_filtered.columns and st.toggle("🧾 Show Receipt Gallery", key="mat_gallery"):
+        df_rec = df_mat_filtered.sort_values("date_dt", ascending=False)
+        evidence_gallery(zip(df_rec["receipt_url"], df_rec["date_dt"].dt.strftime("%d-%m-%Y") + " · " + df_rec["material_name"].astype(str)),
+                         key="mat_gallery")
+
+    st.divider()
+
+    categories = bulk_import.MATERIAL_CATEGORIES
+    mat_tabs = st.tabs(categories)
+
+    for i, cat in enumerate(categories):
+        with mat_tabs[i]:
+            st.markdown(f"### ➕ Log New {cat} Entry")
+            st.caption(f"Fill in the details below to log a new {cat} purchase for **{sel_site}**.")
+            with st.form(f"form_{cat}"):
+                c1, c2, c3 = st.columns(3)
+                m_date = c1.date_input("📅 Purchase Date", date.today(), format="DD-MM-YYYY", key=f"d_{cat}")
+                m_vendor = c2.text_input("🏪 Vendor Name", key=f"v_{cat}", placeholder="e.g. ABC Suppliers")
+                m_material = c3.text_input("📦 Material Description", key=f"m_{cat}", placeholder="e.g. Cement (50kg bags)")
+                c4, c5 = st.columns(2)
+                m_qty = c4.number_input("📏 Quantity", min_value=0.0, step=1.0, key=f"q_{cat}", help="Number of units purchased.")
+                m_amt = c5.number_input("💰 Total Amount (₹)", min_value=0.0, step=100.0, key=f"a_{cat}", help="Total purchase amount in Rupees.")
+                m_receipt = st.file_uploader("🧾 Attach Bill/Receipt (Optional)", type=["jpg", "jpeg", "png"], key=f"rec_{cat}",
+                                             help="Upload a photo of the bill or receipt for documentation.")
+
+                if st.form_submit_button("💾 Save Material Entry", type="primary", width='stretch'):
+                    if not m_vendor.strip():
+                        st.error("⚠️ Vendor name is required.")
+                    elif not m_material.strip():
+                        st.error("⚠️ Material description is required.")
+                    else:
+                        receipt_link = pending_upload_marker() if m_receipt else ""
+                        load = {
+                            "date": str(m_date), "site": sel_site, "category": cat,
+                            "vendor": m_vendor.strip(), "material_name": m_material.strip(),
+                            "quantity": m_qty, "amount": m_amt, "receipt_url": receipt_link,
+                        }
+                        # Sent with the first attempt only where the column
+                        # exists; without it the plain insert still works and
+                        # a queued copy gets its key in queue_write().
+                        if has_column("materials", "client_key"):
+                            load["client_key"] = write_queue.new_key()
+                        row_id = None
+                        try:
+                            row_id = supabase.table("materials").insert(load).execute().data[0]["id"]
+                        except write_queue.NETWORK_ERRORS:
+                            # Synced later as an upsert on client_key, so
+                            # it can't be stored twice.
+                            queue_write("materials", [load], f"{cat}: {m_material.strip()} ({m_date.strftime('%d-%m-%Y')})",
+                                        upload=(receipt_link, m_receipt, "receipt") if m_receipt else None)
+                            st.warning("📤 Couldn't reach the server. This entry is kept on this device and will be saved automatically when the connection is back (see the sidebar).")
+                            time.sleep(2)
+                            st.rerun()
+                        except Exception:
+                            st.error("⚠️ Failed to save. Check your database connection.")
+                        if row_id is not None:
+                            if m_receipt:
+                                queue_evidence_upload(f"Receipt for {m_material.strip()}", "materials", "receipt_url",
+                                                      row_id, receipt_link, m_receipt, profile="receipt")
+                            data_changed()
+                            st.success(f"✅ {cat} entry saved successfully!")
+                            time.sleep(1)
+                            st.rerun()
+
+            st.markdown("---")
+            st.markdown(f"### 📋 {cat} Log — {sel_week}")
+            if not df_mat_filtered.empty:
+                df_cat = df_mat_filtered[df_mat_filtered["category"] == cat].copy()
+                if not df_cat.empty:
+                    df_cat = df_cat.sort_values("date_dt", ascending=False)
+                    total_spent = df_cat["amount"].sum()
+                    st.metric(f"Total Spent on {cat}", f"₹{total_spent:,.2f}")
+                    display_df = df_cat[["date", "vendor", "material_name", "quantity", "amount"]].rename(
+                        columns={"date": "Date", "vendor": "Vendor", "material_name": "Material", "quantity": "Qty", "amount": "Amount (₹)"}
+                    )
+                    st.dataframe(display_df, width='stretch', hide_index=True)
+                else:
+                    empty_state("📦", f"No {cat} logged", f"Log a new {cat} entry using the form above.")
+            else:
+                empty_state("📦", "No materials logged yet", f"Use the form above to add your first {cat} entry for {sel_site}.")
 
 # --- 6. AUTO-LOGIN CHECK ---
 if "logged_in" not in st.session_state:
@@ -897,7 +1411,7 @@ if not st.session_state["logged_in"]:
 # --- 8. SIDEBAR: USER PANEL + NAVIGATION ---
 tabs = ["📝 Daily Entry", "📊 Weekly Bill", "🧱 Materials", "📓 My Diary"]
 if st.session_state["role"] == "admin":
-    tabs += ["📈 Dashboard", "🧾 Client Invoice", "📑 Custom Labour Report", "🔍 Site Logs", "📍 Sites", "👷 Contractors", "👥 Users", "📂 Archive & Recovery", "🔎 Search Results"]
+    tabs += ["📈 Dashboard", "🧾 Client Invoice", "📑 Custom Labour Report", "🔍 Site Logs", "📍 Sites", "👷 Contractors", "👥 Users", "📂 Archive & Recovery", "📥 Bulk Import", "⏱️ Performance", "🔎 Search Results"]
 
 if "current_tab" not in st.session_state or st.session_state["current_tab"] not in tabs:
     # If we have a restored tab from cookie (post background-switch reload), use it
@@ -907,7 +1421,30 @@ if "current_tab" not in st.session_state or st.session_state["current_tab"] not
     else:
         st.session_state["current_tab"] = tabs[0]
 
-with st.sidebar:
+# Span tracing for this rerun (admin Performance tab). Turned on for every
+# session with LABOURPRO_PERF=1 / [general] perf_tracing = true, or per session
+# from the Performance tab. Off means no recorder is attached at all. Memory
+# profiling (tracemalloc) is a heavier, separate opt-in that implies tracing.
+def _mem_profiling():
+    return bool(st.session_state.get("_mem_on")) or os.environ.get("LABOURPRO_MEMPROFILE") == "1"
+
+def _perf_enabled():
+    if st.session_state.get("_perf_on"):
+        return True
+    if os.environ.get("LABOURPRO_PERF") == "1":
+        return True
+    try:
+        return bool(st.secrets["general"].get("perf_tracing", False))
+    except Exception:
+        return False
+
+if _perf_enabled() or _mem_profiling():
+    perf.attach(st.session_state.setdefault("_perf_recorder", perf.Recorder()), st.session_state["current_tab"],
+                memory=_mem_profiling())
+else:
+    perf.detach()
+
+with st.sidebar, perf.span("sidebar"):
     st.markdown("""
         <div style='text-align:center; padding: 1rem 0 0.5rem 0;'>
             <div style='font-size:2rem;'>🏗️</div>
@@ -969,6 +1506,8 @@ with st.sidebar:
         _cookie_set("active_tab", _cur, expires_at=datetime.now() + timedelta(days=30))
         st.session_state["_last_saved_tab"] = _cur
 
+    pending_uploads_panel()
+    pending_writes_panel()
     st.divider()
 
     # PIN change for regular users
@@ -980,6 +1519,7 @@ with st.sidebar:
                 if len(new_pin) == 4 and new_pin.isdigit():
                     try:
                         supabase.table("users").update({"mpin": new_pin}).eq("phone", st.session_state["phone"]).execute()
+                        data_changed()
                         st.success("✅ PIN Updated! Use the new PIN on your next login.")
                     except:
                         st.error("⚠️ Error updating PIN. Please try again.")
@@ -1020,23 +1560,23 @@ def page_header(title, subtitle=""):
 # ==============================================================================
 if current_tab == "📝 Daily Entry":
     page_header("📝 Daily Entry", "Log today's workforce attendance — select a site and contractor to begin")
-    df_sites = fetch_data("sites")
+    # The assignment is re-read from the users table here (not the session) so
+    # an admin's change applies to Daily Entry without the user logging out.
+    user_sites = None
+    if st.session_state["role"] != "admin":
+        u = supabase.table("users").select("assigned_site").eq("phone", st.session_state["phone"]).single().execute()
+        if u.data and u.data.get("assigned_site"):
+            user_sites = parse_assigned_sites(u.data["assigned_site"])
+        else:
+            st.error("⚠️ You have not been assigned to any site. Contact your admin.")
+            st.stop()
+    df_sites = fetch_data("sites", filters=site_filter(user_sites, "name"))
     df_con = fetch_data("contractors")
 
-    if df_sites.empty:
+    if df_sites.empty and user_sites is None:
         empty_state("🏗️", "No sites available", "Ask your admin to add construction sites before you can log entries.")
     else:
-        av_sites = df_sites["name"].unique().tolist()
-        if st.session_state["role"] != "admin":
-            u = supabase.table("users").select("assigned_site").eq("phone", st.session_state["phone"]).single().execute()
-            if u.data and u.data.get("assigned_site"):
-                raw_assignments = u.data.get("assigned_site", "")
-                assigned_list = [s.strip() for s in raw_assignments.split(",")]
-                if "None/All" not in assigned_list and "All" not in assigned_list:
-                    av_sites = [s for s in av_sites if s in assigned_list]
-            else:
-                st.error("⚠️ You have not been assigned to any site. Contact your admin.")
-                st.stop()
+        av_sites = df_sites["name"].unique().tolist() if not df_sites.empty else []
 
         if not av_sites:
             empty_state("🔗", "No active sites assigned", "Your assigned sites may have been removed. Contact your admin.")
@@ -1048,6 +1588,10 @@ if current_tab == "📝 Daily Entry":
         _saved_site = _cookie_get("last_site")
         _saved_con  = _cookie_get("last_contractor")
 
+        entry_mode = st.radio("Entry Mode", ["👷 Single Entry", "📋 Day Sheet"], horizontal=True, key="entry_mode",
+                              help="Day Sheet: every contractor at one site for one day in a single grid, saved in one go.")
+        bulk = entry_mode == "📋 Day Sheet"
+
         st.markdown("""<div class='step-card'><div class='step-label'>Step 1 — Choose Entry Details</div></div>""", unsafe_allow_html=True)
         c1, c2, c3 = st.columns(3)
         dt = c1.date_input("📅 Date", date.today(), format="DD-MM-YYYY", help="Select the date for this work entry.")
@@ -1064,7 +1608,7 @@ if current_tab == "📝 Daily Entry":
                 con_sel_options = df_con["name"].unique().tolist()
 
         _con_idx = con_sel_options.index(_saved_con) if _saved_con and _saved_con in con_sel_options else None
-        con_sel = c3.selectbox("👷 Contractor", con_sel_options, index=_con_idx, placeholder="Select a contractor...", help="Choose the contractor whose workers you are logging.")
+        con_sel = None if bulk else c3.selectbox("👷 Contractor", con_sel_options, index=_con_idx, placeholder="Select a contractor...", help="Choose the contractor whose workers you are logging.")
 
         # Persist selections to cookies only when value actually changes
         if st_sel and st_sel != _saved_site:
@@ -1072,7 +1616,12 @@ if current_tab == "📝 Daily Entry":
         if con_sel and con_sel != _saved_con:
             _cookie_set("last_contractor", con_sel, expires_at=datetime.now() + timedelta(days=7))
 
-        if not st_sel or not con_sel:
+        if bulk:
+            if st_sel:
+                render_day_sheet(dt, st_sel, df_con)
+            else:
+                st.info("👆 Please select a **Site** above to continue.")
+        elif not st_sel or not con_sel:
             st.info("👆 Please select a **Site** and **Contractor** above to continue.")
         else:
             # Check for existing entry
@@ -1162,7 +1711,9 @@ if current_tab == "📝 Daily Entry":
                 st.markdown("""<div class='step-card'><div class='step-label'>Step 4 (Optional) — Upload Site Photo</div></div>""", unsafe_allow_html=True)
                 uploaded_photo = st.file_uploader("📸 Upload a site photo or evidence", type=["jpg", "jpeg", "png", "webp"],
                                                   help="Optional. Attach a photo of the work done today for documentation.")
-                if exist and exist.get("photo_url") and not uploaded_photo:
+                if exist and is_pending_upload(exist.get("photo_url")) and not uploaded_photo:
+                    st.caption("⏳ This entry's photo is still uploading. Upload a new one above to replace it.")
+                elif exist and exist.get("photo_url") and not uploaded_photo:
                     st.caption("📎 An existing photo is already attached. Upload a new one above to replace it.")
 
             # Save Button
@@ -1171,8 +1722,8 @@ if current_tab == "📝 Daily Entry":
             if st.button(btn_label, type="primary", width='stretch'):
                 photo_link = ""
                 if uploaded_photo:
-                    with st.spinner("Uploading photo... please wait"):
-                        photo_link = upload_evidence(uploaded_photo)
+                    # Saved now, uploaded in the background (queue_evidence_upload)
+                    photo_link = pending_upload_marker()
                 elif exist and exist.get("photo_url"):
                     photo_link = exist.get("photo_url")
 
@@ -1182,17 +1733,34 @@ if current_tab == "📝 Daily Entry":
                     "total_cost": cost, "work_description": wdesc,
                     "photo_url": photo_link
                 }
+                saved = False
                 try:
                     if mode == "new":
-                        supabase.table("entries").insert(load).execute()
-                        st.success("✅ Entry saved successfully!")
+                        row_id = supabase.table("entries").insert(load).execute().data[0]["id"]
                     else:
                         supabase.table("entries").update(load).eq("id", exist["id"]).execute()
-                        st.success("✅ Entry updated successfully!")
+                        row_id = exist["id"]
+                    saved = True
+                except write_queue.NETWORK_ERRORS:
+                    # Kept on this device and synced from the sidebar; the
+                    # sync upserts on (date, site, contractor), so an insert
+                    # that did reach the database isn't duplicated.
+                    queue_write("entries", [load], f"{con_sel} at {st_sel} on {dt.strftime('%d-%m-%Y')}",
+                                upload=(photo_link, uploaded_photo, "photo") if uploaded_photo else None)
+                    st.warning("📤 Couldn't reach the server. This entry is kept on this device and will be saved automatically when the connection is back (see the sidebar).")
+                    time.sleep(2)
+                    st.rerun()
+                except Exception as e:
+                    st.error(f"⚠️ Could not save this entry: {e}")
+                if saved:
+                    st.success("✅ Entry saved successfully!" if mode == "new" else "✅ Entry updated successfully!")
+                    if uploaded_photo:
+                        queue_evidence_upload(f"Photo for {con_sel} on {dt.strftime('%d-%m-%Y')}", "entries", "photo_url",
+                                              row_id, photo_link, uploaded_photo)
+                        st.caption("📸 The photo is uploading in the background.")
+                    invalidate_entries()
                     time.sleep(1)
                     st.rerun()
-                except Exception:
-                    st.warning("⚠️ Network timeout while saving. Please click 'Save' again.")
 
     # Recent entries (admin only)
     if st.session_state["role"] == "admin":
@@ -1204,7 +1772,7 @@ if current_tab == "📝 Daily Entry":
             if response.data:
                 df_recent = pd.DataFrame(response.data)
                 if "photo_url" in df_recent.columns:
-                    df_recent["has_photo"] = df_recent["photo_url"].apply(lambda x: "📸 Yes" if x else "—")
+                    df_recent["has_photo"] = df_recent["photo_url"].map(evidence_badge)
                     cols_to_show = ["date", "site", "contractor", "total_cost", "work_description", "has_photo"]
                 else:
                     cols_to_show = ["date", "site", "contractor", "total_cost", "work_description"]
@@ -1222,27 +1790,19 @@ if current_tab == "📝 Daily Entry":
 # ==============================================================================
 elif current_tab == "📊 Weekly Bill":
     page_header("📊 Weekly Bill", "View weekly labour bills by site or contractor — download as PDF")
-    try:
-        df_entries = fetch_data("entries")
-    except:
-        df_entries = pd.DataFrame()
-    render_weekly_bill(df_entries, fetch_data("contractors"))
+    render_weekly_bill(fetch_data("contractors"))
 
 # ==============================================================================
 # TAB 3: MATERIALS
 # ==============================================================================
 elif current_tab == "🧱 Materials":
     page_header("🧱 Materials", "Track material purchases by site and category")
-    df_sites = fetch_data("sites")
-    if df_sites.empty:
+    user_sites = assigned_sites()
+    df_sites = fetch_data("sites", filters=site_filter(user_sites, "name"))
+    if df_sites.empty and user_sites is None:
         empty_state("🏗️", "No sites found", "Ask your admin to add sites before logging materials.")
     else:
-        av_sites = df_sites["name"].unique().tolist()
-        if st.session_state["role"] != "admin":
-            assigned_raw = st.session_state.get("assigned_site", "")
-            if "All" not in assigned_raw and "None/All" not in assigned_raw:
-                assigned_list = [s.strip() for s in assigned_raw.split(",")]
-                av_sites = [s for s in av_sites if s in assigned_list]
+        av_sites = df_sites["name"].unique().tolist() if not df_sites.empty else []
 
         if not av_sites:
             empty_state("🔗", "No sites assigned", "You are not assigned to any active site. Contact your admin.")
@@ -1250,110 +1810,8 @@ elif current_tab == "🧱 Materials":
             sel_site = st.selectbox("📍 Select Site", av_sites, help="Choose the site whose material log you want to view or update.")
             st.divider()
             if sel_site:
-                try:
-                    raw_materials = supabase.table("materials").select("*").eq("site", sel_site).execute()
-                    df_mat = pd.DataFrame(raw_materials.data) if raw_materials.data else pd.DataFrame()
-                except Exception:
-                    df_mat = pd.DataFrame()
-                    st.error("⚠️ Error fetching materials data. Check your connection.")
-
-                sel_week = "All Time"
-                weeks = []
-
-                if not df_mat.empty:
-                    df_mat["date_dt"] = pd.to_datetime(df_mat["date"], errors='coerce')
-                    df_mat = df_mat.dropna(subset=["date_dt"])
-                    if not df_mat.empty:
-                        df_mat["start_date"] = df_mat["date_dt"].dt.date.apply(get_billing_start_date)
-                        df_mat["end_date"] = df_mat["start_date"] + timedelta(days=6)
-                        df_mat["week_label"] = df_mat.apply(lambda x: f"{x['start_date'].strftime('%d-%m-%Y')} to {x['end_date'].strftime('%d-%m-%Y')}", axis=1)
-                        unique_weeks = df_mat[["start_date", "week_label"]].drop_duplicates().sort_values("start_date", ascending=False)
-                        weeks = unique_weeks["week_label"].tolist()
-
-                st.markdown("### 📅 Filter by Time Period")
-                sel_week = st.selectbox("View Period", ["All Time"] + weeks,
-                                        help="Filter the material view and PDF report to a specific week, or view everything.")
-
-                if sel_week != "All Time" and not df_mat.empty:
-                    df_mat_filtered = df_mat[df_mat["week_label"] == sel_week].copy()
-                else:
-                    df_mat_filtered = df_mat.copy()
-
-                if not df_mat_filtered.empty:
-                    try:
-                        pdf_bytes = generate_material_pdf_bytes(sel_site, sel_week, df_mat_filtered)
-                        st.download_button(
-                            label="⬇️ Download Material Report (PDF)",
-                            data=pdf_bytes,
-                            file_name=f"Materials_{sel_site}_{sel_week.replace(' ', '_')}.pdf",
-                            mime="application/pdf",
-                            type="primary",
-                            help="Download a formatted PDF report of all materials for this site and time period."
-                        )
-                    except Exception as e:
-                        st.error(f"⚠️ Error generating PDF: {e}")
-                else:
-                    st.info("ℹ️ No records in this period — no PDF to generate yet.")
-
-                st.divider()
-
-                categories = ["Civil Material", "Steel Material", "Soil Material", "RMC"]
-                mat_tabs = st.tabs(categories)
-
-                for i, cat in enumerate(categories):
-                    with mat_tabs[i]:
-                        st.markdown(f"### ➕ Log New {cat} Entry")
-                        st.caption(f"Fill in the details below to log a new {cat} purchase for **{sel_site}**.")
-                        with st.form(f"form_{cat}"):
-                            c1, c2, c3 = st.columns(3)
-                            m_date = c1.date_input("📅 Purchase Date", date.today(), format="DD-MM-YYYY", key=f"d_{cat}")
-                            m_vendor = c2.text_input("🏪 Vendor Name", key=f"v_{cat}", placeholder="e.g. ABC Suppliers")
-                            m_material = c3.text_input("📦 Material Description", key=f"m_{cat}", placeholder="e.g. Cement (50kg bags)")
-                            c4, c5 = st.columns(2)
-                            m_qty = c4.number_input("📏 Quantity", min_value=0.0, step=1.0, key=f"q_{cat}", help="Number of units purchased.")
-                            m_amt = c5.number_input("💰 Total Amount (₹)", min_value=0.0, step=100.0, key=f"a_{cat}", help="Total purchase amount in Rupees.")
-                            m_receipt = st.file_uploader("🧾 Attach Bill/Receipt (Optional)", type=["jpg", "jpeg", "png"], key=f"rec_{cat}",
-                                                         help="Upload a photo of the bill or receipt for documentation.")
-
-                            if st.form_submit_button("💾 Save Material Entry", type="primary", width='stretch'):
-                                if not m_vendor.strip():
-                                    st.error("⚠️ Vendor name is required.")
-                                elif not m_material.strip():
-                                    st.error("⚠️ Material description is required.")
-                                else:
-                                    receipt_link = ""
-                                    if m_receipt:
-                                        with st.spinner("Uploading receipt..."):
-                                            receipt_link = upload_evidence(m_receipt)
-                                    load = {
-                                        "date": str(m_date), "site": sel_site, "category": cat,
-                                        "vendor": m_vendor.strip(), "material_name": m_material.strip(),
-                                        "quantity": m_qty, "amount": m_amt, "receipt_url": receipt_link
-                                    }
-                                    try:
-                                        supabase.table("materials").insert(load).execute()
-                                        st.success(f"✅ {cat} entry saved successfully!")
-                                        time.sleep(1)
-                                        st.rerun()
-                                    except Exception:
-                                        st.error("⚠️ Failed to save. Check your database connection.")
-
-                        st.markdown("---")
-                        st.markdown(f"### 📋 {cat} Log — {sel_week}")
-                        if not df_mat_filtered.empty:
-                            df_cat = df_mat_filtered[df_mat_filtered["category"] == cat].copy()
-                            if not df_cat.empty:
-                                df_cat = df_cat.sort_values("date_dt", ascending=False)
-                                total_spent = df_cat["amount"].sum()
-                                st.metric(f"Total Spent on {cat}", f"₹{total_spent:,.2f}")
-                                display_df = df_cat[["date", "vendor", "material_name", "quantity", "amount"]].rename(
-                                    columns={"date": "Date", "vendor": "Vendor", "material_name": "Material", "quantity": "Qty", "amount": "Amount (₹)"}
-                                )
-                                st.dataframe(display_df, width='stretch', hide_index=True)
-                            else:
-                                empty_state("📦", f"No {cat} logged", f"Log a new {cat} entry using the form above.")
-                        else:
-                            empty_state("📦", "No materials logged yet", f"Use the form above to add your first {cat} entry for {sel_site}.")
+                df_mat, weeks = load_site_materials(sel_site)
+                render_materials_log(sel_site, df_mat, weeks)
 
 # ==============================================================================
 # TAB 4: MY DIARY
@@ -1421,26 +1879,14 @@ elif current_tab == "📈 Dashboard":
 
     st.divider()
 
-    df_entries = fetch_data("entries")
-    df_materials = fetch_data("materials")
-
-    if not df_entries.empty:
-        df_entries["date_dt"] = pd.to_datetime(df_entries["date"]).dt.date
-        mask_entries = (df_entries["date_dt"] >= start_date) & (df_entries["date_dt"] <= end_date)
-        df_e_filtered = df_entries.loc[mask_entries]
-        total_labor_spent = df_e_filtered["total_cost"].sum() if not df_e_filtered.empty else 0
-        total_masons = df_e_filtered["count_mason"].sum() if not df_e_filtered.empty else 0
-        total_helpers = df_e_filtered["count_helper"].sum() if not df_e_filtered.empty else 0
-    else:
-        df_e_filtered, total_labor_spent, total_masons, total_helpers = pd.DataFrame(), 0, 0, 0
+    # Per-site totals computed by the database (see aggregates.py)
+    df_lab = load_totals(aggregates.labour_totals, aggregates.LABOUR_TOTALS_COLUMNS, start_date, end_date)
+    df_mat_tot = load_totals(aggregates.material_totals, aggregates.MATERIAL_TOTALS_COLUMNS, start_date, end_date)
 
-    if not df_materials.empty:
-        df_materials["date_dt"] = pd.to_datetime(df_materials["date"]).dt.date
-        mask_mat = (df_materials["date_dt"] >= start_date) & (df_materials["date_dt"] <= end_date)
-        df_m_filtered = df_materials.loc[mask_mat]
-        total_mat_spent = df_m_filtered["amount"].sum() if not df_m_filtered.empty else 0
-    else:
-        df_m_filtered, total_mat_spent = pd.DataFrame(), 0
+    total_labor_spent = df_lab["total_cost"].sum()
+    total_masons = df_lab["count_mason"].sum()
+    total_helpers = df_lab["count_helper"].sum()
+    total_mat_spent = df_mat_tot["amount"].sum()
 
     grand_total = total_labor_spent + total_mat_spent
 
@@ -1455,23 +1901,19 @@ elif current_tab == "📈 Dashboard":
 
     with chart_col1:
         st.markdown("### 📍 Total Spend by Site")
-        site_totals = {}
-        if not df_e_filtered.empty:
-            for _, r in df_e_filtered.iterrows():
-                site_totals[r["site"]] = site_totals.get(r["site"], 0) + r["total_cost"]
-        if not df_m_filtered.empty:
-            for _, r in df_m_filtered.iterrows():
-                site_totals[r["site"]] = site_totals.get(r["site"], 0) + r["amount"]
-        if site_totals:
-            df_site_cost = pd.DataFrame(list(site_totals.items()), columns=["Site", "Total Cost (₹)"])
+        site_totals = pd.concat([
+            df_lab.set_index("site")["total_cost"], df_mat_tot.set_index("site")["amount"]
+        ]).groupby(level=0).sum()
+        if not site_totals.empty:
+            df_site_cost = site_totals.rename_axis("Site").reset_index(name="Total Cost (₹)")
             st.bar_chart(df_site_cost.set_index("Site"), color="#F39C12")
         else:
             empty_state("📍", "No data for this date range", "Try expanding the date range.")
 
     with chart_col2:
         st.markdown("### 🧱 Material Spend by Category")
-        if not df_m_filtered.empty:
-            cat_cost = df_m_filtered.groupby("category")["amount"].sum().reset_index()
+        if not df_mat_tot.empty:
+            cat_cost = df_mat_tot.groupby("category")["amount"].sum().reset_index()
             cat_cost.columns = ["Category", "Amount (₹)"]
             st.bar_chart(cat_cost.set_index("Category"), color="#2E86C1")
         else:
@@ -1502,19 +1944,11 @@ elif current_tab == "🧾 Client Invoice":
 
             st.markdown("### Step 2 — Labour Billing")
             st.caption("Your actual (internal) labour cost is shown below. Enter the rates you want to charge your client to apply a margin.")
-            df_entries = fetch_data("entries")
-            tot_mason, tot_helper, tot_ladies = 0, 0, 0
-            internal_total_labor = 0
-
-            if not df_entries.empty:
-                df_entries["date_dt"] = pd.to_datetime(df_entries["date"]).dt.date
-                mask = (df_entries["site"] == inv_site) & (df_entries["date_dt"] >= inv_start) & (df_entries["date_dt"] <= inv_end)
-                df_e_filtered = df_entries[mask]
-                if not df_e_filtered.empty:
-                    tot_mason = df_e_filtered["count_mason"].sum()
-                    tot_helper = df_e_filtered["count_helper"].sum()
-                    tot_ladies = df_e_filtered["count_ladies"].sum()
-                    internal_total_labor = df_e_filtered["total_cost"].sum()
+            df_lab = load_totals(aggregates.labour_totals, aggregates.LABOUR_TOTALS_COLUMNS, inv_start, inv_end, inv_site)
+            tot_mason = df_lab["count_mason"].sum()
+            tot_helper = df_lab["count_helper"].sum()
+            tot_ladies = df_lab["count_ladies"].sum()
+            internal_total_labor = df_lab["total_cost"].sum()
 
             st.info(f"💡 **Your internal labour payout** for this period: **₹{internal_total_labor:,.0f}**  |  Enter your client billing rates below to set what you'll charge the client.")
 
@@ -1540,21 +1974,18 @@ elif current_tab == "🧾 Client Invoice":
             st.markdown("### Step 3 — Materials")
             st.caption(f"Showing materials from the database for **{inv_site}** between **{inv_start.strftime('%d %b %Y')}** and **{inv_end.strftime('%d %b %Y')}**.")
 
-            df_materials = fetch_data("materials")
+            # Itemised, so not an aggregate — but only this site's rows in range.
+            df_m_filtered = fetch_data("materials", filters=(
+                ("eq", "site", inv_site), ("gte", "date", str(inv_start)), ("lte", "date", str(inv_end))))
             pdf_mats = pd.DataFrame(columns=["Date", "Description", "Amount (Rs)"])
             total_mat = 0
-            df_m_filtered = pd.DataFrame()
 
-            if not df_materials.empty:
-                df_materials["date_dt"] = pd.to_datetime(df_materials["date"]).dt.date
-                mask_m = (df_materials["site"] == inv_site) & (df_materials["date_dt"] >= inv_start) & (df_materials["date_dt"] <= inv_end)
-                df_m_filtered = df_materials[mask_m].copy()
-                if not df_m_filtered.empty:
-                    df_m_filtered["formatted_date"] = pd.to_datetime(df_m_filtered["date"]).dt.strftime('%d-%m-%Y')
-                    df_m_filtered["Description_PDF"] = df_m_filtered["material_name"] + " (" + df_m_filtered["category"] + ")"
-                    pdf_mats = df_m_filtered[["formatted_date", "Description_PDF", "amount"]].rename(
-                        columns={"formatted_date": "Date", "Description_PDF": "Description", "amount": "Amount (Rs)"})
-                    total_mat = pdf_mats["Amount (Rs)"].sum()
+            if not df_m_filtered.empty:
+                df_m_filtered["formatted_date"] = pd.to_datetime(df_m_filtered["date"]).dt.strftime('%d-%m-%Y')
+                df_m_filtered["Description_PDF"] = df_m_filtered["material_name"] + " (" + df_m_filtered["category"] + ")"
+                pdf_mats = df_m_filtered[["formatted_date", "Description_PDF", "amount"]].rename(
+                    columns={"formatted_date": "Date", "Description_PDF": "Description", "amount": "Amount (Rs)"})
+                total_mat = pdf_mats["Amount (Rs)"].sum()
 
             if not pdf_mats.empty:
                 # Using st.table instead of st.dataframe here on purpose: st.dataframe
@@ -1587,6 +2018,7 @@ elif current_tab == "🧾 Client Invoice":
                                 "quantity": 1, "amount": qm_amt, "receipt_url": ""
                             }
                             supabase.table("materials").insert(load).execute()
+                            data_changed()
                             st.success("✅ Saved! The invoice totals will update automatically.")
                             time.sleep(1)
                             st.rerun()
@@ -1613,6 +2045,7 @@ elif current_tab == "🧾 Client Invoice":
                             supabase.table("materials").update({
                                 "date": str(e_date), "material_name": e_desc, "category": e_cat, "amount": e_amt
                             }).eq("id", int(sel_edit_row["id"])).execute()
+                            data_changed()
                             st.success("✅ Material updated!")
                             time.sleep(1)
                             st.rerun()
@@ -1627,6 +2060,7 @@ elif current_tab == "🧾 Client Invoice":
                     if st.button("🗑️ Delete Selected Entry", type="primary"):
                         del_id = del_options[sel_del]
                         supabase.table("materials").delete().eq("id", int(del_id)).execute()
+                        data_changed()
                         st.success("✅ Entry deleted.")
                         time.sleep(1)
                         st.rerun()
@@ -1640,44 +2074,23 @@ elif current_tab == "🧾 Client Invoice":
 
             if st.button("📄 Generate Professional Invoice PDF", type="primary", width='stretch'):
                 date_label = f"{inv_start.strftime('%d-%m-%Y')} to {inv_end.strftime('%d-%m-%Y')}"
-                with st.spinner("Generating your invoice PDF..."):
-                    pdf_bytes = generate_client_invoice_bytes(inv_site, date_label, labor_details, pdf_mats, grand_total)
-                # Persist to session_state instead of a local variable: clicking the
-                # download button below triggers its own rerun, which would reset
-                # st.button("Generate...") back to False and make this whole block
-                # (and the download button with it) disappear before the click could
-                # register. Session state survives that rerun.
-                st.session_state["_client_invoice_pdf_bytes"] = pdf_bytes
-                st.session_state["_client_invoice_pdf_name"] = f"Client_Invoice_{inv_site}_{inv_start.strftime('%d%b')}.pdf"
-
-            if st.session_state.get("_client_invoice_pdf_bytes"):
-                st.success("✅ Invoice ready to download!")
-                st.download_button(
-                    label="⬇️ Download Client Invoice (PDF)",
-                    data=st.session_state["_client_invoice_pdf_bytes"],
-                    file_name=st.session_state["_client_invoice_pdf_name"],
-                    mime="application/pdf"
-                )
+                # Arguments are bound now: the job runs after this script run has moved on.
+                start_job("_client_invoice_job", "Client invoice",
+                          lambda progress, args=(inv_site, date_label, labor_details, pdf_mats, grand_total):
+                              generate_client_invoice_bytes(*args),
+                          f"Client_Invoice_{inv_site}_{inv_start.strftime('%d%b')}.pdf")
+
+            job_panel("_client_invoice_job", "⬇️ Download Client Invoice (PDF)")
 
 elif current_tab == "📑 Custom Labour Report":
     page_header("📑 Custom Labour Report", "Download a day-by-day labour report for any site or contractor, for any date range you choose")
 
-    df_entries = fetch_data("entries")
+    df_entries = load_entries()
     df_contractors = fetch_data("contractors")
 
     if df_entries.empty:
         empty_state("📊", "No entries yet", "Start by logging daily attendance in the Daily Entry tab.")
     else:
-        df_entries = df_entries.copy()
-        df_entries["date_dt"] = pd.to_datetime(df_entries["date"], errors="coerce")
-        df_entries = df_entries.dropna(subset=["date_dt"])
-
-        df_contractors = df_contractors.copy()
-        if not df_contractors.empty:
-            df_contractors["effective_date"] = pd.to_datetime(
-                df_contractors["effective_date"], errors="coerce"
-            ).dt.date
-
         st.markdown("### Step 1 — Choose Report Type & Dates")
         c1, c2, c3 = st.columns(3)
         report_mode = c1.radio("Report For", ["🏢 Site", "👷 Contractor"], horizontal=False)
@@ -1699,7 +2112,7 @@ elif current_tab == "📑 Custom Labour Report":
             else:
                 sel_name = st.selectbox(label, options, key="clr_sel_name")
 
-                mask = (df_entries["date_dt"].dt.date >= rep_start) & (df_entries["date_dt"].dt.date <= rep_end)
+                mask = (df_entries["date_dt"] >= pd.Timestamp(rep_start)) & (df_entries["date_dt"] <= pd.Timestamp(rep_end))
                 if report_mode == "🏢 Site":
                     mask &= (df_entries["site"] == sel_name)
                 else:
@@ -1713,77 +2126,92 @@ elif current_tab == "📑 Custom Labour Report":
                 if df_range.empty:
                     st.info("ℹ️ No entries found for this selection in the chosen date range.")
                 else:
-                    full_range_dates = [rep_start + timedelta(days=i) for i in range((rep_end - rep_start).days + 1)]
-                    billing_data = []
-                    grand_amt = 0.0
-
                     # When reporting on a Site, break out each contractor who worked there.
                     # When reporting on a Contractor, break out each site they worked at.
-                    if report_mode == "🏢 Site":
-                        sub_groups = sorted(df_range["contractor"].dropna().unique().tolist())
-                        group_col = "contractor"
-                    else:
-                        sub_groups = sorted(df_range["site"].dropna().unique().tolist())
-                        group_col = "site"
-
-                    for grp in sub_groups:
-                        df_sub = df_range[df_range[group_col] == grp]
-                        con_for_rate = grp if report_mode == "🏢 Site" else sel_name
-                        rm, rh, rl = _safe_get_rates(df_contractors, con_for_rate, rep_start) if not df_contractors.empty else (0.0, 0.0, 0.0)
-                        rows, tm, th, tl, tamt = _build_week_rows(df_sub, full_range_dates, rm, rh, rl)
-                        billing_data.append({
-                            "name": grp, "rows": rows,
-                            "totals": {"m": tm, "h": th, "l": tl, "amt": tamt},
-                            "rates": {"rm": rm, "rh": rh, "rl": rl}
-                        })
-                        grand_amt += tamt
-
+                    group_col = "contractor" if report_mode == "🏢 Site" else "site"
+                    # Each entry is priced at the rate in force on its own date, so
+                    # a range that spans a rate change bills both sides correctly.
+                    with perf.span("price_entries"):
+                        priced = labour_report.price_entries(df_range, labour_report.rate_timeline(df_contractors))
+                        totals = labour_report.group_totals(priced, group_col)
+                        unrated = priced[labour_report.RATE_COLUMNS].eq(0).all(axis=1).groupby(priced[group_col]).all()
+                    grand_amt = float(totals["amount"].sum())
+
+                    with st.expander("💱 Rates Applied"):
+                        periods = labour_report.rate_periods(priced)
+                        st.dataframe(pd.DataFrame({
+                            "Contractor": periods["contractor"],
+                            "From": periods["first"].dt.strftime("%d-%m-%Y"),
+                            "To": periods["last"].dt.strftime("%d-%m-%Y"),
+                            "Mason (₹)": periods["rate_mason"], "Helper (₹)": periods["rate_helper"],
+                            "Ladies (₹)": periods["rate_ladies"],
+                        }), hide_index=True, width='stretch')
+
+                    # Day-by-day grids are shown a month at a time: a year-long range
+                    # would otherwise put 365 rows per group on the page.
+                    month_ranges = list(labour_report.months(rep_start, rep_end))
+                    month_labels = [first.strftime("%B %Y") for first, _ in month_ranges]
+                    sel_month = month_labels[-1]
+                    if len(month_labels) > 1:
+                        sel_month = st.selectbox("📅 Day-by-Day Month", month_labels, index=len(month_labels) - 1, key="clr_month")
+                    m_first, m_last = month_ranges[month_labels.index(sel_month)]
+
+                    for t in totals.itertuples(index=False):
+                        grp = getattr(t, group_col)
                         st.markdown(f"#### {'👷' if report_mode == '🏢 Site' else '📍'} {grp}")
-                        if rm == 0 and rh == 0 and rl == 0:
+                        if unrated[grp]:
                             st.caption("⚠️ No rates found — amounts show as ₹0. Add rates in the Contractors tab.")
                         k1, k2, k3, k4 = st.columns(4)
-                        k1.metric("💰 Amount", f"₹{tamt:,.0f}")
-                        k2.metric("🧱 Mason Shifts", f"{tm:g}")
-                        k3.metric("🛠️ Helper Shifts", f"{th:g}")
-                        k4.metric("👩 Ladies Shifts", f"{tl:g}")
-                        with st.expander(f"📄 Day-by-Day: {grp}"):
+                        k1.metric("💰 Amount", f"₹{t.amount:,.0f}")
+                        k2.metric("🧱 Mason Shifts", f"{t.count_mason:g}")
+                        k3.metric("🛠️ Helper Shifts", f"{t.count_helper:g}")
+                        k4.metric("👩 Ladies Shifts", f"{t.count_ladies:g}")
+                        with st.expander(f"📄 Day-by-Day: {grp} ({sel_month})"):
                             st.caption("— = no entry submitted. Nil = holiday/no-work entry submitted.")
                             # st.table (not st.dataframe) on purpose — avoids the pyarrow
                             # native-crash issue seen on this environment's Python build.
-                            st.table(pd.DataFrame(rows))
+                            st.table(pd.DataFrame(labour_report.month_block(priced, group_col, grp, m_first, m_last)["rows"]))
 
                     st.divider()
                     st.markdown(f"## 💰 Grand Total: ₹{grand_amt:,.2f}")
 
                     period_label = f"{rep_start.strftime('%d-%m-%Y')} to {rep_end.strftime('%d-%m-%Y')}"
 
-                    cA, cB = st.columns(2)
+                    file_stem = f"{sel_name}_{rep_start.strftime('%d%b')}_{rep_end.strftime('%d%b')}"
+                    cA, cB, cC = st.columns(3)
                     with cA:
                         if st.button("📄 Generate PDF Report", type="primary", width='stretch', key="clr_gen_pdf"):
-                            with st.spinner("Generating your PDF report..."):
-                                pdf_bytes = generate_pdf_bytes(sel_name, period_label, billing_data)
-                            st.session_state["_clr_pdf_bytes"] = pdf_bytes
-                            st.session_state["_clr_pdf_name"] = f"Labour_Report_{sel_name}_{rep_start.strftime('%d%b')}_{rep_end.strftime('%d%b')}.pdf"
+                            start_job("_clr_job", "PDF report",
+                                      lambda progress, args=(sel_name, period_label, priced, group_col, rep_start, rep_end):
+                                          labour_report.pdf_bytes(*args, progress=progress),
+                                      f"Labour_Report_{file_stem}.pdf")
                     with cB:
-                        csv_bytes = df_range.drop(columns=["date_dt"], errors="ignore").to_csv(index=False).encode("utf-8")
+                        # Descriptions and photos are only read when the CSV is
+                        # asked for, and only for this report's rows.
+                        detail_filters = (("gte", "date", str(rep_start)), ("lte", "date", str(rep_end)),
+                                          ("eq", "site" if report_mode == "🏢 Site" else "contractor", sel_name))
                         st.download_button(
-                            "📊 Download Raw Data (CSV)", csv_bytes,
-                            f"Labour_Data_{sel_name}_{rep_start.strftime('%d%b')}_{rep_end.strftime('%d%b')}.csv",
-                            "text/csv", width='stretch'
+                            "📊 Download Raw Data (CSV)",
+                            lazy_artifact(("clr_csv", report_mode, sel_name, rep_start, rep_end),
+                                          lambda: exports.csv_bytes(labour_report.entry_chunks(
+                                              with_entry_details(priced, fetch_entry_details(detail_filters)), rep_start, rep_end))),
+                            f"Labour_Data_{file_stem}.csv",
+                            "text/csv", on_click="ignore", width='stretch'
                         )
+                    with cC:
+                        if exports.XLSX_AVAILABLE:
+                            st.download_button(
+                                "📗 Download Day Grids (Excel)",
+                                lazy_artifact(("clr_xlsx", report_mode, sel_name, rep_start, rep_end),
+                                              lambda: exports.xlsx_bytes(labour_report.grid_chunks(priced, group_col, rep_start, rep_end), group_col)),
+                                f"Labour_Report_{file_stem}.xlsx",
+                                exports.XLSX_MIME, on_click="ignore", width='stretch',
+                                help=f"One sheet per {group_col}, with a totals row for every month."
+                            )
+                        else:
+                            st.caption("ℹ️ Excel downloads need the openpyxl package on the server.")
 
-                    # Rendered outside the generate-button block on purpose: clicking
-                    # download_button triggers its own rerun, which would otherwise
-                    # reset st.button("Generate...") to False and make this vanish
-                    # before the click could register. session_state survives that.
-                    if st.session_state.get("_clr_pdf_bytes"):
-                        st.success("✅ Report ready to download!")
-                        st.download_button(
-                            label="⬇️ Download PDF Report",
-                            data=st.session_state["_clr_pdf_bytes"],
-                            file_name=st.session_state["_clr_pdf_name"],
-                            mime="application/pdf"
-                        )
+                    job_panel("_clr_job", "⬇️ Download PDF Report")
 
 elif current_tab == "🔍 Site Logs":
     page_header("🔍 Site Logs", "Browse, audit, and manage all recorded entries")
@@ -1808,7 +2236,7 @@ elif current_tab == "🔍 Site Logs":
             df_e = df_e[df_e["contractor"] == fil_con]
 
         if "photo_url" in df_e.columns:
-            df_e["Photo"] = df_e["photo_url"].apply(lambda x: "📸 Yes" if x else "—")
+            df_e["Photo"] = df_e["photo_url"].map(evidence_badge)
             cols = ["id", "Date", "site", "contractor", "count_mason", "count_helper", "count_ladies", "total_cost", "work_description", "Photo"]
         else:
             cols = ["id", "Date", "site", "contractor", "count_mason", "count_helper", "count_ladies", "total_cost", "work_description"]
@@ -1819,6 +2247,11 @@ elif current_tab == "🔍 Site Logs":
             "total_cost": "Cost (₹)", "work_description": "Description"
         }), width='stretch', hide_index=True)
 
+        # A toggle rather than an expander: expander bodies run even when closed.
+        if "photo_url" in df_e.columns and st.toggle("🖼️ Show Photo Gallery", key="logs_gallery"):
+            evidence_gallery(zip(df_e["photo_url"], df_e["Date"] + " · " + df_e["site"] + " · " + df_e["contractor"]),
+                             key="logs_gallery")
+
         st.divider()
         with st.expander("🗑️ Delete an Entry by ID"):
             st.warning("⚠️ **Danger zone:** Deleting an entry is permanent and cannot be undone. Use the ID from the table above.")
@@ -1830,6 +2263,7 @@ elif current_tab == "🔍 Site Logs":
                     st.error("⚠️ Please enter a valid Entry ID.")
                 elif del_code == ADMIN_DELETE_CODE:
                     supabase.table("entries").delete().eq("id", int(del_id)).execute()
+                    invalidate_entries()
                     st.success(f"✅ Entry ID {del_id} has been deleted.")
                     st.rerun()
                 else:
@@ -1853,6 +2287,7 @@ elif current_tab == "📍 Sites":
         if st.button("Add Site", type="primary"):
             if n.strip():
                 supabase.table("sites").insert({"name": n.strip()}).execute()
+                data_changed()
                 st.success(f"✅ Site '{n}' added!")
                 st.rerun()
             else:
@@ -1869,8 +2304,8 @@ elif current_tab == "📍 Sites":
 
         st.download_button(
             "🔓 Download Backup to Unlock Delete",
-            data=json.dumps({"sites": fetch_data("sites").to_dict("records")}, default=str),
-            file_name="site_backup.json",
+            data=lazy_artifact("backup:sites", lambda: build_backup(["sites"])),
+            file_name="site_backup.json", mime="application/json",
             on_click=unlk,
             help="Downloads a backup of all sites. Once downloaded, the delete option will unlock."
         )
@@ -1878,6 +2313,7 @@ elif current_tab == "📍 Sites":
             d_site = st.selectbox("Select Site to Delete", sites_df["name"].unique())
             if st.button("🗑️ Delete Site", disabled=not st.session_state["site_ul"], type="primary"):
                 supabase.table("sites").delete().eq("name", d_site).execute()
+                data_changed()
                 st.success(f"✅ Site '{d_site}' deleted.")
                 st.session_state["site_ul"] = False
                 st.rerun()
@@ -1922,6 +2358,7 @@ elif current_tab == "👷 Contractors":
             if st.form_submit_button("✅ Update Status"):
                 if cn:
                     supabase.table("contractors").update({"status": new_stat}).eq("name", cn).execute()
+                    data_changed()
                     st.success(f"✅ {cn} is now **{new_stat}**.")
                     st.rerun()
         else:
@@ -1953,6 +2390,7 @@ elif current_tab == "👷 Contractors":
                     data_to_insert["status"] = insert_status
 
                 supabase.table("contractors").insert(data_to_insert).execute()
+                data_changed()
                 st.success(f"✅ Rate saved for **{cn}** effective from {ed.strftime('%d %b %Y')}.")
                 st.rerun()
 
@@ -1990,9 +2428,11 @@ elif current_tab == "👥 Users":
                 site_str = ", ".join(asites) if asites else "None/All"
                 if supabase.table("users").select("*").eq("phone", ph).execute().data:
                     supabase.table("users").update({"name": nm, "role": rl, "assigned_site": site_str, "mpin": mpin}).eq("phone", ph).execute()
+                    data_changed()
                     st.success(f"✅ User '{nm}' updated successfully.")
                 else:
                     supabase.table("users").insert({"phone": ph, "name": nm, "role": rl, "assigned_site": site_str, "status": "Active", "mpin": mpin}).execute()
+                    data_changed()
                     st.success(f"✅ New user '{nm}' created. They can now log in with their mobile number and PIN.")
                 st.rerun()
 
@@ -2013,6 +2453,7 @@ elif current_tab == "👥 Users":
                 elif deact_pass == ADMIN_DELETE_CODE:
                     ph_clean = sel_u.split("(")[-1].replace(")", "")
                     supabase.table("users").update({"status": "Resigned"}).eq("phone", ph_clean).execute()
+                    data_changed()
                     st.success(f"✅ User deactivated. They can no longer log in.")
                     st.rerun()
                 else:
@@ -2021,8 +2462,8 @@ elif current_tab == "👥 Users":
             st.info("ℹ️ No active non-admin users to deactivate.")
 
 elif current_tab == "📂 Archive & Recovery":
-    page_header("📂 Archive & Recovery", "Backup your data, view old records, or restore from a backup")
-    t1, t2, t3 = st.tabs(["🔄 Reset Data", "📜 View Archive", "♻️ Restore Data"])
+    page_header("📂 Archive & Recovery", "Backup or export your data, view old records, or restore from a backup")
+    t1, t2, t3, t4 = st.tabs(["🔄 Reset Data", "📜 View Archive", "♻️ Restore Data", "📤 Export Data"])
 
     with t1:
         st.markdown("### 🔄 Reset Entries")
@@ -2034,14 +2475,10 @@ elif current_tab == "📂 Archive & Recovery":
         def ul_res():
             st.session_state["reset_ul"] = True
 
-        bkp = {
-            "entries": fetch_data("entries").to_dict("records"),
-            "users": fetch_data("users").to_dict("records"),
-            "sites": fetch_data("sites").to_dict("records"),
-            "contractors": fetch_data("contractors").to_dict("records")
-        }
-        st.download_button("📥 Download Full Backup (JSON)", data=json.dumps(bkp, default=str),
-                           file_name="full_backup.json", on_click=ul_res,
+        # Built only when clicked; opening this page reads nothing.
+        st.download_button("📥 Download Full Backup (JSON)",
+                           data=lazy_artifact("backup:full", lambda: build_backup(["entries", "users", "sites", "contractors"])),
+                           file_name="full_backup.json", mime="application/json", on_click=ul_res,
                            help="Downloads a complete backup of all your data as a JSON file.")
 
         if st.session_state["reset_ul"]:
@@ -2056,6 +2493,7 @@ elif current_tab == "📂 Archive & Recovery":
         if st.button("🗑️ Clear All Entries", disabled=not st.session_state["reset_ul"], type="primary"):
             if conf_txt == "DELETE ALL" and conf_pass == ADMIN_DELETE_CODE:
                 supabase.table("entries").delete().neq("id", 0).execute()
+                invalidate_entries()
                 st.success("✅ All entries have been cleared. Your backup file still contains a copy.")
                 st.session_state["reset_ul"] = False
             else:
@@ -2082,7 +2520,7 @@ elif current_tab == "📂 Archive & Recovery":
                     if d.get("entries") and d.get("contractors"):
                         ae = pd.DataFrame(d["entries"])
                         ac = pd.DataFrame(d["contractors"])
-                        render_weekly_bill(ae, ac)
+                        render_weekly_bill(ac, archive=ae)
                     else:
                         st.error("⚠️ This backup file is missing 'entries' or 'contractors' data.")
             except Exception as e:
@@ -2113,9 +2551,253 @@ elif current_tab == "📂 Archive & Recovery":
                         st.success("✅ Restore complete! All data has been successfully restored.")
                     except Exception as e:
                         st.error(f"⚠️ Error during restore: {e}")
+                    finally:
+                        invalidate_entries()
             else:
                 st.error("❌ Wrong security code. Restore cancelled. No data was changed.")
 
+    with t4:
+        st.markdown("### 📤 Export Entries or Materials")
+        st.caption("For accounts: raw entries or material bills for a period, or the whole history. The file is built in the background, a page of rows at a time, so large exports don't hold up the app.")
+        c_x1, c_x2 = st.columns(2)
+        exp_table = c_x1.radio("Data", ["Entries", "Materials"], horizontal=True, key="exp_table")
+        exp_formats = ["CSV"] + (["Excel (XLSX)"] if exports.XLSX_AVAILABLE else [])
+        exp_format = c_x2.radio("Format", exp_formats, horizontal=True, key="exp_format")
+        if not exports.XLSX_AVAILABLE:
+            c_x2.caption("ℹ️ Excel exports need the openpyxl package on the server.")
+
+        exp_all = st.checkbox("📚 All history", key="exp_all", help="Export every row ever recorded instead of a date range.")
+        exp_filters, exp_period = (), "all_history"
+        if not exp_all:
+            c_x3, c_x4 = st.columns(2)
+            exp_start = c_x3.date_input("📅 From", date.today().replace(day=1), format="DD-MM-YYYY", key="exp_from")
+            exp_end = c_x4.date_input("📅 To", date.today(), format="DD-MM-YYYY", key="exp_to")
+            exp_filters = (("gte", "date", str(exp_start)), ("lte", "date", str(exp_end)))
+            exp_period = f"{exp_start.strftime('%d%b%Y')}_{exp_end.strftime('%d%b%Y')}"
+
+        exp_sheet_by = None
+        if exp_format != "CSV":
+            sheet_options = {"Site": "site", "Contractor": "contractor"} if exp_table == "Entries" else {"Site": "site", "Category": "category"}
+            exp_sheet_by = sheet_options[st.radio("One sheet per", list(sheet_options), horizontal=True, key="exp_sheet_by")]
+
+        if not exp_all and exp_start > exp_end:
+            st.error("⚠️ 'From' date must be on or before 'To' date.")
+        elif st.button(f"📤 Build {exp_table} Export", type="primary", key="exp_build"):
+            def run_export(progress, table=exp_table.lower(), filters=exp_filters, sheet_by=exp_sheet_by):
+                # order by id so pages can't shift while a long export is paging
+                chunks = (pd.DataFrame(page) for page in _iter_pages(table, "*", filters, order="id", progress=progress))
+                return exports.xlsx_bytes(chunks, sheet_by) if sheet_by else exports.csv_bytes(chunks)
+            if exp_sheet_by:
+                start_job("_export_job", f"{exp_table} export", run_export,
+                          f"{exp_table}_{exp_period}.xlsx", exports.XLSX_MIME)
+            else:
+                start_job("_export_job", f"{exp_table} export", run_export, f"{exp_table}_{exp_period}.csv", "text/csv")
+
+        job_panel("_export_job", "⬇️ Download Export")
+
+elif current_tab == "📥 Bulk Import":
+    page_header("📥 Bulk Import", "Load attendance or material bills from a spreadsheet instead of typing them in")
+    imp_kind = st.radio("Import", ["Entries", "Materials"], horizontal=True, key="imp_kind")
+    kind = imp_kind.lower()
+    spec = bulk_import.KINDS[kind]
+    st.caption("One row per line, with a header row. Dates as DD-MM-YYYY or YYYY-MM-DD. "
+               + ("Entries are costed at the contractor's rate on each date. A row for a date, site and contractor that's already saved replaces it."
+                  if kind == "entries" else f"Category is one of: {', '.join(bulk_import.MATERIAL_CATEGORIES)}."))
+    st.code(",".join(spec["required"] + spec["optional"]), language=None)
+    imp_types = ["csv"] + (["xlsx"] if bulk_import.XLSX_AVAILABLE else [])
+    f_imp = st.file_uploader("📁 Upload CSV" + (" or Excel" if bulk_import.XLSX_AVAILABLE else ""), type=imp_types, key="imp_file")
+    if not bulk_import.XLSX_AVAILABLE:
+        st.caption("ℹ️ Excel imports need the openpyxl package on the server; save the sheet as CSV instead.")
+
+    if f_imp:
+        df_sites, df_con = fetch_data("sites"), fetch_data("contractors")
+        # Checked once per file; reruns (and the Import click) reuse the result.
+        sig = (f_imp.file_id, kind, data_version())
+        if st.session_state.get("_import_checked", (None,))[0] != sig:
+            try:
+                with perf.span("import:check", kind=kind):
+                    checked = bulk_import.check_file(
+                        f_imp, f_imp.name, kind, df_sites["name"].tolist() if not df_sites.empty else [],
+                        df_con["name"].astype(str).unique().tolist() if not df_con.empty else [],
+                        labour_report.rate_timeline(df_con))
+            except Exception as e:
+                st.error(f"⚠️ Error reading file: {e}")
+                st.stop()
+            st.session_state["_import_checked"] = (sig, *checked)
+        _, valid, errors, missing = st.session_state["_import_checked"]
+
+        if missing:
+            st.error(f"⚠️ The file is missing these columns: {', '.join(missing)}. Nothing was imported.")
+        else:
+            c_i1, c_i2, c_i3 = st.columns(3)
+            c_i1.metric("Rows Read", f"{len(valid) + len(errors):,}")
+            c_i2.metric("Ready to Import", f"{len(valid):,}")
+            c_i3.metric("Rejected", f"{len(errors):,}")
+
+            if not errors.empty:
+                st.warning("⚠️ These rows have problems and will be skipped. Fix them in the sheet and upload it again to import them.")
+                st.dataframe(errors.head(500).rename(columns={"row": "Row", "problem": "Problem"}), width='stretch', hide_index=True)
+                if len(errors) > 500:
+                    st.caption(f"Showing the first 500 of {len(errors):,} rejected rows. Download the full list below.")
+                st.download_button("⬇️ Download Rejected Rows (CSV)", data=exports.csv_bytes(exports.frame_chunks(errors)),
+                                   file_name=f"import_errors_{f_imp.name.rsplit('.', 1)[0]}.csv", mime="text/csv", on_click="ignore")
+
+            if kind == "entries" and not valid.empty:
+                unrated = valid.loc[~valid["has_rate"] & (valid[labour_report.COUNT_COLUMNS].sum(axis=1) > 0), "contractor"].unique()
+                if len(unrated):
+                    st.warning(f"⚠️ No rate found on some dates for: {', '.join(unrated)}. Those entries will be saved with ₹0 cost. Please check contractor rates.")
+                st.markdown(f"💰 Total cost of imported entries: **₹{valid['total_cost'].sum():,.2f}**")
+
+            if not valid.empty:
+                with st.expander(f"👀 Preview ({min(len(valid), 50)} of {len(valid):,} rows)"):
+                    preview_cols = spec["key"][:3] + (labour_report.COUNT_COLUMNS + ["total_cost", "work_description"] if kind == "entries"
+                                                      else ["vendor", "material_name", "quantity", "amount"])
+                    st.dataframe(valid[preview_cols].head(50), width='stretch', hide_index=True)
+
+                # Rows already written by an earlier, interrupted click on this
+                # same file, so Import carries on instead of adding materials twice.
+                done = st.session_state.get("_import_done", {}).get(sig[:2], 0)
+                rows = bulk_import.records(valid, kind)[done:]
+                if done:
+                    st.info(f"ℹ️ {done:,} rows from this file are already saved. Import will save the remaining {len(rows):,}.")
+                if rows and st.button(f"📥 Import {len(rows):,} {imp_kind}", type="primary", width='stretch', key="imp_go"):
+                    bar = st.progress(0.0, text="⏳ Saving...")
+                    saved = 0
+                    try:
+                        with perf.span("import:write", kind=kind, rows=len(rows)):
+                            for batch in bulk_import.batches(rows):
+                                if kind == "entries":
+                                    supabase.table("entries").upsert(batch, on_conflict=day_sheet.ON_CONFLICT).execute()
+                                else:
+                                    supabase.table("materials").insert(batch).execute()
+                                saved += len(batch)
+                                bar.progress(saved / len(rows), text=f"⏳ Saved {saved:,} of {len(rows):,} rows")
+                    except Exception as e:
+                        if kind == "entries" and day_sheet.is_missing_constraint(e):
+                            st.error("⚠️ Database Setup Required: entries needs a unique (date, site, contractor) key. Run sql/day_sheet.sql in the Supabase SQL editor.")
+                        else:
+                            st.warning(f"⚠️ Network timeout while saving ({saved:,} of {len(rows):,} rows saved). Please click 'Import' again to save the rest.")
+                    finally:
+                        if saved:
+                            st.session_state.setdefault("_import_done", {})[sig[:2]] = done + saved
+                            if kind == "entries":
+                                invalidate_entries()
+                            else:
+                                data_changed()
+                    if saved == len(rows):
+                        st.success(f"✅ Imported {done + saved:,} {kind} from {f_imp.name}.")
+                elif not rows:
+                    st.success(f"✅ Every valid row in {f_imp.name} has been imported.")
+            elif errors.empty:
+                empty_state("📄", "The file has no rows", "Add rows under the header and upload it again.")
+
+elif current_tab == "⏱️ Performance":
+    page_header("⏱️ Performance", "Where each rerun spends its time — recent reruns, span breakdowns and per-tab timings")
+    # Mirrored into a plain session key: a widget's own key is dropped as soon
+    # as the user navigates to a page that doesn't render it.
+    def _perf_toggled():
+        st.session_state["_perf_on"] = st.session_state["_perf_toggle"]
+    st.toggle("⏺️ Record traces for this session", value=bool(st.session_state.get("_perf_on")),
+              key="_perf_toggle", on_change=_perf_toggled,
+              help="Times data fetches, date parsing, bill loops, PDF generation and widget rendering on every rerun. Adds almost no overhead, but is off by default.")
+    def _mem_toggled():
+        st.session_state["_mem_on"] = st.session_state["_mem_toggle"]
+        if not st.session_state["_mem_on"] and os.environ.get("LABOURPRO_MEMPROFILE") != "1":
+            perf.stop_memory(st.session_state.get("_perf_recorder"))
+    st.toggle("🧠 Profile memory (tracemalloc)", value=bool(st.session_state.get("_mem_on")),
+              key="_mem_toggle", on_change=_mem_toggled,
+              help="Also records peak memory, the lines that allocated the most, and the size of each session's stored data. Slows reruns noticeably, so only turn it on while investigating.")
+    st.caption("Traces are kept for this browser session only (last 200 reruns). Open the page you want to measure, use it, then come back here.")
+
+    recorder = st.session_state.get("_perf_recorder")
+    history = list(recorder.history) if recorder else []
+    if not history:
+        empty_state("⏱️", "No traces recorded yet", "Turn on recording above, then visit the pages you want to measure.")
+    else:
+        st.markdown("### 📊 Rerun Time by Tab")
+        df_tabs = pd.DataFrame(perf.summarize_tabs(history))
+        st.dataframe(df_tabs.rename(columns={
+            "tab": "Tab", "reruns": "Reruns", "p50_ms": "p50 (ms)", "p95_ms": "p95 (ms)",
+            "max_ms": "Max (ms)", "mean_ms": "Mean (ms)", "calls": "Calls / rerun",
+            "rows": "Rows / rerun", "kb": "KB / rerun"
+        }).round(1), width='stretch', hide_index=True)
+
+        st.markdown("### 🕒 Recent Reruns")
+        recent = list(reversed(history))
+        df_recent = pd.DataFrame([{
+            "Started": t["started"], "Tab": t["tab"], "Total (ms)": round(t["total_ms"], 1),
+            "Spans": len(t["spans"]), "Calls": len(t.get("queries", [])),
+            "Completed": "✅" if t["complete"] else "⏹️ stopped early",
+        } for t in recent])
+        st.dataframe(df_recent, width='stretch', hide_index=True)
+
+        st.markdown("### 🔬 Span Breakdown")
+        run_labels = [f"{t['started']} — {t['tab']} ({t['total_ms']:,.0f} ms)" for t in recent]
+        sel_run = st.selectbox("Select a rerun", range(len(recent)), format_func=lambda i: run_labels[i])
+        df_spans = pd.DataFrame(perf.span_breakdown(recent[sel_run]))
+        if df_spans.empty:
+            st.info("ℹ️ This rerun recorded no spans.")
+        else:
+            st.bar_chart(df_spans.set_index("span")["ms"], color="#F39C12")
+            df_spans["share"] = (df_spans["share"] * 100).round(1)
+            st.dataframe(df_spans.rename(columns={"span": "Span", "calls": "Calls", "ms": "Time (ms)", "share": "% of rerun"}).round(1),
+                         width='stretch', hide_index=True)
+
+        st.markdown("### 🌐 Backend Calls")
+        queries = recent[sel_run].get("queries", [])
+        if not queries:
+            st.info("ℹ️ This rerun made no database calls.")
+        else:
+            issues = perf.find_query_issues(recent[sel_run])
+            for issue in issues:
+                where = ", ".join(issue["callers"])
+                if issue["kind"] == "duplicate":
+                    st.warning(f"🔁 **Duplicate query** sent {issue['count']}× ({where}): `{issue['query']}` — "
+                               f"{issue['wasted_ms']:,.0f} ms and {issue['wasted_rows']:,} rows wasted.")
+                elif issue["kind"] == "loop":
+                    st.warning(f"🔂 **Per-item query loop** — {issue['count']} calls from {where}: `{issue['query']}`. "
+                               f"One `in_` query would replace {issue['count'] - 1} round-trips.")
+                else:
+                    st.caption(f"📄 Paged read: {issue['count']} pages of `{issue['query']}` from {where}.")
+            st.dataframe(pd.DataFrame([{
+                "Table": q["table"], "Op": q["op"], "Filters": " ".join(q["filters"]), "Rows": q["rows"],
+                "KB": round((q["bytes_out"] + q["bytes_in"]) / 1024, 1), "Time (ms)": round(q["ms"], 1),
+                "Called From": q["caller"],
+            } for q in queries]), width='stretch', hide_index=True)
+
+        mem = recent[sel_run].get("memory")
+        if mem:
+            st.markdown("### 🧠 Memory")
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Peak During Rerun", f"{mem['peak_kb'] / 1024:,.1f} MB")
+            m2.metric("Retained After Rerun", f"{(mem['end_kb'] - mem['start_kb']) / 1024:+,.1f} MB")
+            m3.metric("This Session's Stored Data", f"{sum(r['kb'] for r in mem['session_state']) / 1024:,.2f} MB")
+            if mem["top"]:
+                st.markdown("**Top allocating lines (growth during this rerun)**")
+                st.dataframe(pd.DataFrame(mem["top"])[["site", "kb", "blocks", "path"]].rename(columns={
+                    "site": "Line", "kb": "KB", "blocks": "Blocks", "path": "File"}).round(1),
+                    width='stretch', hide_index=True)
+            if mem["session_state"]:
+                st.markdown("**Largest session_state keys**")
+                st.dataframe(pd.DataFrame(mem["session_state"][:15]).rename(columns={
+                    "key": "Key", "type": "Type", "kb": "KB"}).round(1), width='stretch', hide_index=True)
+
+        sessions = perf.session_memory()
+        if sessions:
+            st.markdown("### 👥 Session Memory (all profiled sessions)")
+            st.dataframe(pd.DataFrame(sessions).rename(columns={
+                "session": "Session", "tab": "Last Tab", "updated": "Updated",
+                "state_kb": "session_state (KB)", "largest_key": "Largest Key"}).round(1),
+                width='stretch', hide_index=True)
+
+        c_p1, c_p2 = st.columns(2)
+        c_p1.download_button("📥 Export Traces (JSON)", data=lambda: json.dumps(history, default=str),
+                             file_name="labourpro_traces.json", mime="application/json",
+                             on_click="ignore", width='stretch')
+        if c_p2.button("🧹 Clear Traces", width='stretch'):
+            recorder.clear()
+            st.rerun()
+
 # ==============================================================================
 # SEARCH RESULTS PAGE (admin only, reached via sidebar search bar)
 # ==============================================================================
@@ -2132,29 +2814,20 @@ elif current_tab == "🔎 Search Results":
 
     # ── fetch all entries ──────────────────────────────────────────────────────
     with st.spinner("Searching across all entries..."):
-        df_all = fetch_data("entries")
+        df_all = load_entries()
 
     if df_all.empty:
         empty_state("📋", "No entries in the database yet", "Log some daily entries first.")
         st.stop()
 
     # ── prepare columns ────────────────────────────────────────────────────────
-    df_all["date_dt"] = pd.to_datetime(df_all["date"], errors="coerce")
-    df_all = df_all.dropna(subset=["date_dt"])
-    df_all["date_fmt"] = df_all["date_dt"].dt.strftime("%d-%m-%Y")           # 15-05-2025
-    df_all["month_str"] = df_all["date_dt"].dt.strftime("%B %Y").str.lower() # may 2025
-    df_all["site_lower"] = df_all["site"].str.lower()
-    df_all["con_lower"]  = df_all["contractor"].str.lower()
+    with perf.span("search_columns", rows=len(df_all)):
+        df_all = _prepare_search_columns(df_all)
 
     # ── multi-field match ──────────────────────────────────────────────────────
-    mask = (
-        df_all["site_lower"].str.contains(q_lower, na=False) |
-        df_all["con_lower"].str.contains(q_lower, na=False) |
-        df_all["date_fmt"].str.contains(q_lower, na=False) |
-        df_all["month_str"].str.contains(q_lower, na=False) |
-        df_all["date_dt"].dt.year.astype(str).str.contains(q_lower, na=False)
-    )
-    df_results = df_all[mask].copy().sort_values("date_dt", ascending=False)
+    with perf.span("search_mask"):
+        mask = _search_mask(df_all, q_lower)
+    df_results = add_entry_details(df_all[mask]).sort_values("date_dt", ascending=False)
 
     # ── summary bar ───────────────────────────────────────────────────────────
     n = len(df_results)
@@ -2218,19 +2891,19 @@ elif current_tab == "🔎 Search Results":
             "work_description":  "Description",
         }
         if "photo_url" in df_view.columns:
-            df_view["Photo"] = df_view["photo_url"].apply(lambda x: "📸 Yes" if x else "—")
+            df_view["Photo"] = df_view["photo_url"].map(evidence_badge)
             display_cols["Photo"] = "Photo"
 
         df_display = df_view[list(display_cols.keys())].rename(columns=display_cols)
         st.dataframe(df_display, width='stretch', hide_index=True)
 
         # CSV export of the current filtered results
-        csv_bytes = df_display.to_csv(index=False).encode("utf-8")
         st.download_button(
             "📥 Export these results (CSV)",
-            data=csv_bytes,
+            data=lazy_artifact(("search_csv", query, f_site, f_con, f_sort),
+                               lambda: exports.csv_bytes(exports.frame_chunks(df_display))),
             file_name=f"search_{query.replace(' ', '_')}.csv",
-            mime="text/csv",
+            mime="text/csv", on_click="ignore",
             help="Download the currently filtered search results as a CSV file."
         )
 
@@ -2244,7 +2917,7 @@ elif current_tab == "🔎 Search Results":
         with bcol1:
             st.markdown("**By site**")
             by_site = (
-                df_view.groupby("site")
+                df_view.groupby("site", observed=True)
                 .agg(entries=("id", "count"), cost=("total_cost", "sum"))
                 .reset_index()
                 .rename(columns={"site": "Site", "entries": "Entries", "cost": "Cost (₹)"})
@@ -2256,7 +2929,7 @@ elif current_tab == "🔎 Search Results":
         with bcol2:
             st.markdown("**By contractor**")
             by_con = (
-                df_view.groupby("contractor")
+                df_view.groupby("contractor", observed=True)
                 .agg(entries=("id", "count"), cost=("total_cost", "sum"))
                 .reset_index()
                 .rename(columns={"contractor": "Contractor", "entries": "Entries", "cost": "Cost (₹)"})
@@ -2267,4 +2940,9 @@ elif current_tab == "🔎 Search Results":
 
     # ── back / new search nudge ───────────────────────────────────────────────
     st.divider()
-    st.caption("💡 Use the search box in the sidebar to run a new search, or click any navigation tab to go back.")
\ No newline at end of file
+    st.caption("💡 Use the search box in the sidebar to run a new search, or click any navigation tab to go back.")
+
+# Close this rerun's trace (no-op when tracing is off). Pages that end early
+# with st.stop() skip this; perf.Recorder closes those on the next rerun.
+perf.finish(st.session_state if _mem_profiling() else None,
+            f"{st.session_state.get('user_name', 'User')} ({st.session_state.setdefault('_session_uid', uuid.uuid4().hex[:8])})")
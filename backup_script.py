@@ -3,17 +3,21 @@ import json
 import pandas as pd
 from datetime import datetime
 from supabase import create_client
+import local_backend
 
 # 1. SETUP CONNECTION
 # We use os.environ to get secrets from GitHub Actions later
 SUPABASE_URL = os.environ.get("SUPABASE_URL")
 SUPABASE_KEY = os.environ.get("SUPABASE_KEY")
 
-if not SUPABASE_URL or not SUPABASE_KEY:
-    print("❌ Error: Secrets not found.")
-    exit()
-
-supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+if local_backend.is_selected():
+    # Offline run against the in-memory backend (LABOURPRO_BACKEND=local)
+    supabase = local_backend.create_client()
+else:
+    if not SUPABASE_URL or not SUPABASE_KEY:
+        print("❌ Error: Secrets not found.")
+        exit()
+    supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
 
 def fetch_data(table):
     all_data = []
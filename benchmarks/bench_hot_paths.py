@@ -0,0 +1,144 @@
+"""Micro-benchmarks for the billing hot paths.
+
+    python benchmarks/bench_hot_paths.py                       # 1k, 10k, 100k
+    python benchmarks/bench_hot_paths.py --sizes 1000 1000000 --out bench.json
+
+Every case runs against the deterministic dataset from synthetic_data.py, so
+numbers from two commits are directly comparable. Results are printed (and
+optionally written) as JSON: one record per (size, case) with min / median /
+mean seconds over `--repeat` runs.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from helpers import (  # noqa: E402
+    generate_pdf_bytes, generate_material_pdf_bytes, generate_client_invoice_bytes,
+    _safe_get_rates, _build_week_rows, _add_week_keys, _prepare_search_columns, _search_mask,
+    compact_entries, ENTRY_CORE_COLUMNS,
+)
+import billing_calendar  # noqa: E402
+from synthetic_data import generate_size  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000]
+
+
+def _time(fn, repeat):
+    """Run fn() `repeat` times and return (timings, last result)."""
+    timings, result = [], None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - t0)
+    return timings, result
+
+
+def _prepare(data):
+    """Shape the raw tables the way the app does before the billing loops."""
+    df_entries = compact_entries(data["entries"][ENTRY_CORE_COLUMNS])
+    df_contractors = data["contractors"].copy()
+    df_contractors["effective_date"] = pd.to_datetime(df_contractors["effective_date"], errors="coerce").dt.date
+    return df_entries, df_contractors
+
+
+def run_size(n_entries, repeat):
+    data = generate_size(n_entries)
+    df_entries, df_contractors = _prepare(data)
+    results = []
+
+    def record(case, fn, rows, reps=repeat):
+        timings, out = _time(fn, reps)
+        results.append({
+            "size": n_entries, "case": case, "rows": rows, "repeat": reps,
+            "min_s": min(timings), "median_s": statistics.median(timings), "mean_s": statistics.fmean(timings),
+        })
+        return out
+
+    # The shared entries frame is built once per cache TTL from the raw rows.
+    raw = data["entries"][ENTRY_CORE_COLUMNS].to_dict("records")
+    record("compact_entries", lambda: compact_entries(raw), len(raw))
+
+    # Week labels over the whole history: the first thing Weekly Bill does.
+    weeks = record("week_labels", lambda: _add_week_keys(df_entries.copy()), len(df_entries))
+    _add_week_keys(df_entries)
+
+    # The busiest site in the most recent week is the realistic worst case.
+    latest = next(iter(weeks))
+    df_week = df_entries[df_entries["week_key"] == weeks[latest]]
+    week_start = billing_calendar.week_start(weeks[latest])
+    full_week = [week_start + timedelta(days=i) for i in range(7)]
+    busiest = df_week["site"].value_counts().idxmax()
+    df_site = df_week[df_week["site"] == busiest]
+    cons = df_site["contractor"].unique().tolist()
+
+    record("safe_get_rates", lambda: [_safe_get_rates(df_contractors, c, week_start) for c in cons], len(cons))
+
+    rates = {c: _safe_get_rates(df_contractors, c, week_start) for c in cons}
+    subs = {c: df_site[df_site["contractor"] == c] for c in cons}
+    record("build_week_rows", lambda: [_build_week_rows(subs[c], full_week, *rates[c]) for c in cons], len(df_site))
+
+    pdf_data = []
+    for c in cons:
+        rows, tm, th, tl, tamt = _build_week_rows(subs[c], full_week, *rates[c])
+        pdf_data.append({"name": c, "rows": rows, "totals": {"m": tm, "h": th, "l": tl, "amt": tamt},
+                         "rates": dict(zip(("rm", "rh", "rl"), rates[c]))})
+    record("generate_pdf_bytes", lambda: generate_pdf_bytes(busiest, latest, pdf_data), len(cons))
+
+    def search():
+        df = _prepare_search_columns(df_entries)
+        return _search_mask(df, "may 2025")
+    record("search_mask", search, len(data["entries"]))
+
+    # Materials tab defaults to "All Time", so the PDF covers the site's full history.
+    df_mat = data["materials"]
+    mat_site = df_mat["site"].value_counts().idxmax()
+    df_mat_site = df_mat[df_mat["site"] == mat_site]
+    record("generate_material_pdf_bytes", lambda: generate_material_pdf_bytes(mat_site, "All Time", df_mat_site),
+           len(df_mat_site), reps=max(1, repeat // 2))
+
+    inv_mats = df_mat_site.tail(30).rename(columns={"date": "Date", "material_name": "Description", "amount": "Amount (Rs)"})
+    labor = {"m_count": 42.0, "m_rate": 950.0, "h_count": 61.5, "h_rate": 600.0, "l_count": 18.0, "l_rate": 450.0}
+    labor["total"] = labor["m_count"] * labor["m_rate"] + labor["h_count"] * labor["h_rate"] + labor["l_count"] * labor["l_rate"]
+    record("generate_client_invoice_bytes",
+           lambda: generate_client_invoice_bytes(mat_site, latest, labor, inv_mats, labor["total"] + inv_mats["Amount (Rs)"].sum()),
+           len(inv_mats))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="Entry counts to benchmark (presets: 1000 10000 100000 1000000).")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed runs per case.")
+    parser.add_argument("--out", help="Also write the JSON report to this file.")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "pandas": pd.__version__, "platform": platform.platform(),
+        },
+        "results": [],
+    }
+    for n in args.sizes:
+        report["results"].extend(run_size(n, args.repeat))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""End-to-end page benchmarks: drive app.py headlessly with Streamlit's AppTest.
+
+    python benchmarks/bench_pages.py                          # 1k, 10k entries
+    python benchmarks/bench_pages.py --sizes 100000 --latency 0.05 --out pages.json
+
+The app runs in-process against local_backend (seeded from synthetic_data.py),
+logs in through the real login forms as an admin and as a field user, then
+walks each tab. For every step it records wall time, backend calls, rows and
+bytes transferred, so it is easy to see which tab degrades first as the data
+grows. `--latency` adds a per-call delay to mimic a real network round-trip.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import date, datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.environ["LABOURPRO_BACKEND"] = "local"
+
+import local_backend  # noqa: E402
+import streamlit as st  # noqa: E402
+from streamlit.testing.v1 import AppTest  # noqa: E402
+from synthetic_data import generate_size  # noqa: E402
+
+DEFAULT_SIZES = [1_000, 10_000]
+ADMIN = {"phone": "9000000001", "name": "Bench Admin", "role": "admin", "mpin": "1234",
+         "assigned_site": "None/All", "status": "Active"}
+FIELD = {"phone": "9000000002", "name": "Bench Supervisor", "role": "user", "mpin": "1234",
+         "status": "Active"}
+ADMIN_TABS = ["📝 Daily Entry", "📊 Weekly Bill", "🧱 Materials", "📈 Dashboard", "🧾 Client Invoice",
+              "📑 Custom Labour Report", "🔍 Site Logs"]
+FIELD_TABS = ["📝 Daily Entry", "📊 Weekly Bill", "🧱 Materials"]
+
+
+def _seed(n_entries, latency):
+    # Anchored to today so the date-range pages (Dashboard, Client Invoice,
+    # Custom Labour Report) default to a window that actually has data.
+    data = generate_size(n_entries, end=date.today())
+    sites = data["sites"]["name"].tolist()
+    field = dict(FIELD, assigned_site=", ".join(sites[:2]))
+    data["users"] = [ADMIN, field]
+    client = local_backend.LocalClient(tables=data, latency=latency)
+    local_backend.set_shared_client(client)
+    # The app caches its connection and the shared entries frame per process;
+    # drop both so this size doesn't run against the previous size's data.
+    st.cache_resource.clear()
+    return client
+
+
+class _Recorder:
+    """Runs one AppTest step and diffs the backend counters around it."""
+
+    def __init__(self, client, size, role):
+        self.client, self.size, self.role = client, size, role
+        self.results = []
+
+    def step(self, at, tab, action, interact=None):
+        if interact is not None:
+            interact()
+        before = self.client.snapshot_stats()
+        t0 = time.perf_counter()
+        at.run()
+        wall = time.perf_counter() - t0
+        after = self.client.snapshot_stats()
+        self.results.append({
+            "size": self.size, "role": self.role, "tab": tab, "action": action, "wall_s": wall,
+            "calls": after["calls"] - before["calls"],
+            "rows_out": after["rows_out"] - before["rows_out"],
+            "bytes_out": after["bytes_out"] - before["bytes_out"],
+            "elements": len(list(at.main)),
+            "exception": [e.value for e in at.exception] or None,
+        })
+
+
+def _by_label(widgets, prefix):
+    return next(w for w in widgets if w.label.startswith(prefix))
+
+
+def _login(at, user):
+    at.run()
+    if user["role"] == "admin":
+        _by_label(at.text_input, "Admin Mobile").input(user["phone"])
+        _by_label(at.text_input, "Admin Password").input("admin123")
+        _by_label(at.button, "Admin Login").click()
+    else:
+        _by_label(at.text_input, "📱 Mobile").input(user["phone"])
+        _by_label(at.text_input, "🔒").input(user["mpin"])
+        _by_label(at.button, "Login").click()
+    at.run()
+    if not at.session_state["logged_in"]:
+        raise RuntimeError(f"Login failed for {user['role']}")
+
+
+def walk(client, size, user, tabs, timeout):
+    rec = _Recorder(client, size, user["role"])
+    at = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=timeout)
+    _login(at, user)
+
+    for tab in tabs:
+        rec.step(at, tab, "navigate", lambda: at.button(key=f"nav_{tab}").click())
+        rec.step(at, tab, "rerun")
+        if tab == "📊 Weekly Bill":
+            for group in list(at.get("button_group")):
+                if len(group.options) > 1:
+                    rec.step(at, tab, f"pill:{group.key.split('_')[1]}",
+                             lambda g=group: g.set_value(g.options[1]))
+
+    if user["role"] == "admin":
+        tab = "🔎 Search Results"
+
+        def search():
+            at.text_input(key="sidebar_search_input").input("site 00")
+            at.button(key="do_search").click()
+        rec.step(at, tab, "search", search)
+        rec.step(at, tab, "rerun")
+    return rec.results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="Entry counts to benchmark.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated seconds per backend call.")
+    parser.add_argument("--timeout", type=float, default=600, help="AppTest per-run timeout in seconds.")
+    parser.add_argument("--out", help="Also write the JSON report to this file.")
+    args = parser.parse_args(argv)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"), "latency": args.latency,
+            "python": platform.python_version(), "platform": platform.platform(),
+        },
+        "results": [],
+    }
+    for n in args.sizes:
+        client = _seed(n, args.latency)
+        field = next(u for u in client.dump_tables()["users"] if u["role"] == "user")
+        report["results"].extend(walk(client, n, ADMIN, ADMIN_TABS, args.timeout))
+        report["results"].extend(walk(client, n, field, FIELD_TABS, args.timeout))
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as fh:
+            fh.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Deterministic synthetic LabourPro dataset for benchmarks and offline runs.
+
+Produces the same four tables the app reads from Supabase (sites, contractors,
+entries, materials) with realistic shapes: every contractor has a rate
+history, entries are unique per (date, site, contractor) like the Daily Entry
+form enforces, and `total_cost` is computed from the rate in force on the day.
+Same arguments + same seed always give byte-identical tables.
+"""
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+
+# Dataset presets used by the benchmark runners. Each one has enough
+# (date × site × contractor) slots to hold its entry count without collisions.
+SIZES = {
+    1_000:     {"sites": 5,   "contractors": 10,  "years": 1},
+    10_000:    {"sites": 10,  "contractors": 20,  "years": 2},
+    100_000:   {"sites": 30,  "contractors": 60,  "years": 3},
+    1_000_000: {"sites": 100, "contractors": 200, "years": 5},
+}
+
+MATERIAL_CATEGORIES = ["Civil Material", "Steel Material", "Soil Material", "RMC"]
+_MATERIAL_NAMES = ["Cement (50kg bags)", "TMT Bars 12mm", "River Sand", "M20 Ready Mix",
+                   "Bricks", "Binding Wire", "Red Soil", "Aggregate 20mm"]
+_VENDORS = ["ABC Suppliers", "Sri Balaji Traders", "City Steel", "Ganesh Earthmovers", "Metro RMC"]
+_WORK = ["Brickwork in Block A", "Slab casting on 3rd floor", "Plastering", "Excavation",
+         "Shuttering", "No Work / Holiday"]
+
+
+def generate(n_sites=10, n_contractors=20, years=1, n_entries=None, materials_ratio=0.1,
+             rate_changes=3, end=date(2025, 12, 31), seed=42):
+    """Build a synthetic dataset. Returns a dict of DataFrames keyed by table name.
+
+    `n_entries` defaults to roughly 60% occupancy of the available
+    (day, site, contractor) slots. `materials_ratio` is materials rows per entry.
+    """
+    rng = np.random.default_rng(seed)
+    n_days = 365 * years
+    start = end - timedelta(days=n_days - 1)
+
+    sites = pd.DataFrame({
+        "id": np.arange(1, n_sites + 1),
+        "name": [f"Site {i:03d}" for i in range(1, n_sites + 1)],
+        "is_client_site": rng.random(n_sites) < 0.5,
+    })
+    con_names = [f"Contractor {i:03d}" for i in range(1, n_contractors + 1)]
+
+    # ── rate histories: one row per (contractor, effective_date) ───────────────
+    rate_rows = []
+    for name in con_names:
+        eff_days = np.sort(rng.choice(np.arange(1, n_days), size=rate_changes, replace=False))
+        base_m, base_h, base_l = rng.integers(700, 1000), rng.integers(450, 650), rng.integers(350, 500)
+        for step, offset in enumerate([0] + eff_days.tolist()):
+            bump = 1 + 0.05 * step
+            rate_rows.append({
+                "name": name,
+                "rate_mason": int(base_m * bump), "rate_helper": int(base_h * bump),
+                "rate_ladies": int(base_l * bump),
+                "effective_date": (start + timedelta(days=int(offset))).isoformat(),
+                "status": "Active",
+            })
+    contractors = pd.DataFrame(rate_rows)
+    contractors.insert(0, "id", np.arange(1, len(contractors) + 1))
+
+    # ── entries: unique (day, site, contractor) slots ──────────────────────────
+    slots = n_days * n_sites * n_contractors
+    if n_entries is None:
+        n_entries = int(slots * 0.6)
+    n_entries = min(n_entries, slots)
+    picked = np.unique(rng.integers(0, slots, size=int(n_entries * 1.2) + 16))
+    if len(picked) < n_entries:
+        picked = np.union1d(picked, rng.choice(np.setdiff1d(np.arange(slots), picked),
+                                                size=n_entries - len(picked), replace=False))
+    picked = np.sort(rng.choice(picked, size=n_entries, replace=False))
+    day_idx, rest = np.divmod(picked, n_sites * n_contractors)
+    site_idx, con_idx = np.divmod(rest, n_contractors)
+
+    dates = (pd.to_datetime(start) + pd.to_timedelta(day_idx, unit="D")).astype("datetime64[ns]")
+    nil = rng.random(n_entries) < 0.05
+    half = lambda hi: np.where(nil, 0.0, rng.integers(0, hi * 2, size=n_entries) / 2.0)
+    entries = pd.DataFrame({
+        "id": np.arange(1, n_entries + 1),
+        "date": dates.strftime("%Y-%m-%d"),
+        "site": np.asarray(sites["name"])[site_idx],
+        "contractor": np.asarray(con_names)[con_idx],
+        "count_mason": half(8),
+        "count_helper": half(12),
+        "count_ladies": half(6),
+    })
+    entries["work_description"] = np.where(nil, "No Work / Holiday",
+                                           np.asarray(_WORK[:-1])[rng.integers(0, len(_WORK) - 1, n_entries)])
+    entries["photo_url"] = np.where(rng.random(n_entries) < 0.2,
+                                    [f"https://example.invalid/evidence/{i}.jpg" for i in range(n_entries)], "")
+
+    # total_cost uses the rate in force on the entry date, same as Daily Entry
+    rates = contractors.assign(_eff=pd.to_datetime(contractors["effective_date"]).astype("datetime64[ns]")).sort_values("_eff")
+    costed = pd.merge_asof(
+        entries.assign(_dt=dates).sort_values("_dt"), rates[["name", "_eff", "rate_mason", "rate_helper", "rate_ladies"]],
+        left_on="_dt", right_on="_eff", left_by="contractor", right_by="name", direction="backward",
+    ).sort_values("id")
+    entries["total_cost"] = (
+        costed["count_mason"] * costed["rate_mason"].fillna(0)
+        + costed["count_helper"] * costed["rate_helper"].fillna(0)
+        + costed["count_ladies"] * costed["rate_ladies"].fillna(0)
+    ).to_numpy()
+
+    # ── materials ───────────────────────────────────────────────────────────────
+    n_mat = max(1, int(n_entries * materials_ratio))
+    m_days = np.sort(rng.integers(0, n_days, size=n_mat))
+    materials = pd.DataFrame({
+        "id": np.arange(1, n_mat + 1),
+        "date": (pd.to_datetime(start) + pd.to_timedelta(m_days, unit="D")).strftime("%Y-%m-%d"),
+        "site": np.asarray(sites["name"])[rng.integers(0, n_sites, n_mat)],
+        "category": np.asarray(MATERIAL_CATEGORIES)[rng.integers(0, len(MATERIAL_CATEGORIES), n_mat)],
+        "vendor": np.asarray(_VENDORS)[rng.integers(0, len(_VENDORS), n_mat)],
+        "material_name": np.asarray(_MATERIAL_NAMES)[rng.integers(0, len(_MATERIAL_NAMES), n_mat)],
+        "quantity": rng.integers(1, 200, n_mat).astype(float),
+        "amount": (rng.integers(5, 2000, n_mat) * 100).astype(float),
+        "receipt_url": "",
+    })
+
+    return {"sites": sites, "contractors": contractors, "entries": entries, "materials": materials}
+
+
+def generate_size(n_entries, seed=42, **kwargs):
+    """Build the preset dataset for one of the SIZES keys (or the nearest larger
+    one). Extra keyword arguments (e.g. `end`) are passed through to generate()."""
+    key = min((k for k in SIZES if k >= n_entries), default=max(SIZES))
+    return generate(n_entries=n_entries, seed=seed, **{
+        "n_sites": SIZES[key]["sites"], "n_contractors": SIZES[key]["contractors"],
+        "years": SIZES[key]["years"], **kwargs,
+    })
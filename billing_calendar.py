@@ -0,0 +1,45 @@
+# Billing-week calendar, vectorized.
+#
+# A billing week runs Saturday → Friday. Instead of working out the Saturday
+# for every row with a Python function, each date is turned into an integer
+# week key (whole weeks since the Saturday 1970-01-03) in one numpy pass.
+# Keys sort in date order, group and compare as plain ints, and are only
+# turned back into dates / "dd-mm-YYYY to dd-mm-YYYY" labels for the handful
+# of distinct weeks a page actually shows. Like helpers.py, nothing here may
+# touch Streamlit or the database.
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+
+_EPOCH = date(1970, 1, 3)                   # a Saturday: week key 0 starts here
+_EPOCH_OFFSET = (_EPOCH - date(1970, 1, 1)).days
+NO_WEEK = np.iinfo(np.int64).min            # key given to missing / unparseable dates
+
+
+def week_keys(dates):
+    """Integer week keys for a whole column of dates (Series, array or list of
+    datetime64 / Timestamps / date strings). Missing dates get NO_WEEK."""
+    arr = np.asarray(dates)
+    if arr.dtype.kind != "M":
+        arr = pd.to_datetime(pd.Series(arr, dtype=object), errors="coerce").to_numpy()
+    days = arr.astype("datetime64[D]")
+    keys = (days.astype(np.int64) - _EPOCH_OFFSET) // 7
+    keys[np.isnat(days)] = NO_WEEK
+    return keys
+
+
+def week_start(key):
+    """The Saturday (datetime.date) that starts week `key`."""
+    return _EPOCH + timedelta(days=7 * int(key))
+
+
+def week_label(key):
+    start = week_start(key)
+    return f"{start.strftime('%d-%m-%Y')} to {(start + timedelta(days=6)).strftime('%d-%m-%Y')}"
+
+
+def week_options(keys):
+    """{label: key} for the distinct weeks in `keys`, newest first — ready to
+    feed a week selectbox. Only these few labels are ever formatted."""
+    distinct = np.unique(np.asarray(keys, dtype=np.int64))
+    return {week_label(k): int(k) for k in distinct[::-1] if k != NO_WEEK}
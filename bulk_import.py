@@ -0,0 +1,210 @@
+# Bulk CSV / XLSX import of entries and material bills.
+#
+# Site offices send attendance and material bills as spreadsheets. Rather
+# than retyping them into Daily Entry and Materials, an admin uploads the
+# file; it is read a chunk of rows at a time, checked with column-wise
+# (vectorized) checks, entries are costed against the rate timeline, and
+# the valid rows are written in large batches. Bad rows come back with their
+# file row number and every problem found, so the sheet can be fixed and
+# uploaded again.
+#
+# XLSX needs openpyxl, which is optional: without it XLSX_AVAILABLE is False
+# and only CSV is accepted. Like helpers.py, nothing here may touch
+# Streamlit or the database.
+import re
+
+import numpy as np
+import pandas as pd
+
+from day_sheet import NIL_DESCRIPTION
+from exports import CHUNK_ROWS
+from labour_report import COUNT_COLUMNS, RATE_COLUMNS
+
+try:
+    from openpyxl import load_workbook
+except ImportError:
+    load_workbook = None
+
+XLSX_AVAILABLE = load_workbook is not None
+WRITE_BATCH = 500
+MATERIAL_CATEGORIES = ["Civil Material", "Steel Material", "Soil Material", "RMC"]
+DATE_FORMATS = ["%Y-%m-%d", "%d-%m-%Y", "%d/%m/%Y", "%d.%m.%Y"]
+
+KINDS = {
+    "entries": {
+        "required": ["date", "site", "contractor", *COUNT_COLUMNS],
+        "optional": ["work_description"],
+        "key": ["date", "site", "contractor"],
+        "duplicate": "Same date, site and contractor as another row in the file",
+    },
+    "materials": {
+        "required": ["date", "site", "category", "vendor", "material_name", "quantity", "amount"],
+        "optional": [],
+        # Materials have no natural key; only exact repeats are rejected.
+        "key": ["date", "site", "category", "vendor", "material_name", "quantity", "amount"],
+        "duplicate": "Exact repeat of another row in the file",
+    },
+}
+_NUMBERS = {"entries": COUNT_COLUMNS, "materials": ["quantity", "amount"]}
+# Header spellings seen in site-office sheets (and our own export / form labels).
+_ALIASES = {
+    "masons": "count_mason", "mason": "count_mason",
+    "helpers": "count_helper", "helper": "count_helper",
+    "ladies": "count_ladies", "lady": "count_ladies",
+    "description": "work_description", "work": "work_description",
+    "material": "material_name", "material_description": "material_name",
+    "qty": "quantity", "total_amount": "amount", "amount_(₹)": "amount",
+    "vendor_name": "vendor", "purchase_date": "date",
+}
+
+
+def _column_name(header):
+    name = re.sub(r"[\s\-]+", "_", str(header).strip().lower())
+    return _ALIASES.get(name, name)
+
+
+def read_chunks(fh, file_name, rows=CHUNK_ROWS):
+    """Yield the uploaded sheet as string-typed frames of up to `rows` rows,
+    with normalised column names. XLSX is read from its first worksheet."""
+    if file_name.lower().endswith(".xlsx"):
+        yield from _xlsx_chunks(fh, rows)
+        return
+    for chunk in pd.read_csv(fh, dtype=str, keep_default_na=False, chunksize=rows,
+                             skipinitialspace=True, encoding="utf-8-sig"):
+        yield chunk.rename(columns=_column_name)
+
+
+def _xlsx_chunks(fh, rows):
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("Excel import needs the openpyxl package (pip install openpyxl).")
+    wb = load_workbook(fh, read_only=True, data_only=True)
+    try:
+        cells = wb.worksheets[0].iter_rows(values_only=True)
+        header = [_column_name(h) for h in next(cells, ())]
+        batch = []
+        for row in cells:
+            if all(v is None or v == "" for v in row):
+                continue
+            # Date cells come back as datetimes; keep just the date.
+            batch.append(["" if v is None else v.strftime("%Y-%m-%d") if hasattr(v, "strftime") else str(v)
+                          for v in row[:len(header)]])
+            if len(batch) == rows:
+                yield pd.DataFrame(batch, columns=header)
+                batch = []
+        if batch or not header:
+            yield pd.DataFrame(batch, columns=header)
+    finally:
+        wb.close()
+
+
+def missing_columns(chunk, kind):
+    return [c for c in KINDS[kind]["required"] if c not in chunk.columns]
+
+
+def parse_dates(values):
+    """Dates in any of DATE_FORMATS (YYYY-MM-DD first); NaT where none fit."""
+    values = values.str.strip().str.slice(0, 10)
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in DATE_FORMATS:
+        todo = parsed.isna()
+        if not todo.any():
+            break
+        parsed[todo] = pd.to_datetime(values[todo], format=fmt, errors="coerce")
+    return parsed
+
+
+def validate(chunk, kind, first_row, sites, contractors=()):
+    """Check one chunk. Returns (clean, errors): `clean` holds the typed
+    columns plus `row` (the line in the file, header = line 1) for every row,
+    `errors` has one row per bad line with all of its problems."""
+    spec = KINDS[kind]
+    df = chunk.reindex(columns=spec["required"] + spec["optional"], fill_value="").fillna("")
+    text = df.apply(lambda s: s.astype(str).str.strip())
+    clean = text.assign(row=np.arange(first_row, first_row + len(df)))
+    problems = {}
+
+    dates = parse_dates(text["date"])
+    problems["Date missing or not DD-MM-YYYY / YYYY-MM-DD"] = dates.isna()
+    clean["date"] = dates.dt.strftime("%Y-%m-%d")
+    clean["date_dt"] = dates
+    problems["Unknown site"] = ~text["site"].isin(set(sites))
+    if kind == "entries":
+        problems["Unknown contractor"] = ~text["contractor"].isin(set(contractors))
+    else:
+        problems[f"Category must be one of: {', '.join(MATERIAL_CATEGORIES)}"] = ~text["category"].isin(MATERIAL_CATEGORIES)
+        problems["Vendor is required"] = text["vendor"] == ""
+        problems["Material description is required"] = text["material_name"] == ""
+
+    for col in _NUMBERS[kind]:
+        # Blank counts mean 0, as on the forms.
+        num = pd.to_numeric(text[col].replace("", "0").str.replace(",", ""), errors="coerce")
+        problems[f"{col} is not a number"] = num.isna()
+        problems[f"{col} is negative"] = num < 0
+        clean[col] = num.fillna(0.0).astype("float64")
+
+    failed = pd.DataFrame(problems)
+    bad = failed.any(axis=1).to_numpy()
+    labels = np.array(list(problems), dtype=object)
+    errors = pd.DataFrame({
+        "row": clean["row"].to_numpy()[bad],
+        "problem": ["; ".join(labels[flags]) for flags in failed.to_numpy()[bad]],
+    })
+    return clean[~bad], errors
+
+
+def duplicate_errors(valid, kind):
+    """Split off rows that share a key with another row of the file. All
+    copies are rejected, since the file doesn't say which one is right."""
+    dup = valid.duplicated(KINDS[kind]["key"], keep=False).to_numpy()
+    errors = pd.DataFrame({"row": valid["row"].to_numpy()[dup], "problem": KINDS[kind]["duplicate"]})
+    return valid[~dup], errors
+
+
+def price(valid, timeline):
+    """Add `total_cost` at the rate in force on each entry's date, the same
+    lookup as the Daily Entry form: no rate on or before the date costs 0
+    and `has_rate` is False."""
+    df = valid.assign(contractor=valid["contractor"].astype(str)).sort_values("date_dt", kind="stable")
+    priced = pd.merge_asof(df, timeline, left_on="date_dt", right_on="effective",
+                           by="contractor", direction="backward")
+    priced["has_rate"] = priced["effective"].notna()
+    rates = priced[RATE_COLUMNS].fillna(0.0).to_numpy()
+    priced["total_cost"] = (priced[COUNT_COLUMNS].to_numpy() * rates).sum(axis=1)
+    return priced.sort_values("row").reset_index(drop=True)
+
+
+def check_file(fh, file_name, kind, sites, contractors=(), timeline=None):
+    """Read and check a whole upload, a chunk at a time. Returns
+    (valid, errors, missing): the rows that can be written (entries costed
+    against `timeline`), one error row per rejected line, and any required
+    columns the file lacks (then nothing else is checked)."""
+    valid, errors, first_row = [], [], 2
+    for chunk in read_chunks(fh, file_name):
+        missing = missing_columns(chunk, kind)
+        if missing:
+            return None, None, missing
+        ok, bad = validate(chunk, kind, first_row, sites, contractors)
+        valid.append(ok)
+        errors.append(bad)
+        first_row += len(chunk)
+    valid, dups = duplicate_errors(pd.concat(valid, ignore_index=True), kind)
+    errors = pd.concat(errors + [dups], ignore_index=True).sort_values("row", kind="stable").reset_index(drop=True)
+    if kind == "entries":
+        valid = price(valid, timeline)
+    return valid, errors, []
+
+
+def records(valid, kind):
+    """The rows to write, as dicts for upsert / insert."""
+    if kind == "entries":
+        nil = (valid[COUNT_COLUMNS].to_numpy() == 0).all(axis=1)
+        desc = valid["work_description"].mask(nil & (valid["work_description"] == ""), NIL_DESCRIPTION)
+        out = valid.assign(work_description=desc)[KINDS["entries"]["key"] + COUNT_COLUMNS + ["total_cost", "work_description"]]
+    else:
+        out = valid[KINDS["materials"]["required"]].assign(receipt_url="")
+    return out.to_dict("records")
+
+
+def batches(rows, size=WRITE_BATCH):
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
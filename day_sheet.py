@@ -0,0 +1,82 @@
+# Daily Entry "Day Sheet": every contractor for one site and date in one grid.
+#
+# The single-entry form costs a site supervisor several round-trips and a
+# rerun per contractor. The day sheet is built from one read of that day's
+# entries and the rate table the page already has, and is saved as one
+# batched upsert keyed on (date, site, contractor), so a 15-contractor site
+# is logged in one save. Like helpers.py, nothing here may touch Streamlit
+# or the database.
+import pandas as pd
+
+from labour_report import RATE_COLUMNS
+
+NIL_DESCRIPTION = "No Work / Holiday"
+SHEET_COLUMNS = ["Contractor", "Masons", "Helpers", "Ladies", "Holiday", "Work Description"]
+_COUNTS = {"Masons": "count_mason", "Helpers": "count_helper", "Ladies": "count_ladies"}
+ON_CONFLICT = "date,site,contractor"
+
+
+def rates_on(timeline, day):
+    """Rates in force on `day` per contractor (from labour_report.rate_timeline),
+    indexed by contractor. Like the single-entry form, a contractor with no
+    rate on or before `day` has none (and is priced at 0)."""
+    valid = timeline[timeline["effective"] <= pd.Timestamp(day)]
+    return valid.groupby("contractor", sort=False)[RATE_COLUMNS].last()
+
+
+def build_sheet(contractors, existing):
+    """The editable grid: one row per contractor in `contractors` plus any
+    that already have an entry that day, prefilled from `existing` (the day's
+    entries for the site)."""
+    if existing.empty:
+        existing = pd.DataFrame(columns=["contractor", "work_description", *_COUNTS.values()])
+    existing = existing.drop_duplicates("contractor").set_index("contractor")
+    names = list(dict.fromkeys([*contractors, *sorted(existing.index)]))
+    prev = existing.reindex(names)
+    counts = prev[list(_COUNTS.values())].apply(pd.to_numeric, errors="coerce").fillna(0.0)
+    sheet = pd.DataFrame({
+        "Contractor": names,
+        **{label: counts[col].to_numpy(dtype=float) for label, col in _COUNTS.items()},
+        "Holiday": (prev.index.isin(existing.index) & (counts.to_numpy() == 0).all(axis=1)),
+        "Work Description": prev["work_description"].fillna("").astype(str).to_numpy(),
+    })
+    return sheet[SHEET_COLUMNS]
+
+
+def sheet_payload(edited, original, day, site, rates):
+    """Rows to upsert for the edited grid: only rows that differ from what
+    was loaded (new contractors with something entered, or changed existing
+    entries). Holiday rows are saved with zero counts. Returns (rows, frame)
+    where frame has the same rows with their cost, for the summary."""
+    sheet = edited.reset_index(drop=True)
+    counts = sheet[list(_COUNTS)].apply(pd.to_numeric, errors="coerce").fillna(0.0).clip(lower=0.0)
+    holiday = sheet["Holiday"].fillna(False).astype(bool).to_numpy()
+    counts[holiday] = 0.0
+    desc = sheet["Work Description"].fillna("").astype(str).str.strip()
+    desc = desc.mask(holiday & (desc == ""), NIL_DESCRIPTION)
+
+    before = original.set_index("Contractor").reindex(sheet["Contractor"])
+    was_saved = (before[list(_COUNTS)].to_numpy() != 0).any(axis=1) | before["Holiday"].fillna(False).to_numpy(dtype=bool) \
+        | (before["Work Description"].fillna("").astype(str).str.strip() != "").to_numpy()
+    changed = (counts.to_numpy() != before[list(_COUNTS)].fillna(0.0).to_numpy()).any(axis=1) \
+        | (holiday != before["Holiday"].fillna(False).to_numpy(dtype=bool)) \
+        | (desc.to_numpy() != before["Work Description"].fillna("").astype(str).str.strip().to_numpy())
+    has_content = (counts.to_numpy() > 0).any(axis=1) | holiday | (desc != "").to_numpy()
+    keep = changed & (has_content | was_saved)
+
+    r = rates.reindex(sheet["Contractor"])
+    frame = pd.DataFrame({
+        "date": str(day), "site": site, "contractor": sheet["Contractor"].astype(str),
+        "count_mason": counts["Masons"], "count_helper": counts["Helpers"], "count_ladies": counts["Ladies"],
+        "total_cost": (counts.to_numpy() * r.fillna(0.0).to_numpy()).sum(axis=1),
+        "work_description": desc,
+        "has_rate": r.notna().all(axis=1).to_numpy(),
+    })[keep]
+    rows = frame.drop(columns=["has_rate"]).to_dict("records")
+    return rows, frame
+
+
+def is_missing_constraint(exc):
+    """True when the upsert failed because entries has no unique
+    (date, site, contractor) constraint yet (Postgres 42P10)."""
+    return "42P10" in str(exc) or "no unique or exclusion constraint" in str(exc)
@@ -0,0 +1,97 @@
+# Chunked CSV / XLSX export writers.
+#
+# Exports take an iterable of DataFrame chunks (a page of rows from the
+# database, a month of a report, a slice of a frame already in memory) and
+# write them one at a time, so only the current chunk and the output file are
+# ever held, never the whole table twice over as text and then bytes.
+#
+# XLSX needs openpyxl, which is optional: without it XLSX_AVAILABLE is False
+# and pages only offer CSV. Workbooks are written in openpyxl's write-only
+# mode, which streams rows to disk instead of building a cell tree.
+# Like helpers.py, nothing here may touch Streamlit or the database.
+import io
+import re
+
+import pandas as pd
+
+try:
+    from openpyxl import Workbook
+except ImportError:
+    Workbook = None
+
+XLSX_AVAILABLE = Workbook is not None
+XLSX_MIME = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+CHUNK_ROWS = 5000
+BLANK_SHEET = "(blank)"     # sheet for rows whose sheet_by value is missing
+
+
+def frame_chunks(df, rows=CHUNK_ROWS):
+    """Slice a frame that's already in memory into export chunks."""
+    for start in range(0, len(df), rows):
+        yield df.iloc[start:start + rows]
+
+
+def write_csv(chunks, fh):
+    """Write the chunks to binary file `fh` as one CSV (header once)."""
+    header = True
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        fh.write(chunk.to_csv(index=False, header=header).encode("utf-8"))
+        header = False
+
+
+def csv_bytes(chunks):
+    out = io.BytesIO()
+    write_csv(chunks, out)
+    return out.getvalue()
+
+
+def _sheet_title(name, taken):
+    # Excel sheet names: at most 31 characters, none of []:*?/\ and unique.
+    base = re.sub(r"[\[\]:*?/\\]", "-", str(name)).strip("'") or "Sheet"
+    title, n = base[:31], 1
+    while title.lower() in taken:
+        n += 1
+        title = f"{base[:31 - len(str(n)) - 1]}~{n}"
+    taken.add(title.lower())
+    return title
+
+
+def write_xlsx(chunks, fh, sheet_by=None):
+    """Write the chunks to `fh` as a workbook with one sheet per value of the
+    `sheet_by` column (or a single "Data" sheet); rows with no value go on a
+    BLANK_SHEET sheet. Sheets are created in the order their first row arrives."""
+    if not XLSX_AVAILABLE:
+        raise RuntimeError("Excel export needs the openpyxl package (pip install openpyxl).")
+    wb = Workbook(write_only=True)
+    sheets, taken = {}, set()
+    rows_in = rows_out = 0
+    for chunk in chunks:
+        if chunk.empty:
+            continue
+        rows_in += len(chunk)
+        parts = chunk.groupby(sheet_by, sort=False, observed=True, dropna=False) if sheet_by else [("Data", chunk)]
+        for name, part in parts:
+            if pd.isna(name):
+                name = BLANK_SHEET
+            ws = sheets.get(name)
+            if ws is None:
+                ws = sheets[name] = wb.create_sheet(_sheet_title(name, taken))
+                ws.append([str(c) for c in part.columns])
+            # NaN / NaT become empty cells.
+            cells = part.astype(object).where(part.notna(), None)
+            for row in cells.itertuples(index=False, name=None):
+                ws.append(row)
+            rows_out += len(part)
+    if rows_out != rows_in:
+        raise RuntimeError(f"Excel export wrote {rows_out:,} of {rows_in:,} rows.")
+    if not sheets:
+        wb.create_sheet("Data")
+    wb.save(fh)
+
+
+def xlsx_bytes(chunks, sheet_by=None):
+    out = io.BytesIO()
+    write_xlsx(chunks, out, sheet_by)
+    return out.getvalue()
@@ -0,0 +1,410 @@
+# Pure (Streamlit-free) helpers shared by app.py and the benchmark suite.
+# Nothing in here may touch `st.*` or the Supabase client: keeping these
+# importable on their own is what lets benchmarks/ time the billing hot
+# paths without spinning up a Streamlit session or a network connection.
+import numpy as np
+import pandas as pd
+from datetime import date
+from fpdf import FPDF
+from billing_calendar import week_keys, week_options
+
+
+# --- PDF ENGINE FOR LABOUR BILLS ---
+class PDFBill(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, 'Labour Payment Bill', 0, 1, 'C')
+        self.ln(5)
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+def _pdf_safe(text):
+    """Make any string safe for FPDF's Latin-1-only core fonts.
+    Swaps common 'smart' characters (curly quotes, em/en-dashes, the ₹ sign,
+    ellipsis) for plain ASCII equivalents, then drops anything else that still
+    can't be encoded — so a stray emoji or symbol in a site/contractor name
+    can never crash PDF generation again."""
+    if text is None:
+        return ""
+    text = str(text)
+    replacements = {
+        "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+        "\u2013": "-", "\u2014": "-", "\u2026": "...", "\u20b9": "Rs. ",
+        "\u00a0": " ",
+    }
+    for bad, good in replacements.items():
+        text = text.replace(bad, good)
+    return text.encode("latin-1", errors="replace").decode("latin-1")
+
+def generate_pdf_bytes(header_name, week_label, billing_data, progress=None, total=None):
+    # progress(done, total) is called after each block (jobs.JobRunner passes one).
+    # billing_data may be a generator (labour_report.month_blocks); pass its
+    # length as `total` then.
+    pdf = PDFBill()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, _pdf_safe(f"Bill For: {header_name}"), 0, 1, 'L')
+    pdf.cell(0, 10, _pdf_safe(f"Week: {week_label}"), 0, 1, 'L')
+    pdf.ln(5)
+    for i, item in enumerate(billing_data):
+        pdf.set_fill_color(220, 220, 220)
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(0, 10, _pdf_safe(item['name']), 0, 1, 'L', fill=True)
+        pdf.set_font("Arial", 'B', 10)
+        pdf.cell(30, 8, "Date", 1)
+        pdf.cell(20, 8, "Mason", 1)
+        pdf.cell(20, 8, "Helper", 1)
+        pdf.cell(20, 8, "Ladies", 1)
+        pdf.ln()
+        pdf.set_font("Arial", '', 10)
+        for row in item['rows']:
+            pdf.cell(30, 8, _pdf_safe(row['Date']), 1)
+            pdf.cell(20, 8, _pdf_safe(row['Mason']), 1)
+            pdf.cell(20, 8, _pdf_safe(row['Helper']), 1)
+            pdf.cell(20, 8, _pdf_safe(row['Ladies']), 1)
+            pdf.ln()
+        pdf.set_font("Arial", 'B', 10)
+        pdf.cell(30, 8, "Totals", 1)
+        pdf.cell(20, 8, _pdf_safe(item['totals']['m']), 1)
+        pdf.cell(20, 8, _pdf_safe(item['totals']['h']), 1)
+        pdf.cell(20, 8, _pdf_safe(item['totals']['l']), 1)
+        pdf.ln()
+        pdf.set_font("Arial", 'B', 12)
+        pdf.cell(90, 10, f"Total: Rs. {item['totals']['amt']:,.2f}", 1, 0, 'R')
+        pdf.ln(15)
+        if progress:
+            progress(i + 1, total or len(billing_data), item['name'])
+    return pdf.output(dest='S').encode('latin-1')
+
+
+# --- PDF ENGINE FOR MATERIALS ---
+class MaterialPDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 16)
+        self.cell(0, 10, 'Material Log Report', 0, 1, 'C')
+        self.ln(5)
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+def generate_material_pdf_bytes(site_name, period_label, df_mat):
+    pdf = MaterialPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 12)
+    pdf.cell(0, 10, _pdf_safe(f"Site: {site_name}"), 0, 1, 'L')
+    pdf.cell(0, 10, _pdf_safe(f"Period: {period_label}"), 0, 1, 'L')
+    pdf.ln(5)
+    total_grand = 0
+    categories = ["Civil Material", "Steel Material", "Soil Material", "RMC"]
+    for cat in categories:
+        df_cat = df_mat[df_mat["category"] == cat]
+        if not df_cat.empty:
+            pdf.set_fill_color(220, 220, 220)
+            pdf.set_font("Arial", 'B', 12)
+            pdf.cell(0, 10, f"{cat}", 0, 1, 'L', fill=True)
+            pdf.set_font("Arial", 'B', 9)
+            pdf.cell(25, 8, "Date", 1)
+            pdf.cell(50, 8, "Vendor", 1)
+            pdf.cell(80, 8, "Material", 1)
+            pdf.cell(15, 8, "Qty", 1)
+            pdf.cell(20, 8, "Amount", 1)
+            pdf.ln()
+            pdf.set_font("Arial", '', 9)
+            cat_total = 0
+            for _, row in df_cat.iterrows():
+                pdf.cell(25, 8, _pdf_safe(row.get('date', '')), 1)
+                vendor = _pdf_safe(str(row.get('vendor', ''))[:22])
+                material = _pdf_safe(str(row.get('material_name', ''))[:40])
+                pdf.cell(50, 8, vendor, 1)
+                pdf.cell(80, 8, material, 1)
+                pdf.cell(15, 8, _pdf_safe(row.get('quantity', '')), 1)
+                amt = float(row.get('amount', 0))
+                cat_total += amt
+                pdf.cell(20, 8, f"{amt:,.0f}", 1)
+                pdf.ln()
+            pdf.set_font("Arial", 'B', 9)
+            pdf.cell(170, 8, f"Total {cat}", 1, 0, 'R')
+            pdf.cell(20, 8, f"{cat_total:,.0f}", 1, 1, 'L')
+            pdf.ln(8)
+            total_grand += cat_total
+    if total_grand > 0:
+        pdf.set_font("Arial", 'B', 14)
+        pdf.cell(0, 10, f"Grand Total: Rs. {total_grand:,.2f}", 0, 1, 'R')
+    return pdf.output(dest='S').encode('latin-1')
+
+# --- PDF ENGINE FOR CLIENT INVOICES ---
+class ClientInvoicePDF(FPDF):
+    def header(self):
+        self.set_font('Arial', 'B', 22)
+        self.set_text_color(44, 62, 80)
+        self.cell(0, 15, 'WEEKLY EXPENSE REPORT', 0, 1, 'C')
+        self.ln(5)
+    def footer(self):
+        self.set_y(-15)
+        self.set_font('Arial', 'I', 8)
+        self.set_text_color(150, 150, 150)
+        self.cell(0, 10, f'Page {self.page_no()}', 0, 0, 'C')
+
+def generate_client_invoice_bytes(site_name, date_range_label, labor_details, df_mats, grand_total):
+    pdf = ClientInvoicePDF()
+    pdf.add_page()
+    pdf.set_font("Arial", 'B', 12)
+    pdf.set_text_color(44, 62, 80)
+    pdf.cell(100, 8, _pdf_safe(f"Project Site: {site_name}"), 0, 0, 'L')
+    pdf.set_font("Arial", '', 11)
+    pdf.cell(90, 8, f"Date Generated: {date.today().strftime('%d %b %Y')}", 0, 1, 'R')
+    pdf.cell(100, 8, f"Billing Period: {date_range_label}", 0, 1, 'L')
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_fill_color(52, 73, 94)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(0, 10, " 1. LABOR EXPENSES", 0, 1, 'L', fill=True)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_font("Arial", 'B', 11)
+    pdf.set_fill_color(236, 240, 241)
+    pdf.cell(50, 10, "Labor Type", 1, 0, 'C', fill=True)
+    pdf.cell(45, 10, "Total Shifts", 1, 0, 'C', fill=True)
+    pdf.cell(45, 10, "Rate (Rs)", 1, 0, 'C', fill=True)
+    pdf.cell(50, 10, "Amount (Rs)", 1, 1, 'C', fill=True)
+    pdf.set_font("Arial", '', 11)
+    if labor_details['m_count'] > 0:
+        pdf.cell(50, 10, " Masons", 1, 0, 'L')
+        pdf.cell(45, 10, f"{labor_details['m_count']}", 1, 0, 'C')
+        pdf.cell(45, 10, f"{labor_details['m_rate']:,.2f}", 1, 0, 'C')
+        pdf.cell(50, 10, f"{(labor_details['m_count'] * labor_details['m_rate']):,.2f}", 1, 1, 'R')
+    if labor_details['h_count'] > 0:
+        pdf.cell(50, 10, " Helpers", 1, 0, 'L')
+        pdf.cell(45, 10, f"{labor_details['h_count']}", 1, 0, 'C')
+        pdf.cell(45, 10, f"{labor_details['h_rate']:,.2f}", 1, 0, 'C')
+        pdf.cell(50, 10, f"{(labor_details['h_count'] * labor_details['h_rate']):,.2f}", 1, 1, 'R')
+    if labor_details['l_count'] > 0:
+        pdf.cell(50, 10, " Ladies", 1, 0, 'L')
+        pdf.cell(45, 10, f"{labor_details['l_count']}", 1, 0, 'C')
+        pdf.cell(45, 10, f"{labor_details['l_rate']:,.2f}", 1, 0, 'C')
+        pdf.cell(50, 10, f"{(labor_details['l_count'] * labor_details['l_rate']):,.2f}", 1, 1, 'R')
+    if labor_details['m_count'] == 0 and labor_details['h_count'] == 0 and labor_details['l_count'] == 0:
+        pdf.cell(190, 10, "No labor entered for this period.", 1, 1, 'C')
+    pdf.set_font("Arial", 'B', 11)
+    pdf.cell(140, 10, "Total Labor Cost:", 1, 0, 'R', fill=True)
+    pdf.cell(50, 10, f"Rs. {labor_details['total']:,.2f}", 1, 1, 'R', fill=True)
+    pdf.ln(10)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.set_fill_color(52, 73, 94)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(0, 10, " 2. MATERIAL EXPENSES", 0, 1, 'L', fill=True)
+    pdf.set_font("Arial", 'B', 11)
+    pdf.set_text_color(0, 0, 0)
+    pdf.set_fill_color(236, 240, 241)
+    pdf.cell(30, 10, "Date", 1, 0, 'C', fill=True)
+    pdf.cell(110, 10, "Material Description", 1, 0, 'C', fill=True)
+    pdf.cell(50, 10, "Amount", 1, 1, 'C', fill=True)
+    pdf.set_font("Arial", '', 11)
+    mat_total = 0
+    if not df_mats.empty:
+        for _, r in df_mats.iterrows():
+            desc = str(r.get("Description", "")).strip()
+            if not desc: continue
+            m_date = str(r.get("Date", "")).strip()
+            try: amt = float(r.get("Amount (Rs)", 0))
+            except: amt = 0.0
+            mat_total += amt
+            pdf.cell(30, 10, _pdf_safe(m_date[:12]), 1, 0, 'C')
+            pdf.cell(110, 10, _pdf_safe(f" {desc[:55]}"), 1, 0, 'L')
+            pdf.cell(50, 10, f"{amt:,.2f}", 1, 1, 'R')
+    else:
+        pdf.cell(190, 10, "No materials entered for this period.", 1, 1, 'C')
+    pdf.set_font("Arial", 'B', 11)
+    pdf.cell(140, 10, "Total Material Cost:", 1, 0, 'R', fill=True)
+    pdf.cell(50, 10, f"Rs. {mat_total:,.2f}", 1, 1, 'R', fill=True)
+    pdf.ln(15)
+    pdf.set_font("Arial", 'B', 16)
+    pdf.set_fill_color(46, 204, 113)
+    pdf.set_text_color(255, 255, 255)
+    pdf.cell(140, 15, " GRAND TOTAL DUE:", 1, 0, 'R', fill=True)
+    pdf.cell(50, 15, f"Rs. {grand_total:,.2f}", 1, 1, 'R', fill=True)
+    return pdf.output(dest='S').encode('latin-1')
+
+
+# --- WEEKLY BILL HELPERS ---
+def _safe_get_rates(df_contractors, contractor_name, week_start_obj):
+    """Safely fetch mason/helper/ladies rates for a contractor on a given week.
+    Returns (rm, rh, rl) as floats, defaulting to 0 on any error."""
+    try:
+        rates = df_contractors[df_contractors["name"] == contractor_name].copy()
+        if rates.empty:
+            return 0.0, 0.0, 0.0
+        # Drop rows where effective_date is NaT / None
+        rates = rates.dropna(subset=["effective_date"])
+        if rates.empty:
+            return 0.0, 0.0, 0.0
+        rates = rates.sort_values("effective_date", ascending=False)
+        # Only compare dates to dates (both must be datetime.date)
+        valid = rates[rates["effective_date"].apply(
+            lambda d: d <= week_start_obj if isinstance(d, type(week_start_obj)) else False
+        )]
+        row = valid.iloc[0] if not valid.empty else rates.iloc[0]
+        return float(row["rate_mason"]), float(row["rate_helper"]), float(row["rate_ladies"])
+    except Exception:
+        return 0.0, 0.0, 0.0
+
+
+def _build_week_rows(df_sub, full_week_dates, rm, rh, rl):
+    """Build the 7-day row list and totals for one contractor+site block."""
+    # Build entry_map: date → record. Guard against NaT in date_dt.
+    entry_map = {}
+    for _, row in df_sub.iterrows():
+        dt_val = row.get("date_dt")
+        if pd.notna(dt_val):
+            try:
+                entry_map[dt_val.date()] = row
+            except Exception:
+                pass
+
+    rows = []
+    tm, th, tl, tamt = 0.0, 0.0, 0.0, 0.0
+    for day_date in full_week_dates:
+        if day_date in entry_map:
+            r = entry_map[day_date]
+            m = float(r.get("count_mason", 0) or 0)
+            h = float(r.get("count_helper", 0) or 0)
+            l = float(r.get("count_ladies", 0) or 0)
+            daily_cost = (m * rm) + (h * rh) + (l * rl)
+            if m == 0 and h == 0 and l == 0:
+                dm, dh, dl = "Nil", "Nil", "Nil"
+            else:
+                dm = str(int(m) if m == int(m) else m)
+                dh = str(int(h) if h == int(h) else h)
+                dl = str(int(l) if l == int(l) else l)
+        else:
+            m, h, l, daily_cost = 0.0, 0.0, 0.0, 0.0
+            dm, dh, dl = "-", "-", "-"
+        rows.append({"Date": day_date.strftime("%d-%m-%Y"), "Mason": dm, "Helper": dh, "Ladies": dl})
+        tm += m; th += h; tl += l; tamt += daily_cost
+
+    return rows, tm, th, tl, tamt
+
+
+def _add_week_keys(df_entries):
+    """Add an integer `week_key` column (see billing_calendar) to an entries
+    frame that already has a parsed `date_dt`, in place. Returns the distinct
+    weeks as {label: key}, newest first, for the week selector."""
+    df_entries["week_key"] = week_keys(df_entries["date_dt"])
+    return week_options(df_entries["week_key"])
+
+
+# --- EVIDENCE UPLOADS ---
+# A row saved before its photo/receipt has finished uploading carries
+# "pending:<token>" in photo_url / receipt_url until the background upload
+# replaces it with the real URL.
+PENDING_UPLOAD_PREFIX = "pending:"
+
+
+def is_pending_upload(url):
+    return isinstance(url, str) and url.startswith(PENDING_UPLOAD_PREFIX)
+
+
+def evidence_badge(url):
+    """Table cell text for a photo_url / receipt_url value."""
+    if is_pending_upload(url):
+        return "⏳ Uploading"
+    return "📸 Yes" if url else "—"
+
+
+def evidence_path(url, bucket):
+    """Object path inside `bucket` for one of its public URLs (Supabase's
+    .../object/public/<bucket>/<path> or the offline local://<bucket>/<path>),
+    or None for empty, pending or foreign URLs."""
+    if not isinstance(url, str) or is_pending_upload(url):
+        return None
+    for marker in (f"/object/public/{bucket}/", f"local://{bucket}/"):
+        _, sep, path = url.partition(marker)
+        path = path.split("?")[0]
+        if sep and path:
+            return path
+    return None
+
+
+def thumbnail_path(path, ext="jpg"):
+    """Where the gallery thumbnail of evidence object `path` is stored."""
+    return f"thumbs/{path.rsplit('/', 1)[-1].rsplit('.', 1)[0]}.{ext}"
+
+
+# --- SEARCH HELPERS ---
+def _prepare_search_columns(df_all):
+    """Parse dates and add the lower-cased / formatted columns the sidebar
+    search matches against. Rows with unparseable dates are dropped. Returns
+    a new frame; `date_dt` is reused when the caller already parsed it."""
+    if "date_dt" in df_all.columns:
+        df_all = df_all.copy(deep=False)
+    else:
+        df_all = df_all.assign(date_dt=pd.to_datetime(df_all["date"], errors="coerce"))
+    df_all = df_all.dropna(subset=["date_dt"])
+    df_all["date_fmt"] = df_all["date_dt"].dt.strftime("%d-%m-%Y")           # 15-05-2025
+    df_all["month_str"] = df_all["date_dt"].dt.strftime("%B %Y").str.lower() # may 2025
+    df_all["site_lower"] = df_all["site"].str.lower()
+    df_all["con_lower"]  = df_all["contractor"].str.lower()
+    return df_all
+
+
+def _search_mask(df_all, q_lower):
+    """Boolean mask of rows whose site, contractor, date or month matches."""
+    return (
+        df_all["site_lower"].str.contains(q_lower, na=False) |
+        df_all["con_lower"].str.contains(q_lower, na=False) |
+        df_all["date_fmt"].str.contains(q_lower, na=False) |
+        df_all["month_str"].str.contains(q_lower, na=False) |
+        df_all["date_dt"].dt.year.astype(str).str.contains(q_lower, na=False)
+    )
+
+
+# --- ENTRIES FRAME ---
+# Columns every page needs. work_description / photo_url are the bulk of an
+# entry's payload and only the search results and exports show them, so they
+# are fetched separately, on demand (see ENTRY_DETAIL_COLUMNS).
+ENTRY_CORE_COLUMNS = ["id", "date", "site", "contractor",
+                      "count_mason", "count_helper", "count_ladies", "total_cost"]
+ENTRY_DETAIL_COLUMNS = ["work_description", "photo_url"]
+
+
+def compact_entries(records):
+    """Turn raw entry rows (list of dicts or a DataFrame) into the compact frame
+    the pages share: categorical `site`/`contractor`/`date`, a `date_dt`
+    datetime64 column parsed once, float32 shift counts and float64
+    `total_cost`. Rows whose date can't be parsed are dropped, the same as the
+    pages used to do after their own to_datetime calls.
+
+    The result is shared between reruns and sessions, so treat it as
+    read-only: filter it, or add columns to a `.copy(deep=False)`."""
+    df = pd.DataFrame(records)
+    extra = [c for c in ENTRY_DETAIL_COLUMNS if c in df.columns]
+    df = df.reindex(columns=ENTRY_CORE_COLUMNS + extra)
+
+    df["id"] = pd.to_numeric(df["id"], errors="coerce").astype("int64")
+    for col in ("site", "contractor", "date"):
+        df[col] = df[col].astype("category")
+    # Parse each distinct date string once (a few thousand at most) and map the
+    # result back through the category codes instead of parsing every row. The
+    # trailing NaT is what code -1 (a missing date) picks up.
+    parsed = pd.to_datetime(pd.Series(df["date"].cat.categories, dtype=object), errors="coerce")
+    lookup = np.append(parsed.to_numpy("datetime64[ns]"), np.datetime64("NaT", "ns"))
+    df["date_dt"] = lookup[df["date"].cat.codes.to_numpy()]
+    for col in ("count_mason", "count_helper", "count_ladies"):
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    df["total_cost"] = pd.to_numeric(df["total_cost"], errors="coerce").astype("float64")
+
+    df = df.dropna(subset=["date_dt"])
+    df["date"] = df["date"].cat.remove_unused_categories()
+    return df.reset_index(drop=True)
+
+
+def with_entry_details(df_entries, df_details):
+    """Left-join the on-demand detail columns (by `id`) onto a slice of the
+    shared entries frame. Returns a new frame; the slice is not modified."""
+    details = df_details.drop_duplicates("id").set_index("id").reindex(columns=ENTRY_DETAIL_COLUMNS)
+    out = df_entries.copy(deep=False)
+    for col in ENTRY_DETAIL_COLUMNS:
+        out[col] = details[col].reindex(df_entries["id"].to_numpy()).fillna("").to_numpy()
+    return out
@@ -0,0 +1,71 @@
+# Evidence image preprocessing: orient, downscale, recompress, strip metadata.
+#
+# Phone photos arrive at 4-8 MB, far more than anyone needs to see that a
+# slab was cast or to read a receipt, and field users upload them over
+# mobile data. Before upload each image is turned upright (EXIF
+# orientation), shrunk to its profile's longest side, re-encoded at the
+# profile's quality, and saved without EXIF/GPS metadata. That usually cuts
+# the bytes 10-20x.
+#
+# Pillow is in requirements.txt but still treated as optional: without it
+# AVAILABLE is False and callers upload the original file. Like helpers.py, nothing here may touch Streamlit.
+import io
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = ImageOps = None
+
+AVAILABLE = Image is not None
+
+PROFILES = {
+    # Site photos (entries) only need to show the work: small and fairly lossy.
+    "photo": {"max_side": 1600, "quality": 70, "format": "JPEG"},
+    # Receipts (materials) must stay legible, so more pixels, higher quality.
+    "receipt": {"max_side": 2200, "quality": 82, "format": "JPEG"},
+    # Gallery thumbnails: a few KB each, so a page of them loads instantly.
+    "thumb": {"max_side": 320, "quality": 60, "format": "JPEG"},
+}
+_FORMATS = {"JPEG": ("jpg", "image/jpeg"), "WEBP": ("webp", "image/webp")}
+
+
+def profiles(overrides=None):
+    """PROFILES with flat `<profile>_<field>` overrides applied, e.g.
+    {"photo_max_side": 1280, "receipt_format": "WEBP"} from secrets.toml."""
+    merged = {name: dict(p) for name, p in PROFILES.items()}
+    for key, value in (overrides or {}).items():
+        name, _, field = key.partition("_")
+        if name in merged and field in merged[name]:
+            merged[name][field] = value.upper() if field == "format" else int(value)
+    return merged
+
+
+def extension(profile):
+    return _FORMATS[profile["format"]][0]
+
+
+def prepare(data, profile):
+    """Re-encode image bytes for `profile`. Returns (bytes, extension,
+    content_type). Raises if Pillow is missing or `data` isn't an image."""
+    if not AVAILABLE:
+        raise RuntimeError("Pillow is not installed")
+    max_side, fmt = profile["max_side"], profile["format"]
+    ext, content_type = _FORMATS[fmt]
+    img = Image.open(io.BytesIO(data))
+    # For JPEGs, let the decoder downscale by 1/2..1/8 while decoding; much
+    # faster and lighter than decoding all 12+ megapixels first.
+    img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode not in ("RGB", "L"):
+        # Transparent PNG / WEBP: flatten onto white, JPEG has no alpha.
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, "white")
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    img.thumbnail((max_side, max_side), Image.LANCZOS)
+    out = io.BytesIO()
+    # No exif= argument, so EXIF (GPS, device, timestamps) is not written.
+    if fmt == "JPEG":
+        img.save(out, format="JPEG", quality=profile["quality"], optimize=True, progressive=True)
+    else:
+        img.save(out, format=fmt, quality=profile["quality"], method=4)
+    return out.getvalue(), ext, content_type
@@ -0,0 +1,85 @@
+# Small in-process job runner for heavy reports (PDFs, exports).
+#
+# A Streamlit rerun that builds a big PDF inline freezes that session until
+# it's done, and the bytes then have to be parked in session_state so the
+# download survives the next rerun. Instead, pages submit the work here: a
+# bounded thread pool runs it, and the job's status, progress and result live
+# in this shared store under a job id. The page only keeps the id, polls
+# get(job_id) on each rerun and shows the download once the job is done.
+#
+# Jobs run outside any script run, so job functions must not call st.*.
+# Like helpers.py, this module doesn't import Streamlit at all.
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+ACTIVE = ("queued", "running")
+
+
+class JobRunner:
+    """Runs `fn(progress)` callables on `max_workers` threads. Keeps the last
+    `keep` finished jobs (results included); older ones are dropped."""
+
+    def __init__(self, max_workers=2, keep=50):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="labourpro-job")
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self.keep = keep
+
+    def submit(self, fn, label="", meta=None):
+        """Queue `fn`, which is called as fn(progress) where
+        progress(done, total=1, message=None) updates the job's progress.
+        Returns the job id."""
+        job_id = uuid.uuid4().hex[:12]
+        with self._lock:
+            self._jobs[job_id] = {
+                "id": job_id, "label": label, "meta": dict(meta or {}), "status": "queued",
+                "progress": 0.0, "message": "", "result": None, "error": None,
+                "created": time.time(), "started": None, "finished": None,
+            }
+            self._evict()
+        self._pool.submit(self._run, job_id, fn)
+        return job_id
+
+    def get(self, job_id):
+        """A snapshot of the job, or None if it is unknown or was evicted."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(j) for j in self._jobs.values()]
+
+    def discard(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    # ── internals ──────────────────────────────────────────────────────────────
+    def _update(self, job_id, **fields):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn):
+        self._update(job_id, status="running", started=time.time())
+
+        def progress(done, total=1, message=None):
+            fields = {"progress": min(1.0, done / total) if total else 1.0}
+            if message is not None:
+                fields["message"] = message
+            self._update(job_id, **fields)
+
+        try:
+            result = fn(progress)
+        except Exception as e:
+            self._update(job_id, status="failed", error=f"{type(e).__name__}: {e}", finished=time.time())
+        else:
+            self._update(job_id, status="done", progress=1.0, result=result, finished=time.time())
+
+    def _evict(self):
+        finished = sorted((j for j in self._jobs.values() if j["status"] not in ACTIVE),
+                          key=lambda j: j["created"])
+        for job in finished[:max(0, len(finished) - self.keep)]:
+            del self._jobs[job["id"]]
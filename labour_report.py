@@ -0,0 +1,169 @@
+# Long-range Custom Labour Report engine.
+#
+# The weekly bill prices a whole week at one rate, which is fine for seven
+# days. A quarter- or year-long statement isn't: contractors get new rates
+# part-way through, and expanding every day of the range for every group
+# into Python row dicts up front gets slow and big. Here each entry is
+# priced at the rate in force on its own date (one vectorized as-of join
+# against the rate timeline), and the day grids for the PDF / preview and the
+# exports are produced a month at a time, so nothing ever holds the whole range
+# as rows. Like helpers.py, nothing here may touch Streamlit or the database.
+import numpy as np
+import pandas as pd
+from datetime import date, timedelta
+from helpers import generate_pdf_bytes
+
+COUNT_COLUMNS = ["count_mason", "count_helper", "count_ladies"]
+RATE_COLUMNS = ["rate_mason", "rate_helper", "rate_ladies"]
+
+
+def rate_timeline(df_contractors):
+    """Every (contractor, effective date) rate, sorted by date for merge_asof.
+    Rows without a usable effective date are dropped."""
+    if df_contractors.empty:
+        return pd.DataFrame({"contractor": pd.Series(dtype=str), "effective": pd.Series(dtype="datetime64[ns]"),
+                             **{c: pd.Series(dtype="float64") for c in RATE_COLUMNS}})
+    timeline = pd.DataFrame({
+        "contractor": df_contractors["name"].astype(str),
+        "effective": pd.to_datetime(df_contractors["effective_date"], errors="coerce").astype("datetime64[ns]"),
+        **{c: pd.to_numeric(df_contractors[c], errors="coerce").fillna(0.0).astype("float64") for c in RATE_COLUMNS},
+    })
+    return timeline.dropna(subset=["effective"]).sort_values("effective", kind="stable").reset_index(drop=True)
+
+
+def price_entries(df_range, timeline):
+    """Attach the rates in force on each entry's date and the day's `amount`.
+
+    Returns a new frame sorted by date, with `effective` (the rate's start
+    date) plus RATE_COLUMNS and `amount`. Days before a contractor's first
+    rate use their newest rate, and contractors with no rates at all price
+    at 0, the same fallbacks as _safe_get_rates."""
+    df = df_range.assign(
+        date_dt=df_range["date_dt"].astype("datetime64[ns]"),
+        contractor=df_range["contractor"].astype(str),
+        site=df_range["site"].astype(str),
+        **{c: df_range[c].astype("float64") for c in COUNT_COLUMNS},
+    ).sort_values("date_dt", kind="stable")
+    priced = pd.merge_asof(df, timeline, left_on="date_dt", right_on="effective",
+                           by="contractor", direction="backward")
+    unpriced = priced["effective"].isna().to_numpy()
+    if unpriced.any():
+        newest = timeline.groupby("contractor", sort=False).last()
+        fallback = newest.reindex(priced.loc[unpriced, "contractor"])
+        for col in ["effective"] + RATE_COLUMNS:
+            priced.loc[unpriced, col] = fallback[col].to_numpy()
+    priced[RATE_COLUMNS] = priced[RATE_COLUMNS].fillna(0.0)
+    priced["amount"] = (priced[COUNT_COLUMNS].to_numpy() * priced[RATE_COLUMNS].to_numpy()).sum(axis=1)
+    return priced.reset_index(drop=True)
+
+
+def group_totals(priced, group_col):
+    """Shift and amount totals per group (contractor or site), sorted by name."""
+    return (priced.groupby(group_col, observed=True, sort=True)[COUNT_COLUMNS + ["amount"]].sum()
+            .reset_index())
+
+
+def rate_periods(priced):
+    """The stretches of the report each contractor's rate was in force:
+    one row per (contractor, rate) with the first and last entry it priced."""
+    periods = (priced.groupby(["contractor", "effective"], observed=True, sort=True, dropna=False)
+               .agg(first=("date_dt", "min"), last=("date_dt", "max"), **{c: (c, "first") for c in RATE_COLUMNS}))
+    return periods.reset_index()
+
+
+def months(start, end):
+    """(first_day, last_day) for each calendar month touching [start, end],
+    clipped to the range."""
+    first = start
+    while first <= end:
+        next_month = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        last = min(end, next_month - timedelta(days=1))
+        yield first, last
+        first = next_month
+
+
+def _month_slice(priced, first, last):
+    # priced is sorted by date_dt, so a month is one contiguous slice.
+    dates = priced["date_dt"].to_numpy()
+    lo, hi = np.searchsorted(dates, [np.datetime64(first, "ns"), np.datetime64(last + timedelta(days=1), "ns")])
+    return priced.iloc[lo:hi]
+
+
+def _fmt_count(x):
+    return str(int(x) if x == int(x) else x)
+
+
+def day_rows(sub, first, last):
+    """Day-by-day rows for one group over [first, last], the same shape as
+    _build_week_rows: '-' for days with no entry, 'Nil' for no-work days."""
+    days = pd.date_range(first, last, freq="D")
+    counts = sub.groupby("date_dt")[COUNT_COLUMNS].sum().reindex(days)
+    missing = counts["count_mason"].isna().to_numpy()
+    values = counts.fillna(0.0).to_numpy()
+    nil = (values == 0).all(axis=1)
+    rows = []
+    for label, is_missing, is_nil, (m, h, l) in zip(days.strftime("%d-%m-%Y"), missing, nil, values):
+        if is_missing:
+            dm = dh = dl = "-"
+        elif is_nil:
+            dm = dh = dl = "Nil"
+        else:
+            dm, dh, dl = _fmt_count(m), _fmt_count(h), _fmt_count(l)
+        rows.append({"Date": label, "Mason": dm, "Helper": dh, "Ladies": dl})
+    return rows
+
+
+def month_block(priced, group_col, group, first, last, name=None):
+    """One billing_data-style block ({name, rows, totals}) for a group and a month."""
+    month = _month_slice(priced, first, last)
+    sub = month[month[group_col] == group]
+    totals = sub[COUNT_COLUMNS + ["amount"]].sum()
+    return {
+        "name": name or group, "rows": day_rows(sub, first, last),
+        "totals": {"m": totals["count_mason"], "h": totals["count_helper"],
+                   "l": totals["count_ladies"], "amt": totals["amount"]},
+    }
+
+
+def month_blocks(priced, group_col, start, end):
+    """Yield a block per (month, group) that has entries, a month at a time,
+    for generate_pdf_bytes. Groups with nothing in a month are skipped."""
+    for first, last in months(start, end):
+        month = _month_slice(priced, first, last)
+        for group in sorted(month[group_col].unique().tolist()):
+            yield month_block(month, group_col, group, first, last,
+                              name=f"{group} - {first.strftime('%b %Y')}")
+
+
+def block_count(priced, group_col):
+    """How many blocks month_blocks() will yield (for progress reporting)."""
+    return int(priced.groupby([priced["date_dt"].dt.to_period("M"), group_col], observed=True).ngroups)
+
+
+def entry_chunks(priced, start, end):
+    """The priced entries, a month at a time, ready for exports.write_csv."""
+    for first, last in months(start, end):
+        month = _month_slice(priced, first, last)
+        if not month.empty:
+            yield month.assign(date=month["date_dt"].dt.strftime("%Y-%m-%d"),
+                               effective=month["effective"].dt.strftime("%Y-%m-%d")).drop(columns=["date_dt"])
+
+
+def grid_chunks(priced, group_col, start, end):
+    """The day-by-day grids as frames, one (month, group) block at a time,
+    each closed by a totals row. `group_col` is kept as a column so
+    exports.write_xlsx can put each group on its own sheet."""
+    for first, last in months(start, end):
+        month = _month_slice(priced, first, last)
+        for group in sorted(month[group_col].unique().tolist()):
+            block = month_block(month, group_col, group, first, last)
+            t = block["totals"]
+            rows = block["rows"] + [{"Date": f"Total {first.strftime('%b %Y')}", "Mason": t["m"],
+                                     "Helper": t["h"], "Ladies": t["l"], "Amount": t["amt"]}]
+            yield pd.DataFrame(rows, columns=["Date", "Mason", "Helper", "Ladies", "Amount"]).assign(**{group_col: group})
+
+
+def pdf_bytes(header_name, period_label, priced, group_col, start, end, progress=None):
+    """The report PDF, rendered block by block from month_blocks()."""
+    return generate_pdf_bytes(header_name, period_label, month_blocks(priced, group_col, start, end),
+                              progress=progress, total=block_count(priced, group_col))
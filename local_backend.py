@@ -0,0 +1,517 @@
+# In-memory stand-in for the Supabase client, for offline runs, load tests and
+# benchmarks. It implements exactly the subset of supabase-py that app.py and
+# backup_script.py use:
+#
+#   client.table(t).select(...).eq/neq/lt/lte/gt/gte/in_(...).order(...)
+#         .limit(n).range(a, b).single().execute()
+#   client.table(t).insert/update/upsert/delete(...)...execute()
+#   client.rpc(fn, params).execute()            (functions in sql/aggregates.sql)
+#   client.storage.from_(bucket).upload/update/download/remove/get_public_url(...)
+#
+# Every execute() can be slowed down (`latency`) or made to fail at random
+# (`error_rate`) to mimic a field user's mobile connection, and every call is
+# counted — rows and JSON bytes in both directions — so a page rerun can be
+# profiled without a network.
+#
+# Selecting it: set LABOURPRO_BACKEND=local in the environment, or add
+#
+#   [backend]
+#   kind = "local"
+#   latency = 0.05        # optional, seconds per call
+#   error_rate = 0.0      # optional, 0..1
+#   data = "backup.json"  # optional, seed from an Archive & Recovery backup
+#
+# to .streamlit/secrets.toml. The matching environment variables are
+# LABOURPRO_LOCAL_LATENCY, LABOURPRO_LOCAL_ERROR_RATE and LABOURPRO_LOCAL_DATA.
+import copy
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+
+class LocalBackendError(Exception):
+    """Raised for requests the real API would reject."""
+
+
+class LocalNetworkError(LocalBackendError, ConnectionError):
+    """Raised for injected failures: stands in for a timeout / dropped connection."""
+
+
+# SQLite copies of the RPC functions in sql/aggregates.sql: same names,
+# parameters and result columns. Keep the two in step.
+_RPC_SQL = {
+    "labour_totals": """
+        SELECT site, COUNT(*) AS entries,
+               COALESCE(SUM(count_mason), 0) AS count_mason, COALESCE(SUM(count_helper), 0) AS count_helper,
+               COALESCE(SUM(count_ladies), 0) AS count_ladies, COALESCE(SUM(total_cost), 0) AS total_cost
+        FROM entries
+        WHERE date(date) BETWEEN :p_start AND :p_end AND (:p_site IS NULL OR site = :p_site)
+        GROUP BY site ORDER BY site""",
+    "material_totals": """
+        SELECT site, category, COALESCE(SUM(amount), 0) AS amount
+        FROM materials
+        WHERE date(date) BETWEEN :p_start AND :p_end AND (:p_site IS NULL OR site = :p_site)
+        GROUP BY site, category ORDER BY site, category""",
+    # strftime('%w') is 0 on Sunday, so (w + 1) % 7 is days since Saturday.
+    "entry_weeks": """
+        SELECT DISTINCT date(date, '-' || ((CAST(strftime('%w', date) AS INTEGER) + 1) % 7) || ' days') AS week_start
+        FROM entries
+        WHERE date(date) IS NOT NULL
+          AND (:p_sites IS NULL OR site IN (SELECT value FROM json_each(:p_sites)))
+        ORDER BY week_start DESC""",
+}
+# Columns mirrored into SQLite for the functions above.
+_RPC_TABLES = {
+    "entries": ["site", "date", "count_mason", "count_helper", "count_ladies", "total_cost"],
+    "materials": ["site", "date", "category", "amount"],
+}
+
+
+class _Response:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+def _json_size(obj):
+    return len(json.dumps(obj, default=str))
+
+
+def _coerce(stored, wanted):
+    """Compare like PostgREST does for our columns: filter values arrive as
+    strings or numbers, stored values may be either."""
+    if stored is None or wanted is None:
+        return stored, wanted
+    if isinstance(stored, (int, float)) and not isinstance(stored, bool) and isinstance(wanted, str):
+        try:
+            return stored, type(stored)(wanted)
+        except ValueError:
+            return str(stored), wanted
+    if isinstance(stored, str) and isinstance(wanted, (int, float)) and not isinstance(wanted, bool):
+        return stored, str(wanted)
+    return stored, wanted
+
+
+def _cmp(op):
+    def check(row, col, value):
+        a, b = _coerce(row.get(col), value)
+        if op == "eq":
+            return a == b
+        if op == "neq":
+            return a != b
+        if a is None or b is None:
+            return False
+        try:
+            return {"lt": a < b, "lte": a <= b, "gt": a > b, "gte": a >= b}[op]
+        except TypeError:
+            return False
+    return check
+
+
+class _Query:
+    """One chained request. Mirrors postgrest's builder: filters and modifiers
+    accumulate, nothing happens until execute()."""
+
+    def __init__(self, client, table):
+        self._client = client
+        self._table = table
+        self._op = "select"
+        self._columns = "*"
+        self._count = None
+        self._payload = None
+        self._on_conflict = None
+        self._filters = []
+        self._order = []
+        self._limit = None
+        self._range = None
+        self._single = False
+
+    # ── operations ─────────────────────────────────────────────────────────────
+    def select(self, columns="*", count=None):
+        self._op, self._columns, self._count = "select", columns, count
+        return self
+
+    def insert(self, rows):
+        self._op, self._payload = "insert", rows
+        return self
+
+    def update(self, values):
+        self._op, self._payload = "update", values
+        return self
+
+    def upsert(self, rows, on_conflict=None):
+        self._op, self._payload, self._on_conflict = "upsert", rows, on_conflict
+        return self
+
+    def delete(self):
+        self._op = "delete"
+        return self
+
+    # ── filters ────────────────────────────────────────────────────────────────
+    def _filter(self, op, column, value):
+        self._filters.append((op, column, value, _cmp(op)))
+        return self
+
+    def eq(self, column, value): return self._filter("eq", column, value)
+    def neq(self, column, value): return self._filter("neq", column, value)
+    def lt(self, column, value): return self._filter("lt", column, value)
+    def lte(self, column, value): return self._filter("lte", column, value)
+    def gt(self, column, value): return self._filter("gt", column, value)
+    def gte(self, column, value): return self._filter("gte", column, value)
+
+    def in_(self, column, values):
+        wanted = list(values)
+        self._filters.append(("in", column, wanted,
+                              lambda row, col, vals: any(_cmp("eq")(row, col, v) for v in vals)))
+        return self
+
+    # ── modifiers ──────────────────────────────────────────────────────────────
+    def order(self, column, desc=False):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def range(self, start, end):
+        self._range = (start, end)
+        return self
+
+    def single(self):
+        self._single = True
+        return self
+
+    def execute(self):
+        return self._client._execute(self)
+
+    # ── helpers used by the client ─────────────────────────────────────────────
+    def _matches(self, row):
+        return all(check(row, col, val) for _, col, val, check in self._filters)
+
+    def _project(self, row):
+        if self._columns in ("*", None, ""):
+            return dict(row)
+        cols = [c.strip() for c in self._columns.split(",")]
+        return {c: row.get(c) for c in cols}
+
+
+class _Rpc:
+    """client.rpc(fn, params) — runs the SQLite copy of a database function."""
+
+    def __init__(self, client, fn, params):
+        self._client = client
+        self._fn = fn
+        self._params = dict(params or {})
+
+    def execute(self):
+        return self._client._execute_rpc(self)
+
+
+class _Bucket:
+    def __init__(self, client, name):
+        self._client = client
+        self._name = name
+
+    def upload(self, file, path, file_options=None):
+        return self._client._storage_write(self._name, path, file, file_options, overwrite=False)
+
+    def update(self, file, path, file_options=None):
+        return self._client._storage_write(self._name, path, file, file_options, overwrite=True)
+
+    def download(self, path):
+        return self._client._storage_read(self._name, path)
+
+    def remove(self, paths):
+        return self._client._storage_remove(self._name, paths)
+
+    def list(self, path=None, options=None):
+        return self._client._storage_list(self._name, path, options)
+
+    def get_public_url(self, path):
+        return f"local://{self._name}/{path}"
+
+
+class _Storage:
+    def __init__(self, client):
+        self._client = client
+
+    def from_(self, bucket):
+        return _Bucket(self._client, bucket)
+
+
+class LocalClient:
+    """Drop-in replacement for the object returned by supabase.create_client."""
+
+    def __init__(self, tables=None, latency=0.0, error_rate=0.0, seed=None):
+        self.latency = float(latency or 0.0)
+        self.error_rate = float(error_rate or 0.0)
+        self._rng = random.Random(seed)
+        self._lock = threading.RLock()
+        self._tables = {}
+        self._next_id = {}
+        self._objects = {}
+        self._version = 0           # bumped on every write; keys the SQLite mirror
+        self._sql, self._sql_version = None, None
+        self.storage = _Storage(self)
+        self.reset_stats()
+        if tables:
+            self.load_tables(tables)
+
+    # ── seeding ────────────────────────────────────────────────────────────────
+    def load_tables(self, tables):
+        """Replace table contents. Accepts lists of dicts or DataFrames."""
+        with self._lock:
+            for name, rows in tables.items():
+                if hasattr(rows, "to_dict"):
+                    rows = rows.to_dict("records")
+                rows = [dict(r) for r in rows]
+                self._tables[name] = rows
+                ids = [r["id"] for r in rows if isinstance(r.get("id"), int)]
+                self._next_id[name] = (max(ids) if ids else 0) + 1
+            self._version += 1
+
+    @classmethod
+    def from_backup(cls, path, **kwargs):
+        """Seed from a JSON file in the Archive & Recovery / backup_script format."""
+        with open(path) as fh:
+            return cls(tables=json.load(fh), **kwargs)
+
+    def dump_tables(self):
+        with self._lock:
+            return copy.deepcopy(self._tables)
+
+    # ── stats ──────────────────────────────────────────────────────────────────
+    def reset_stats(self):
+        self.stats = {"calls": 0, "rows_out": 0, "rows_in": 0, "bytes_out": 0, "bytes_in": 0,
+                      "errors": 0, "by_call": {}}
+
+    def snapshot_stats(self):
+        with self._lock:
+            return copy.deepcopy(self.stats)
+
+    def _count(self, table, op, rows_out=0, rows_in=0, bytes_out=0, bytes_in=0):
+        s = self.stats
+        s["calls"] += 1
+        s["rows_out"] += rows_out
+        s["rows_in"] += rows_in
+        s["bytes_out"] += bytes_out
+        s["bytes_in"] += bytes_in
+        key = f"{table}.{op}"
+        s["by_call"][key] = s["by_call"].get(key, 0) + 1
+
+    def _network(self, table, op):
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._rng.random() < self.error_rate:
+            with self._lock:
+                self._count(table, op)
+                self.stats["errors"] += 1
+            raise LocalNetworkError(f"Injected failure on {table}.{op}")
+
+    # ── table API ──────────────────────────────────────────────────────────────
+    def table(self, name):
+        return _Query(self, name)
+
+    def _execute(self, q):
+        self._network(q._table, q._op)
+        with self._lock:
+            rows = self._tables.setdefault(q._table, [])
+            handler = getattr(self, f"_do_{q._op}")
+            data, count = handler(q, rows)
+            if q._op != "select":
+                self._version += 1
+            bytes_in = _json_size(q._payload) if q._payload is not None else 0
+            payload_rows = q._payload if isinstance(q._payload, list) else ([q._payload] if q._payload else [])
+            self._count(q._table, q._op,
+                        rows_out=len(data) if isinstance(data, list) else 1,
+                        rows_in=len(payload_rows), bytes_out=_json_size(data), bytes_in=bytes_in)
+            return _Response(data, count)
+
+    def _do_select(self, q, rows):
+        hits = [r for r in rows if q._matches(r)]
+        for col, desc in reversed(q._order):
+            hits.sort(key=lambda r: (r.get(col) is None, r.get(col)), reverse=desc)
+        count = len(hits) if q._count else None
+        if q._range:
+            hits = hits[q._range[0]:q._range[1] + 1]
+        if q._limit is not None:
+            hits = hits[:q._limit]
+        data = [q._project(r) for r in hits]
+        if q._single:
+            if len(data) != 1:
+                raise LocalBackendError(f"JSON object requested, multiple (or no) rows returned ({len(data)})")
+            data = data[0]
+        return data, count
+
+    def _new_row(self, table, row):
+        row = dict(row)
+        if row.get("id") is None:
+            row["id"] = self._next_id.get(table, 1)
+        if isinstance(row["id"], int):
+            self._next_id[table] = max(self._next_id.get(table, 1), row["id"] + 1)
+        return row
+
+    def _do_insert(self, q, rows):
+        payload = q._payload if isinstance(q._payload, list) else [q._payload]
+        added = [self._new_row(q._table, r) for r in payload]
+        rows.extend(added)
+        return [dict(r) for r in added], None
+
+    def _do_upsert(self, q, rows):
+        payload = q._payload if isinstance(q._payload, list) else [q._payload]
+        keys = [k.strip() for k in (q._on_conflict or "id").split(",")]
+        index = {tuple(r.get(k) for k in keys): r for r in rows}
+        out = []
+        for new in payload:
+            key = tuple(new.get(k) for k in keys)
+            if None not in key and key in index:
+                index[key].update(new)
+                out.append(dict(index[key]))
+            else:
+                added = self._new_row(q._table, new)
+                rows.append(added)
+                index[tuple(added.get(k) for k in keys)] = added
+                out.append(dict(added))
+        return out, None
+
+    def _do_update(self, q, rows):
+        if not q._filters:
+            raise LocalBackendError("UPDATE requires a WHERE clause")
+        out = []
+        for r in rows:
+            if q._matches(r):
+                r.update(q._payload)
+                out.append(dict(r))
+        return out, None
+
+    def _do_delete(self, q, rows):
+        if not q._filters:
+            raise LocalBackendError("DELETE requires a WHERE clause")
+        gone = [r for r in rows if q._matches(r)]
+        rows[:] = [r for r in rows if not q._matches(r)]
+        return [dict(r) for r in gone], None
+
+    # ── rpc API ────────────────────────────────────────────────────────────────
+    def rpc(self, fn, params=None):
+        return _Rpc(self, fn, params)
+
+    def _sqlite(self):
+        """An in-memory SQLite copy of the tables the RPC functions read,
+        rebuilt only after a write."""
+        if self._sql is None or self._sql_version != self._version:
+            conn = sqlite3.connect(":memory:", check_same_thread=False)
+            for table, cols in _RPC_TABLES.items():
+                conn.execute(f"CREATE TABLE {table} ({', '.join(cols)})")
+                conn.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(cols))})",
+                                 ([r.get(c) for c in cols] for r in self._tables.get(table, [])))
+            self._sql, self._sql_version = conn, self._version
+        return self._sql
+
+    def _execute_rpc(self, call):
+        self._network(call._fn, "rpc")
+        with self._lock:
+            if call._fn not in _RPC_SQL:
+                self._count(call._fn, "rpc")
+                self.stats["errors"] += 1
+                raise LocalBackendError(f"PGRST202: Could not find the function public.{call._fn}")
+            # SQLite has no arrays: list parameters go in as JSON (see json_each).
+            params = {k: json.dumps(v) if isinstance(v, (list, tuple)) else v
+                      for k, v in (call._params or {}).items()}
+            cur = self._sqlite().execute(_RPC_SQL[call._fn], params)
+            cols = [d[0] for d in cur.description]
+            data = [dict(zip(cols, row)) for row in cur.fetchall()]
+            self._count(call._fn, "rpc", rows_out=len(data), bytes_out=_json_size(data),
+                        bytes_in=_json_size(call._params))
+            return _Response(data)
+
+    # ── storage API ────────────────────────────────────────────────────────────
+    def _storage_write(self, bucket, path, file, file_options, overwrite):
+        self._network(f"storage:{bucket}", "update" if overwrite else "upload")
+        with self._lock:
+            objects = self._objects.setdefault(bucket, {})
+            if path in objects and not overwrite:
+                self._count(f"storage:{bucket}", "upload")
+                self.stats["errors"] += 1
+                raise LocalBackendError("The resource already exists")
+            data = file if isinstance(file, bytes) else bytes(file)
+            objects[path] = {"data": data, "options": dict(file_options or {})}
+            self._count(f"storage:{bucket}", "update" if overwrite else "upload",
+                        rows_in=1, bytes_in=len(data))
+            return {"path": path}
+
+    def _storage_read(self, bucket, path):
+        self._network(f"storage:{bucket}", "download")
+        with self._lock:
+            obj = self._objects.get(bucket, {}).get(path)
+            if obj is None:
+                raise LocalBackendError(f"Object not found: {bucket}/{path}")
+            self._count(f"storage:{bucket}", "download", rows_out=1, bytes_out=len(obj["data"]))
+            return obj["data"]
+
+    def _storage_remove(self, bucket, paths):
+        self._network(f"storage:{bucket}", "remove")
+        with self._lock:
+            objects = self._objects.get(bucket, {})
+            gone = [{"name": p} for p in paths if objects.pop(p, None) is not None]
+            self._count(f"storage:{bucket}", "remove")
+            return gone
+
+    def _storage_list(self, bucket, path=None, options=None):
+        # options: the "search" (name prefix) and "limit" keys storage3 accepts
+        self._network(f"storage:{bucket}", "list")
+        options = options or {}
+        with self._lock:
+            prefix = f"{path.rstrip('/')}/" if path else ""
+            names = [{"name": p[len(prefix):]} for p in sorted(self._objects.get(bucket, {}))
+                     if p.startswith(prefix) and p[len(prefix):].startswith(options.get("search", ""))]
+            names = names[:options.get("limit", 100)]
+            self._count(f"storage:{bucket}", "list", rows_out=len(names))
+            return names
+
+
+# ── selection ──────────────────────────────────────────────────────────────────
+# A process-wide client so every Streamlit session (and the benchmark harness,
+# which runs app.py in-process) sees the same tables.
+_shared = None
+
+
+def set_shared_client(client):
+    global _shared
+    _shared = client
+
+
+def _backend_config(secrets=None):
+    cfg = {}
+    try:
+        if secrets is not None and "backend" in secrets:
+            cfg = dict(secrets["backend"])
+    except Exception:
+        cfg = {}
+    env = {
+        "kind": os.environ.get("LABOURPRO_BACKEND"),
+        "latency": os.environ.get("LABOURPRO_LOCAL_LATENCY"),
+        "error_rate": os.environ.get("LABOURPRO_LOCAL_ERROR_RATE"),
+        "data": os.environ.get("LABOURPRO_LOCAL_DATA"),
+    }
+    cfg.update({k: v for k, v in env.items() if v})
+    return cfg
+
+
+def is_selected(secrets=None):
+    """True when the environment or secrets ask for the local backend."""
+    return str(_backend_config(secrets).get("kind", "")).lower() == "local"
+
+
+def create_client(url=None, key=None, secrets=None):
+    """Same call shape as supabase.create_client; url/key are ignored. Returns
+    the shared client, building it from the config on first use."""
+    global _shared
+    if _shared is None:
+        cfg = _backend_config(secrets)
+        kwargs = {"latency": cfg.get("latency") or 0.0, "error_rate": cfg.get("error_rate") or 0.0}
+        _shared = LocalClient.from_backup(cfg["data"], **kwargs) if cfg.get("data") else LocalClient(**kwargs)
+    return _shared
@@ -0,0 +1,440 @@
+# Lightweight per-rerun span tracing.
+#
+# app.py attaches a Recorder (kept in st.session_state, so it is per session)
+# at the top of every rerun and wraps the hot paths — fetch_data pages, date
+# parsing, the bill loops, FPDF — in `with perf.span("name"):`. Finished
+# reruns go into a bounded ring buffer that the admin Performance tab reads.
+#
+# When tracing is off nothing is attached and span() hands back one shared
+# no-op context manager, so an untraced rerun pays for a thread-local lookup
+# per span and nothing else.
+#
+# TracedClient does the same for backend round-trips: while a rerun is being
+# traced every table().…execute() is logged with its filters, rows, payload
+# size, duration and calling line, which is what find_query_issues() uses to
+# spot duplicate queries and per-item query loops.
+#
+# Memory profiling is a separate opt-in on top of tracing: it turns on
+# tracemalloc and adds peak / retained allocation, the top allocating lines
+# and the size of st.session_state to each rerun's trace. tracemalloc is
+# process-wide, so with several sessions rerunning at once the numbers
+# include their allocations too.
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+import weakref
+from collections import deque
+from datetime import datetime
+
+HISTORY_SIZE = 200
+
+_local = threading.local()
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **meta):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("_trace", "name", "meta", "_t0")
+
+    def __init__(self, trace, name, meta):
+        self._trace, self.name, self.meta = trace, name, meta
+
+    def __enter__(self):
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        t1 = time.perf_counter()
+        self._trace["spans"].append({
+            "name": self.name,
+            "start_ms": (self._t0 - self._trace["_t0"]) * 1000,
+            "ms": (t1 - self._t0) * 1000,
+            **self.meta,
+        })
+        return False
+
+    def set(self, **meta):
+        """Attach extra fields (row counts, page counts...) to the span."""
+        self.meta.update(meta)
+
+
+class Recorder:
+    """Per-session trace store: the rerun in progress plus a ring buffer of
+    finished ones."""
+
+    def __init__(self, maxlen=HISTORY_SIZE):
+        self.history = deque(maxlen=maxlen)
+        self.current = None
+
+    def start(self, tab, memory=False):
+        # A rerun cut short by st.stop() / st.rerun() never reaches finish();
+        # close it here with what it managed to record.
+        self._close(complete=False)
+        self.current = {
+            "tab": tab, "started": datetime.now().isoformat(timespec="seconds"),
+            "_t0": time.perf_counter(), "spans": [], "queries": [],
+        }
+        if memory:
+            start_memory(self)
+            tracemalloc.reset_peak()
+            self.current["_mem0"] = tracemalloc.get_traced_memory()[0]
+            self.current["_snap0"] = tracemalloc.take_snapshot()
+        _local.recorder = self
+
+    def finish(self, state=None, session_label=None):
+        trace = self.current
+        if trace is not None and "_snap0" in trace:
+            trace["memory"] = _memory_report(trace, state, session_label)
+        self._close(complete=True)
+
+    def _close(self, complete):
+        trace, self.current = self.current, None
+        if trace is None:
+            return
+        t0 = trace.pop("_t0")
+        snap0 = trace.pop("_snap0", None)
+        mem0 = trace.pop("_mem0", None)
+        if snap0 is not None and "memory" not in trace and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            trace["memory"] = {"start_kb": mem0 / 1024, "end_kb": current / 1024,
+                               "peak_kb": peak / 1024, "top": [], "session_state": []}
+        if complete:
+            total = (time.perf_counter() - t0) * 1000
+        else:
+            total = max((s["start_ms"] + s["ms"] for s in trace["spans"]), default=0.0)
+        trace.update(total_ms=total, complete=complete)
+        self.history.append(trace)
+
+    def clear(self):
+        self.history.clear()
+
+
+def attach(recorder, tab, memory=False):
+    """Start tracing a rerun of `tab` into `recorder` on this thread, with
+    tracemalloc profiling if `memory` is set."""
+    recorder.start(tab, memory=memory)
+
+
+def detach():
+    """Turn tracing off for the rest of this rerun."""
+    _local.recorder = None
+
+
+def finish(state=None, session_label=None):
+    """Close the rerun in progress, if this thread is tracing one. `state`
+    (st.session_state) is only measured when memory profiling is on."""
+    rec = getattr(_local, "recorder", None)
+    if rec is not None:
+        rec.finish(state, session_label)
+        _local.recorder = None
+
+
+def span(name, **meta):
+    rec = getattr(_local, "recorder", None)
+    if rec is None or rec.current is None:
+        return _NOOP
+    return _Span(rec.current, name, meta)
+
+
+# ── memory profiling ───────────────────────────────────────────────────────────
+# One frame is all a per-line report needs; deeper tracebacks multiply the
+# cost of every allocation while profiling is on.
+MEMORY_FRAMES = 1
+MEMORY_TOP = 15
+_SESSION_LIMIT = 100
+_sessions = {}
+_sessions_lock = threading.Lock()
+_IGNORED = (tracemalloc.__file__, __file__, "<frozen importlib._bootstrap>",
+            "<frozen importlib._bootstrap_external>", "<unknown>")
+
+
+# Recorders (one per session) currently profiling memory. Weak, so a session
+# that ends without switching profiling off doesn't keep tracemalloc on.
+_memory_users = weakref.WeakSet()
+_memory_owned = False
+_memory_lock = threading.Lock()
+
+
+def start_memory(recorder):
+    """Count `recorder` as profiling memory, turning tracemalloc on if needed."""
+    global _memory_owned
+    with _memory_lock:
+        _memory_users.add(recorder)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(MEMORY_FRAMES)
+            _memory_owned = True
+
+
+def stop_memory(recorder):
+    """`recorder` no longer profiles memory. tracemalloc is turned off (which
+    drops its bookkeeping overhead) only if we turned it on and no other
+    session still uses it."""
+    global _memory_owned
+    with _memory_lock:
+        if recorder is not None:
+            _memory_users.discard(recorder)
+        if _memory_owned and not _memory_users and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            _memory_owned = False
+
+
+def deep_size(obj, _seen=None, _depth=0):
+    """Approximate bytes held by `obj`. DataFrames/Series report their own
+    deep memory_usage; containers and plain objects are walked a few levels."""
+    seen = _seen if _seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    usage = getattr(obj, "memory_usage", None)
+    if callable(usage) and hasattr(obj, "dtypes"):
+        try:
+            total = usage(deep=True)
+            return int(total.sum() if hasattr(total, "sum") else total)
+        except Exception:
+            pass
+    size = sys.getsizeof(obj, 0)
+    if _depth > 6 or isinstance(obj, (str, bytes, bytearray, int, float, bool)):
+        return size
+    if isinstance(obj, dict):
+        size += sum(deep_size(k, seen, _depth + 1) + deep_size(v, seen, _depth + 1) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_size(v, seen, _depth + 1) for v in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_size(vars(obj), seen, _depth + 1)
+    return size
+
+
+def state_sizes(state):
+    """Per-key size of a session_state mapping, largest first."""
+    rows = []
+    for key in list(state.keys()):
+        try:
+            value = state[key]
+        except Exception:
+            continue
+        rows.append({"key": str(key), "type": type(value).__name__, "kb": deep_size(value) / 1024})
+    return sorted(rows, key=lambda r: r["kb"], reverse=True)
+
+
+def _memory_report(trace, state, session_label):
+    current, peak = tracemalloc.get_traced_memory()
+    # compare_to() groups by line first, so dropping our own bookkeeping lines
+    # afterwards is far cheaper than Snapshot.filter_traces() on every trace.
+    diff = tracemalloc.take_snapshot().compare_to(trace["_snap0"], "lineno")
+    diff = [d for d in diff if d.size_diff > 0 and d.traceback[0].filename not in _IGNORED]
+    top = [{
+        "site": f"{os.path.basename(stat.traceback[0].filename)}:{stat.traceback[0].lineno}",
+        "path": stat.traceback[0].filename,
+        "kb": stat.size_diff / 1024, "blocks": stat.count_diff,
+    } for stat in sorted(diff, key=lambda d: d.size_diff, reverse=True)[:MEMORY_TOP]]
+    report = {"start_kb": trace["_mem0"] / 1024, "end_kb": current / 1024, "peak_kb": peak / 1024,
+              "top": top, "session_state": []}
+    if state is not None:
+        report["session_state"] = state_sizes(state)
+        if session_label is not None:
+            _note_session(session_label, trace["tab"], report["session_state"])
+    return report
+
+
+def _note_session(label, tab, sizes):
+    with _sessions_lock:
+        _sessions[label] = {"session": label, "tab": tab, "updated": datetime.now().isoformat(timespec="seconds"),
+                            "state_kb": sum(r["kb"] for r in sizes),
+                            "largest_key": sizes[0]["key"] if sizes else ""}
+        if len(_sessions) > _SESSION_LIMIT:
+            oldest = sorted(_sessions.values(), key=lambda r: r["updated"])[:len(_sessions) - _SESSION_LIMIT]
+            for r in oldest:
+                _sessions.pop(r["session"], None)
+
+
+def session_memory():
+    """Latest session_state size of every session profiled in this process."""
+    with _sessions_lock:
+        return sorted(_sessions.values(), key=lambda r: r["state_kb"], reverse=True)
+
+
+# ── backend call instrumentation ───────────────────────────────────────────────
+_OPS = ("select", "insert", "update", "upsert", "delete")
+_PAGING = ("range", "limit")
+
+
+# Query wrappers whose frames are skipped when attributing a call to app code.
+_WRAPPER_FILES = {__file__, os.path.join(os.path.dirname(__file__), "aggregates.py")}
+
+
+def _caller():
+    """file:line of the first frame outside this module and the query wrappers
+    (the app code that built the query)."""
+    f = sys._getframe(2)
+    while f is not None and f.f_code.co_filename in _WRAPPER_FILES:
+        f = f.f_back
+    return f"{os.path.basename(f.f_code.co_filename)}:{f.f_lineno}" if f else "?"
+
+
+def _fmt(value):
+    text = repr(value)
+    return text if len(text) <= 60 else text[:57] + "..."
+
+
+class _TracedQuery:
+    """Proxy over a postgrest request builder that remembers the chain of
+    calls and logs the request when execute() runs."""
+
+    def __init__(self, query, trace, table, chain=()):
+        self._q, self._trace, self._table = query, trace, table
+        self._chain = list(chain)
+
+    def __getattr__(self, attr):
+        target = getattr(self._q, attr)
+        if not callable(target):
+            return target
+
+        def call(*args, **kwargs):
+            self._q = target(*args, **kwargs)
+            self._chain.append((attr, args, kwargs))
+            return self
+        return call
+
+    def execute(self):
+        t0 = time.perf_counter()
+        resp = self._q.execute()
+        ms = (time.perf_counter() - t0) * 1000
+        data = getattr(resp, "data", None)
+        op = next((name for name, _, _ in self._chain if name in _OPS or name == "rpc"), "select")
+        # rpc(params) counts as a filter, so calls with different params differ
+        filters = [f"{name}({', '.join(_fmt(a) for a in args)})"
+                   for name, args, _ in self._chain if name not in _OPS]
+        exact = [f"{name}({', '.join(repr(a) for a in args)})"
+                 for name, args, _ in self._chain if name not in _OPS]
+        payload = next((args[0] for name, args, _ in self._chain if name in _OPS[1:4] and args), None)
+        self._trace["queries"].append({
+            "table": self._table, "op": op, "filters": filters,
+            # Same signature = same request; same shape = same request with
+            # different values (e.g. one lookup per contractor in a loop).
+            "signature": f"{self._table}.{op} " + " ".join(exact),
+            "shape": f"{self._table}.{op} " + " ".join(
+                name for name, _, _ in self._chain if name not in _OPS),
+            "paged": any(name in _PAGING for name, _, _ in self._chain),
+            "rows": len(data) if isinstance(data, list) else (1 if data else 0),
+            "bytes_out": len(json.dumps(data, default=str)) if data is not None else 0,
+            "bytes_in": len(json.dumps(payload, default=str)) if payload is not None else 0,
+            "ms": ms, "start_ms": (t0 - self._trace["_t0"]) * 1000, "caller": _caller(),
+        })
+        return resp
+
+
+class TracedClient:
+    """Wraps a Supabase (or local_backend) client. Untraced reruns get the
+    real builders straight back, so the wrapper costs nothing when off."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def table(self, name):
+        rec = getattr(_local, "recorder", None)
+        if rec is None or rec.current is None:
+            return self._client.table(name)
+        return _TracedQuery(self._client.table(name), rec.current, name)
+
+    def rpc(self, fn, params=None):
+        rec = getattr(_local, "recorder", None)
+        if rec is None or rec.current is None:
+            return self._client.rpc(fn, params or {})
+        return _TracedQuery(self._client.rpc(fn, params or {}), rec.current, fn, [("rpc", (params,), {})])
+
+    def __getattr__(self, attr):
+        return getattr(self._client, attr)
+
+
+def find_query_issues(trace, loop_threshold=3):
+    """Flag wasted round-trips in one rerun.
+
+    - duplicate: the exact same request sent more than once.
+    - loop: the same query shape sent from the same line with different
+      values `loop_threshold`+ times — a per-item (N+1) lookup that could be
+      one `in_` query. Paged reads (range/limit) are reported as `paged`
+      instead, since walking pages is expected for large tables.
+    """
+    issues = []
+    by_sig = {}
+    for q in trace.get("queries", []):
+        by_sig.setdefault(q["signature"], []).append(q)
+    for sig, qs in by_sig.items():
+        if len(qs) > 1:
+            issues.append({"kind": "duplicate", "query": sig if len(sig) <= 200 else sig[:197] + "...", "count": len(qs),
+                           "callers": sorted({q["caller"] for q in qs}),
+                           "wasted_ms": sum(q["ms"] for q in qs[1:]),
+                           "wasted_rows": sum(q["rows"] for q in qs[1:])})
+    by_shape = {}
+    for q in trace.get("queries", []):
+        by_shape.setdefault((q["shape"], q["caller"]), []).append(q)
+    for (shape, caller), qs in by_shape.items():
+        distinct = {q["signature"] for q in qs}
+        if len(distinct) >= loop_threshold:
+            issues.append({"kind": "paged" if all(q["paged"] for q in qs) else "loop",
+                           "query": shape, "count": len(qs), "callers": [caller],
+                           "wasted_ms": sum(q["ms"] for q in qs[1:]),
+                           "wasted_rows": 0})
+    return sorted(issues, key=lambda i: i["wasted_ms"], reverse=True)
+
+
+# ── reporting helpers for the Performance tab ──────────────────────────────────
+def _percentile(values, pct):
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = max(0, min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize_tabs(history):
+    """p50 / p95 / max rerun time per tab, slowest p95 first, with the average
+    backend calls, rows and KB per rerun. Reruns cut short
+    by st.rerun()/st.stop() are left out so they don't drag the numbers down."""
+    by_tab = {}
+    for t in history:
+        if not t["complete"]:
+            continue
+        by_tab.setdefault(t["tab"], []).append(t)
+    rows = []
+    for tab, traces in by_tab.items():
+        v = [t["total_ms"] for t in traces]
+        queries = [t.get("queries", []) for t in traces]
+        rows.append({
+            "tab": tab, "reruns": len(v), "p50_ms": _percentile(v, 50), "p95_ms": _percentile(v, 95),
+            "max_ms": max(v), "mean_ms": statistics.fmean(v),
+            "calls": statistics.fmean(len(q) for q in queries),
+            "rows": statistics.fmean(sum(x["rows"] for x in q) for q in queries),
+            "kb": statistics.fmean(sum(x["bytes_out"] + x["bytes_in"] for x in q) for q in queries) / 1024,
+        })
+    return sorted(rows, key=lambda r: r["p95_ms"], reverse=True)
+
+
+def span_breakdown(trace):
+    """Total time and call count per span name for one rerun, largest first."""
+    agg = {}
+    for s in trace["spans"]:
+        a = agg.setdefault(s["name"], {"span": s["name"], "calls": 0, "ms": 0.0})
+        a["calls"] += 1
+        a["ms"] += s["ms"]
+    total = trace.get("total_ms") or 1.0
+    rows = sorted(agg.values(), key=lambda a: a["ms"], reverse=True)
+    for a in rows:
+        a["share"] = a["ms"] / total
+    return rows
@@ -0,0 +1,53 @@
+-- Server-side totals for the Dashboard and Client Invoice pages, and the
+-- week list for Weekly Bill.
+--
+-- Run once in the Supabase SQL editor (safe to re-run). The app calls these
+-- through PostgREST RPC (see aggregates.py), so a page only ever receives one
+-- row per site (or per site and category) instead of every entry/material in
+-- the date range. local_backend.py carries a SQLite copy of the same queries
+-- for offline runs and benchmarks — keep the two in step.
+
+create or replace function labour_totals(p_start date, p_end date, p_site text default null)
+returns table (
+    site text, entries bigint,
+    count_mason numeric, count_helper numeric, count_ladies numeric, total_cost numeric
+)
+language sql stable as $$
+    select e.site, count(*),
+           coalesce(sum(e.count_mason), 0), coalesce(sum(e.count_helper), 0),
+           coalesce(sum(e.count_ladies), 0), coalesce(sum(e.total_cost), 0)
+    from entries e
+    where e.date::date between p_start and p_end
+      and (p_site is null or e.site = p_site)
+    group by e.site
+    order by e.site;
+$$;
+
+create or replace function material_totals(p_start date, p_end date, p_site text default null)
+returns table (site text, category text, amount numeric)
+language sql stable as $$
+    select m.site, m.category, coalesce(sum(m.amount), 0)
+    from materials m
+    where m.date::date between p_start and p_end
+      and (p_site is null or m.site = p_site)
+    group by m.site, m.category
+    order by m.site, m.category;
+$$;
+
+-- Billing weeks (Saturday → Friday) that have entries, as the Saturday that
+-- starts each one, newest first. p_sites limits it to a user's sites; null
+-- means all sites. Weekly Bill builds its week picker from this, so opening
+-- the page doesn't read the date of every entry.
+create or replace function entry_weeks(p_sites text[] default null)
+returns table (week_start date)
+language sql stable as $$
+    select distinct e.date::date - (extract(isodow from e.date::date)::int + 1) % 7
+    from entries e
+    where e.date is not null
+      and (p_sites is null or e.site = any (p_sites))
+    order by 1 desc;
+$$;
+
+-- The totals filter on a date range first.
+create index if not exists entries_date_idx on entries (date);
+create index if not exists materials_date_idx on materials (date);
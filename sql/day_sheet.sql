@@ -0,0 +1,11 @@
+-- Unique key for the Daily Entry "Day Sheet" batched upsert.
+--
+-- Run once in the Supabase SQL editor (safe to re-run). The day sheet saves a
+-- whole site's day in one request with on_conflict=date,site,contractor,
+-- which PostgREST can only do when that combination is unique. The Daily
+-- Entry form already treats it as unique (one entry per contractor, site and
+-- day); if this fails with a duplicate key error, clean up the duplicates it
+-- names first (Site Logs → Delete an Entry by ID) and run it again.
+
+create unique index if not exists entries_date_site_contractor_key
+    on entries (date, site, contractor);
@@ -0,0 +1,14 @@
+-- Idempotency key for saves that are sent again from the offline write queue.
+--
+-- Run once in the Supabase SQL editor (safe to re-run), after day_sheet.sql.
+-- A material bill that couldn't be saved is kept on the device and sent
+-- again later (see write_queue.py). Each one carries the client_key it was
+-- given when the form was submitted, and is upserted on it, so a save whose
+-- first attempt did reach the database isn't stored twice. Entries need no
+-- extra column: they are upserted on (date, site, contractor), the unique
+-- key added by day_sheet.sql.
+
+alter table materials add column if not exists client_key text;
+
+create unique index if not exists materials_client_key_key
+    on materials (client_key);
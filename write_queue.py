@@ -0,0 +1,140 @@
+# Offline-tolerant write queue for field saves.
+#
+# On a poor mobile connection a save to Supabase can time out, and the field
+# supervisor used to be told to "click Save again" and often lost the entry.
+# A save that fails on the network is now kept here instead: held in the
+# session, mirrored to a browser cookie so a reload doesn't lose it, shown as
+# pending, and sent again automatically. All waiting rows go out in one
+# upsert per table, keyed so that sending a row twice can't duplicate it:
+# entries on their natural (date, site, contractor) key, materials on a
+# client_key (sql/write_queue.sql). Once that column exists the Materials
+# form sends the key with its first attempt too, so a save that reached the
+# database before timing out isn't stored again by the sync.
+#
+# Like helpers.py, nothing here may touch Streamlit or the database; the app
+# passes in the function that does the write.
+import json
+import uuid
+from datetime import datetime
+
+from day_sheet import ON_CONFLICT as ENTRY_KEY, is_missing_constraint
+from helpers import is_pending_upload
+
+try:
+    from httpx import TransportError     # timeouts, refused / dropped connections
+except ImportError:
+    TransportError = ConnectionError
+
+# Only these are queued; anything else (a rejected row, a bug) is reported,
+# since sending the same request again would fail the same way.
+NETWORK_ERRORS = (TransportError, ConnectionError, TimeoutError)
+
+# Table -> on_conflict columns. Also the order tables are flushed in.
+KEYS = {"entries": ENTRY_KEY, "materials": "client_key"}
+EVIDENCE_COLUMNS = {"entries": "photo_url", "materials": "receipt_url"}
+COOKIE_BYTES = 3500     # browsers cap a cookie at ~4 KB
+
+
+def new_key():
+    return uuid.uuid4().hex
+
+
+def item(table, rows, label):
+    """One queued save: the rows of a single form submit. Rows of a table
+    keyed on client_key get one here if the first attempt didn't carry it."""
+    rows = [dict(r) for r in rows]
+    if KEYS[table] == "client_key":
+        for row in rows:
+            row["client_key"] = row.get("client_key") or new_key()
+    return {"key": new_key(), "table": table, "rows": rows, "label": label,
+            "queued": datetime.now().isoformat(timespec="seconds")}
+
+
+def merged_rows(items, table):
+    """All queued rows for `table`, one per key (a later save of the same
+    key replaces an earlier one, and PostgREST rejects an upsert that
+    names the same key twice)."""
+    cols = KEYS[table].split(",")
+    rows = {}
+    for it in items:
+        if it["table"] == table:
+            for row in it["rows"]:
+                rows[tuple(row.get(c) for c in cols)] = row
+    return list(rows.values())
+
+
+def _key(row, cols):
+    return tuple(row.get(c) for c in cols)
+
+
+def _without(items, table, keys, cols):
+    """`items` minus the rows of `table` whose key is in `keys` (and any item
+    left with no rows)."""
+    out = []
+    for it in items:
+        if it["table"] == table:
+            it = dict(it, rows=[r for r in it["rows"] if _key(r, cols) not in keys])
+            if not it["rows"]:
+                continue
+        out.append(it)
+    return out
+
+
+def flush(items, write):
+    """Send every queued row with write(table, rows, on_conflict), one call
+    per table and column set. Returns (remaining, written, error): the items
+    still waiting, the rows each table's writes returned, and the last error
+    (None if all went). A failed call only keeps its own rows waiting: rows
+    an earlier call already wrote are in `written` and out of `remaining`,
+    so their photo uploads can start and a retry doesn't send them again."""
+    remaining, written, error = list(items), {}, None
+    for table, on_conflict in KEYS.items():
+        cols = on_conflict.split(",")
+        # PostgREST needs every row of a bulk upsert to have the same columns
+        # (a day sheet row has no photo_url), so one write per column set.
+        shapes = {}
+        for row in merged_rows(remaining, table):
+            shapes.setdefault(tuple(sorted(row)), []).append(row)
+        for rows in shapes.values():
+            try:
+                result = write(table, rows, on_conflict) or []
+            except Exception as e:
+                error = e
+                break
+            written.setdefault(table, []).extend(result)
+            remaining = _without(remaining, table, {_key(r, cols) for r in rows}, cols)
+    return remaining, written, error
+
+
+def is_setup_error(exc):
+    """True when the write can never succeed until the database is set up
+    (missing unique key or client_key column), so retrying is pointless."""
+    text = str(exc)
+    return is_missing_constraint(exc) or "42703" in text or "PGRST204" in text or "client_key" in text
+
+
+def dumps(items, owner):
+    """The queue as a cookie value, or None if it's empty or too big for a
+    cookie (then it only lives in the session). Photos aren't kept."""
+    if not items:
+        return None
+    raw = json.dumps({"owner": owner, "items": items}, separators=(",", ":"), default=str)
+    return raw if len(raw.encode("utf-8")) <= COOKIE_BYTES else None
+
+
+def loads(raw, owner):
+    """Queue items from a cookie written by dumps() for the same user. The
+    photo or receipt files didn't survive the reload, so pending evidence
+    markers are dropped from the rows (an existing link is left untouched)."""
+    try:
+        data = json.loads(raw) if isinstance(raw, str) else raw
+        if not data or data.get("owner") != owner:
+            return []
+        items = list(data["items"])
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return []
+    for it in items:
+        column = EVIDENCE_COLUMNS.get(it.get("table"))
+        it["rows"] = [{k: v for k, v in row.items() if not (k == column and is_pending_upload(v))}
+                      for row in it.get("rows", [])]
+    return [it for it in items if it.get("table") in KEYS and it["rows"]]